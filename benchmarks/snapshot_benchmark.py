@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+    Snapshot benchmark
+    Compares loading a cached 10k-entry folder listing from JSON against the
+    binary snapshot format in plugin.video.seedr/resources/lib/snapshot.py:
+    - time to open the cache and render one page of entries
+    - time to walk every entry
+    - peak Python memory allocated while doing so (tracemalloc)
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugin.video.seedr'))
+from resources.lib import snapshot
+
+ENTRIES = 10000
+FOLDERS = 500
+PAGE_SIZE = 500
+REPEAT = 5
+
+def make_listing():
+    """Synthetic contents response shaped like fs/folder/{id}/contents"""
+    folders = [{'id': 100000 + i, 'path': f'Show.Name.S{i // 20:02d}E{i % 20:02d}.1080p.WEB-DL',
+                'size': 1500000000 + i, 'last_update': '2024-05-01 12:00:00'} for i in range(FOLDERS)]
+    files = []
+    for i in range(ENTRIES - FOLDERS):
+        file_id = 200000 + i
+        files.append({
+            'id': file_id, 'folder_id': 42, 'name': f'Some.Movie.Title.{i}.2160p.BluRay.x265.mkv',
+            'size': 4000000000 + i, 'is_video': i % 3 != 0, 'is_audio': i % 3 == 0,
+            'last_update': '2024-05-01 12:00:00',
+            'presentation_urls': {'image': {
+                size: f'https://thumbs.seedr.cc/{file_id}/{size}.jpg' for size in ('720', '220', '64', '48')
+            }},
+        })
+    return {'parent': 41, 'folders': folders, 'files': files}
+
+def render_page(folders, files):
+    """Touch the fields the listing loop reads for one page"""
+    count = 0
+    for entry in list(folders[:PAGE_SIZE]) + list(files[:max(0, PAGE_SIZE - len(folders))]):
+        count += len(entry.get('name') or entry.get('path') or '') + (entry.get('size') or 0) % 7
+    return count
+
+def walk_all(folders, files):
+    return sum(1 for _ in folders) + sum(1 for _ in files)
+
+def measure(func):
+    """Best wall time over REPEAT runs and the peak traced allocation of one run"""
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def main():
+    listing = make_listing()
+    temp_dir = tempfile.mkdtemp()
+    json_path = os.path.join(temp_dir, 'listing.json')
+    snap_path = os.path.join(temp_dir, 'listing.snap')
+    with open(json_path, 'w') as f:
+        json.dump(listing, f)
+    snapshot.write_snapshot(snap_path, listing, int(time.time()))
+
+    def json_page():
+        with open(json_path) as f:
+            data = json.load(f)
+        render_page(data['folders'], data['files'])
+
+    def json_all():
+        with open(json_path) as f:
+            data = json.load(f)
+        walk_all(data['folders'], data['files'])
+
+    def snap_page():
+        with snapshot.SnapshotReader(snap_path) as reader:
+            render_page(reader.folders, reader.files)
+
+    def snap_all():
+        with snapshot.SnapshotReader(snap_path) as reader:
+            walk_all(reader.folders, reader.files)
+
+    print(f"{ENTRIES} entries, page of {PAGE_SIZE}")
+    print(f"{'':24}{'time (ms)':>12}{'peak (KiB)':>14}")
+    for label, func in (('json: open + page', json_page), ('snapshot: open + page', snap_page),
+                        ('json: open + all', json_all), ('snapshot: open + all', snap_all)):
+        elapsed, peak = measure(func)
+        print(f"{label:24}{elapsed * 1000:12.2f}{peak / 1024:14.1f}")
+    print(f"{'file size (KiB)':24}{'json':>12}{os.path.getsize(json_path) / 1024:14.1f}")
+    print(f"{'':24}{'snapshot':>12}{os.path.getsize(snap_path) / 1024:14.1f}")
+
+    os.remove(json_path)
+    os.remove(snap_path)
+    os.rmdir(temp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -9,27 +9,103 @@ import xbmcvfs
 import json
 import time
 import os.path
+import re
+import sqlite3
+import threading
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 import urllib
 from urllib.parse import urlparse
 from urllib.parse import urlencode
 from urllib.parse import parse_qs
-from urllib.parse import quote
-import struct
+from urllib.request import pathname2url
 import base64
+import hashlib
+
+from resources.lib import entries
+from resources.lib import metrics
+from resources.lib import qr_encoder
+from resources.lib import seedr_client
+from resources.lib import snapshot
+from resources.lib import window_cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# Playback timings are measured from here
+invocation_started = time.time()
 
 class RestartAuthException(Exception):
     """Custom exception to signal authentication restart"""
     pass
 
-API_URL = 'https://v2.seedr.cc'
-BASE_URL = 'https://v2.seedr.cc/api/v0.1/p'
-DEVICE_CODE_URL = 'https://v2.seedr.cc/api/v0.1/p/oauth/device/code'
-AUTHENTICATION_URL = 'https://v2.seedr.cc/api/v0.1/p/oauth/device/verify'
-TOKEN_URL = 'https://v2.seedr.cc/api/v0.1/p/oauth/device/token'
-CLIENT_ID = 'EKp43IJEBXiGjaRg6cd7F17R3z3zv6VL'
-SCOPES = 'files.read profile account.read media.read'
+API_URL = seedr_client.API_URL
+
+# Local search index
+ROOT_FOLDER_ID = 0
+CRAWL_WORKERS = 4
+CRAWL_REQUESTS_PER_SECOND = 8
+SEARCH_RESULT_LIMIT = 200
+LIBRARY_RECENT_LIMIT = 100
+LIBRARY_MAX_AGE = 6 * 3600
+# Seconds a library listing may spend syncing a stale catalog, and how long that sync is
+# claimed so other listings opened meanwhile don't start their own
+LIBRARY_SYNC_BUDGET = 20
+LIBRARY_SYNC_CLAIM = 10 * 60
+LISTING_PAGE_SIZE = 500
+# Levels of Name/Name/... folders skipped at once, and the files a level may hold to be skipped
+DESCEND_MAX_DEPTH = 5
+DESCEND_MAX_FILES = 10
+
+# STRM export to the Kodi library
+STRM_SCAN_MAX_PATHS = 10
+
+# Video playback: containers Kodi plays from the original file with byte-range seeking.
+# Auto mode streams these directly and leaves other containers to the HLS presentation,
+# as well as files so large that their bitrate likely needs the adaptive stream.
+DIRECT_PLAY_TYPES = {
+    '.mkv': 'video/x-matroska',
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.webm': 'video/webm',
+    '.avi': 'video/x-msvideo',
+    '.ts': 'video/mp2t',
+    '.m2ts': 'video/mp2t',
+}
+DIRECT_PLAY_MAX_SIZE = 20 * 1024 ** 3
+
+# Home screen widgets, served from the index only
+WIDGET_LIMIT = 25
+WIDGET_DB_TIMEOUT = 0.5
+WIDGET_CACHE_TTL = 30
+WIDGET_BUDGET = 0.2
+# Seconds a widget invocation may spend syncing a stale catalog; later ones continue the sync
+WIDGET_SYNC_BUDGET = 20
+
+# Cross-invocation cache in home window properties
+SETTINGS_CACHE_TTL = 3600
+# The only settings mirrored into window properties, which any skin or addon can read;
+# the refresh token and login state stay in the settings file
+CACHED_SETTINGS = ('access_token', 'token_expires_at')
+# Settings written to disk as soon as they are saved instead of coalesced
+TOKEN_SETTINGS = frozenset(('access_token', 'refresh_token', 'token_expires_at'))
+LISTING_CACHE_TTL = 60
+LISTING_CACHE_ENTRIES = 20
+LISTING_CACHE_MAX_BYTES = 512 * 1024
+STREAM_URL_CACHE_TTL = 300
+STREAM_URL_CACHE_ENTRIES = 50
+# What playback needs to know about listed files, so item URLs only carry the file id
+FILE_META_CACHE_TTL = 12 * 3600
+FILE_META_CACHE_ENTRIES = 1000
 
 __settings__ = xbmcaddon.Addon(id='plugin.video.seedr')
 __language__ = __settings__.getLocalizedString
@@ -40,271 +116,231 @@ def log(message, level=xbmc.LOGDEBUG):
 def build_url(query):
     return base_url + '?' + urlencode(query)
 
-def fetch_json_dictionary(url, post_params=None, access_token=None):
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': 'Kodi/Seedr Addon',
-        'Accept': 'application/json'
-    }
-    
-    if access_token:
-        headers['Authorization'] = f'Bearer {access_token}'
-    
-    log(f"Making request to: {url}")
-    if post_params is not None:
-        log(f"POST params: {post_params}")
-        r = requests.post(url, data=post_params, headers=headers)
-    else:
-        r = requests.get(url, headers=headers)
-    log(f"API Response: {r.status_code} {r.text}")
-    
-    # Check for HTTP errors
-    if r.status_code >= 400:
-        error_data = r.json()
-        error_msg = error_data.get('reason_phrase', 'Unknown error')
-        log(f"HTTP Error {r.status_code}: {error_msg}", xbmc.LOGERROR)
-        return {'error': error_msg, 'status_code': r.status_code}
-        
-    return r.json()
+CLIENT_LOG_LEVELS = {'debug': xbmc.LOGDEBUG, 'info': xbmc.LOGINFO, 'warning': xbmc.LOGWARNING, 'error': xbmc.LOGERROR}
 
-def get_device_code():
-    log("--------------------------------------------------")
-    log("Step 1: Request Device and User Codes")
-    log("--------------------------------------------------")
-    
-    params = {
-        'client_id': CLIENT_ID,
-        'scope': SCOPES,  # Use the SCOPES constant that includes media.read
-        'response_type': 'device_code'
-    }
-    
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': 'Kodi/Seedr Addon',
-        'Accept': 'application/json'
-    }
-    
-    try:
-        log(f"Making device code request to: {DEVICE_CODE_URL}")
-        log(f"With params: {params}")
-        log(f"With headers: {headers}")
-        
-        response = requests.post(DEVICE_CODE_URL, data=params, headers=headers)
-        
-        log(f"Response status code: {response.status_code}")
-        log(f"Response headers: {dict(response.headers)}")
-        log(f"Response text: {response.text}")
-        
-        if response.status_code != 200:
-            log(f"HTTP Error {response.status_code}: {response.text}", xbmc.LOGERROR)
-            return None
-            
-        response_data = response.json()
-        log(f"Device code response: {response_data}")
-        
-        if 'device_code' not in response_data:
-            log("Error: No device_code in response", xbmc.LOGERROR)
-            return None
-        
-        log(f"Device Code: {response_data['device_code']}")
-        log(f"User Code: {response_data['user_code']}")
-        log(f"Verification URI: {response_data['verification_uri']}")
-        log(f"Expires In: {response_data.get('expires_in', '300')}s")
-        log(f"Interval: {response_data.get('interval', '5')}s")
-        log(f"Scopes: {response_data.get('scope', SCOPES)}")
-        
-        return response_data
-        
-    except requests.exceptions.RequestException as e:
-        log(f"Network error making device code request: {str(e)}", xbmc.LOGERROR)
-        return None
-    except Exception as e:
-        log(f"Error processing device code response: {str(e)}", xbmc.LOGERROR)
-        return None
+def client_log(message, level='debug'):
+    log(message, CLIENT_LOG_LEVELS[level])
 
-def get_token(device_code):
-    log("--------------------------------------------------")
-    log("Step 3: Polling for Token")
-    log("--------------------------------------------------")
-    
-    params = {
-        'device_code': device_code,
-        'client_id': CLIENT_ID
-    }
-    log(f"Making token request with device_code: {device_code[:10]}...")
-    log(f"Token URL: {TOKEN_URL}")
-    log(f"Token params: {params}")
-    
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded',
-        'User-Agent': 'Kodi/Seedr Addon',
-        'Accept': 'application/json'
-    }
-    
+def get_playback_mode():
+    """How videos are streamed: auto, hls or direct"""
     try:
-        response = requests.post(TOKEN_URL, data=params, headers=headers)
-        log(f"Token response status: {response.status_code}")
-        log(f"Token response text: {response.text}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            log(f"Token response data: {result}")
-            return result
-        else:
-            # Handle different error cases
-            try:
-                error_data = response.json()
-                error_msg = error_data.get('error', 'Unknown error')
-                log(f"Token error: {error_msg}", xbmc.LOGERROR)
-                return {'error': error_msg}
-            except:
-                log(f"Token HTTP Error {response.status_code}: {response.text}", xbmc.LOGERROR)
-                return {'error': f'HTTP {response.status_code}'}
-                
-    except requests.exceptions.RequestException as e:
-        log(f"Network error getting token: {str(e)}", xbmc.LOGERROR)
-        return {'error': 'Network error'}
-    except Exception as e:
-        log(f"Error getting token: {str(e)}", xbmc.LOGERROR)
-        return {'error': 'Unknown error'}
+        return ('auto', 'hls', 'direct')[addon.getSettingInt('playback_mode')]
+    except Exception:
+        return 'auto'
 
-def refresh_access_token():
-    log("Attempting to refresh access token")
-    if 'refresh_token' not in settings:
-        log("No refresh token available", xbmc.LOGERROR)
-        return None
-        
-    params = {
-        'grant_type': 'refresh_token',
-        'refresh_token': settings['refresh_token'],
-        'client_id': CLIENT_ID
-    }
-    
+def get_network_timeout():
     try:
-        response = fetch_json_dictionary(API_URL + '/api/v0.1/p/oauth/token', params)
-        if 'access_token' in response:
-            log("Successfully refreshed access token")
-            settings['access_token'] = response['access_token']
-            # Update refresh token if a new one is provided
-            if 'refresh_token' in response:
-                settings['refresh_token'] = response['refresh_token']
-            save_dict(settings, data_file)
-            return response['access_token']
-        else:
-            log(f"Failed to refresh token: {response.get('error', 'Unknown error')}", xbmc.LOGERROR)
-            return None
-    except Exception as e:
-        log(f"Error refreshing token: {str(e)}", xbmc.LOGERROR)
-        return None
+        return max(1, addon.getSettingInt('network_timeout'))
+    except Exception:
+        return 10
 
-def call_api(func, access_token, params=None):
+def get_art_profile():
+    """Device profile for artwork sizes: low, standard or high"""
     try:
-        url = API_URL + func
-        log(f"Making API call to: {url}")
-        if params:
-            log(f"With params: {params}")
-            
-        response = fetch_json_dictionary(url, params, access_token)
-        
-        # Check for HTTP errors
-        if isinstance(response, dict) and 'status_code' in response:
-            if response['status_code'] == 401:
-                log("Token expired or invalid, attempting to refresh", xbmc.LOGWARNING)
-                new_token = refresh_access_token()
-                if new_token:
-                    log("Token refreshed successfully, retrying API call")
-                    return call_api(func, new_token, params)
-                else:
-                    log("Failed to refresh token, clearing stored tokens", xbmc.LOGERROR)
-                    if 'access_token' in settings:
-                        del settings['access_token']
-                    if 'refresh_token' in settings:
-                        del settings['refresh_token']
-                    save_dict(settings, data_file)
-                    return None
-            elif response['status_code'] == 403:
-                if 'Missing required scope' in response.get('error', ''):
-                    log("Missing required scope, attempting to re-authenticate", xbmc.LOGWARNING)
-                    # Clear tokens and force re-authentication
-                    if 'access_token' in settings:
-                        del settings['access_token']
-                    if 'refresh_token' in settings:
-                        del settings['refresh_token']
-                    save_dict(settings, data_file)
-                    return None
-                return None
-            return None
-        
-        # Check for token expiration or invalidity
-        if 'error' in response:
-            if response.get('error') in ['invalid_token', 'expired_token']:
-                log("Token invalid or expired, attempting to refresh", xbmc.LOGWARNING)
-                new_token = refresh_access_token()
-                if new_token:
-                    # Retry the API call with new token
-                    log("Retrying API call with refreshed token")
-                    return call_api(func, new_token, params)
-                else:
-                    log("Failed to refresh token, clearing stored tokens", xbmc.LOGERROR)
-                    if 'access_token' in settings:
-                        del settings['access_token']
-                    if 'refresh_token' in settings:
-                        del settings['refresh_token']
-                    save_dict(settings, data_file)
-                    return None
-            else:
-                log(f"API error: {response.get('error')}", xbmc.LOGERROR)
+        return ('low', 'standard', 'high')[addon.getSettingInt('device_profile')]
+    except Exception:
+        return 'standard'
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Cross-process lock for a file in the profile, held through path + '.lock'"""
+    with open(path + '.lock', 'a+') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            elif msvcrt:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+class SettingsStore(dict):
+    """settings.json backed dict shared by the main flow, dialogs and polling threads.
+
+    Mutations are guarded by an in-process lock and tracked per key. save()
+    schedules a single coalesced write, or writes at once when tokens changed,
+    since losing a rotated refresh token forces a new login. flush() writes under a
+    cross-process lock file, merging the changed keys into what is on disk
+    so concurrent invocations don't drop each other's tokens, then replaces
+    the file atomically through a fsynced temp file.
+
+    With a window cache, the access token and its expiry are kept in memory
+    across invocations. Invocations that only need those don't read the file;
+    any other key loads it on first access."""
+    def __init__(self, filename, delay=0.5, cache=None):
+        super(SettingsStore, self).__init__()
+        self.filename = filename
+        self.delay = delay
+        self.cache = cache
+        self.lock = threading.RLock()
+        self._changed = set()
+        self._timer = None
+        self._loaded = False
+        cached = cache.get('settings', 'tokens') if cache is not None else None
+        if isinstance(cached, dict):
+            dict.update(self, cached)
+            log("Loaded access token from window cache")
+            return
+        self._load()
+
+    def _load(self):
+        """Read the file once, keeping values changed since the store was created"""
+        with self.lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with file_lock(self.filename):
+                    data = self._read()
+                    self._publish(data)
+                for key, value in data.items():
+                    if key not in self._changed:
+                        dict.__setitem__(self, key, value)
+                log(f"Successfully loaded data from {self.filename}")
+            except (IOError, OSError) as e:
+                log(f"Error loading data: {str(e)}", xbmc.LOGERROR)
+
+    def _require(self, key):
+        if not self._loaded and key not in CACHED_SETTINGS:
+            self._load()
+
+    def __getitem__(self, key):
+        self._require(key)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._require(key)
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        self._require(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            dict.__setitem__(self, key, value)
+            self._changed.add(key)
+
+    def __delitem__(self, key):
+        with self.lock:
+            dict.__delitem__(self, key)
+            self._changed.add(key)
+
+    def pop(self, key, *default):
+        with self.lock:
+            self._changed.add(key)
+            return dict.pop(self, key, *default)
+
+    def save(self):
+        """Schedule a write; every change made before it fires shares one disk write"""
+        with self.lock:
+            if self._changed & TOKEN_SETTINGS:
+                self.flush()
+            elif self._timer is None and self._changed:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write pending changes now. Returns the error message if the write failed; the
+        changes stay pending, and the caller decides whether to tell the user."""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._changed:
                 return None
-                
-        return response
-    except Exception as e:
-        log(f"API call error: {str(e)}", xbmc.LOGERROR)
+            changed = self._changed
+            self._changed = set()
+            try:
+                with file_lock(self.filename):
+                    data = self._read()
+                    for key in changed:
+                        # Not `key in self`, which may load the file under the lock held here
+                        if dict.__contains__(self, key):
+                            data[key] = dict.__getitem__(self, key)
+                        else:
+                            data.pop(key, None)
+                    self._write(data)
+                    self._publish(data)
+                log(f"Successfully saved data to {self.filename}")
+            except (IOError, OSError) as e:
+                self._changed |= changed
+                log(f"Error saving data: {str(e)}", xbmc.LOGERROR)
+                return str(e)
         return None
 
-def save_dict(data, filename):
-    try:
-        f = open(filename, 'w')
-        json.dump(data, f)
-        f.close()
-        log(f"Successfully saved data to {filename}")
-    except IOError as e:
-        log(f"Error saving data: {str(e)}", xbmc.LOGERROR)
-        xbmcgui.Dialog().ok(addonname, str(e))
-    return
+    def _publish(self, data):
+        """Mirror the access token and its expiry into the window cache, no longer than the token is valid"""
+        if self.cache is None:
+            return
+        ttl = SETTINGS_CACHE_TTL
+        if data.get('token_expires_at'):
+            ttl = min(ttl, int(data['token_expires_at']) - time.time())
+        tokens = dict((key, data[key]) for key in CACHED_SETTINGS if key in data)
+        self.cache.set('settings', 'tokens', tokens, ttl, max_entries=1)
 
-def load_dict(filename):
-    if os.path.isfile(filename):
+    def _read(self):
+        if not os.path.isfile(self.filename):
+            return {}
         try:
-            f = open(filename, 'r')
-            data = json.load(f)
-            f.close()
-            log(f"Successfully loaded data from {filename}")
-            return data
-        except Exception as e:
+            with open(self.filename, 'r') as f:
+                return json.load(f)
+        except ValueError as e:
             log(f"Error loading data: {str(e)}", xbmc.LOGERROR)
             return {}
-    return {}
+
+    def _write(self, data):
+        temp_file = self.filename + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.filename)
+
+def device_code_is_valid(device_code_dict, margin=30):
+    """True while a device code has at least margin seconds of life left"""
+    expires_at = device_code_dict['issued_at'] + int(device_code_dict.get('expires_in', 300))
+    return time.time() < expires_at - margin
 
 def get_access_token():
     log("Starting authentication process")
+    device_code_dict = None
     
     while True:  # Main loop for retrying the entire process
         log("--------------------------------------------------")
         log("Starting new authentication attempt")
         log("--------------------------------------------------")
         
-        device_code_dict = get_device_code()
-        if not device_code_dict:
-            log("Failed to get device code", xbmc.LOGERROR)
-            if xbmcgui.Dialog().yesno(addonname, "Failed to get device code. Would you like to try again?"):
-                log("User chose to retry device code request")
-                continue
-            log("User cancelled authentication after device code failure")
-            return None
+        if device_code_dict and device_code_is_valid(device_code_dict):
+            log("Reusing device code that is still valid")
+        else:
+            log("Step 1: Request Device and User Codes")
+            device_code_dict = client.request_device_code()
+            if not device_code_dict:
+                log("Failed to get device code", xbmc.LOGERROR)
+                if xbmcgui.Dialog().yesno(addonname, "Failed to get device code. Would you like to try again?"):
+                    log("User chose to retry device code request")
+                    continue
+                log("User cancelled authentication after device code failure")
+                return None
+            device_code_dict['issued_at'] = time.time()
             
         log(f"Successfully got device code: {device_code_dict.get('device_code', '')[:5]}...")
         settings['device_code'] = device_code_dict['device_code']
 
+        # Start token polling the moment the device code exists
+        interval = device_code_dict.get('interval', 5)
+        expires_in = device_code_dict['issued_at'] + int(device_code_dict.get('expires_in', 300)) - time.time()
+        log(f"Starting background token polling for {int(expires_in)}s, {interval}s interval")
+        poller = DeviceCodePoller(settings['device_code'], interval, expires_in)
+        poller.start()
+
         # Construct full verification URL
         verification_url = API_URL + device_code_dict['verification_uri']
         if 'user_code' in device_code_dict:
@@ -316,70 +352,56 @@ def get_access_token():
         log("--------------------------------------------------")
         log(f"Full verification URL: {verification_url}")
         log(f"User Code for verification: {device_code_dict['user_code']}")
-        log("Displaying QR code dialog to user...")
 
-        # Show QR code dialog with integrated polling
-        log("Starting QR code dialog with background polling...")
+        # Render the QR image in parallel; the dialog opens with a placeholder
+        qr_image_path = get_qr_code_path(verification_url, 400)
+        qr_executor = ThreadPoolExecutor(max_workers=1)
+        qr_future = qr_executor.submit(create_qr_code, verification_url, qr_image_path, 400)
+        qr_executor.shutdown(wait=False)
 
-        # Start token polling immediately in background
-        token_dict = None
-        access_token = None
-        refresh_token = None
-        interval = device_code_dict.get('interval', 5)
-        attempts = 0
-        max_attempts = 100
-        
-        log(f"Starting background token polling with {max_attempts} max attempts, {interval}s interval")
-        
-        # Show QR dialog and start polling simultaneously
+        log("Displaying QR code dialog to user...")
         try:
-            show_qr_code_dialog_with_polling(verification_url, device_code_dict['user_code'], settings['device_code'], interval, max_attempts)
+            show_qr_code_dialog_with_polling(verification_url, device_code_dict['user_code'], poller, qr_future, qr_image_path)
         except RestartAuthException:
             # User chose to retry, restart the entire authentication process
             log("User chose to retry, restarting authentication process")
             continue
+        finally:
+            poller.cancel()
+
+        # A declined or expired code can't be polled again
+        if poller.result in ('declined', 'expired'):
+            device_code_dict = None
         
         # Check if user requested retry after dialog closed
         if settings.get('retry_auth', False):
             log("Retry flag detected - restarting authentication process")
             settings['retry_auth'] = False  # Clear the flag
-            save_dict(settings, data_file)
+            settings.save()
             continue
         
+        # A token wins over a cancel that raced with the end of polling
+        if poller.result == 'authorized' and settings.get('access_token'):
+            log("Authentication completed successfully, returning access token")
+            if settings.get('cancel_auth', False):
+                settings['cancel_auth'] = False
+                settings.save()
+            return settings['access_token']
+
         # Check if user cancelled authentication
         if settings.get('cancel_auth', False):
             log("User cancelled authentication - exiting")
             settings['cancel_auth'] = False  # Clear the flag
-            save_dict(settings, data_file)
+            settings.save()
             return None
         
         # Check if we got the token from the dialog
         if 'access_token' in settings and settings['access_token']:
-            access_token = settings['access_token']
-            if 'refresh_token' in settings:
-                refresh_token = settings['refresh_token']
-            log("Authentication completed successfully from QR dialog")
-        else:
-            log("Authentication failed or was cancelled")
-            return None
-
-        if access_token:
-            settings['access_token'] = access_token
-            save_dict(settings, data_file)
             log("Authentication completed successfully, returning access token")
-            return access_token
-            
-        if attempts >= max_attempts:
-            log("Authorization timed out after maximum attempts", xbmc.LOGERROR)
-            if xbmcgui.Dialog().yesno(addonname, "Authorization timed out. Would you like to try again?"):
-                log("User chose to retry after timeout")
-                continue
-            log("User cancelled after timeout")
-            return None
-            
-        # If we get here, user chose to retry after an error
-        log("Restarting authentication process due to user retry")
-        continue
+            return settings['access_token']
+
+        log("Authentication failed or was cancelled")
+        return None
 
 def show_auto_close_notification(heading, message, duration=5):
     dialog = xbmcgui.DialogProgress()
@@ -390,37 +412,172 @@ def show_auto_close_notification(heading, message, duration=5):
         xbmc.sleep(1000)  # Sleep for 1 second
     dialog.close()
 
+def get_qr_code_path(verification_url, size=400):
+    """Cache location of the QR image for a URL and size in special://temp"""
+    digest = hashlib.sha1(f"{verification_url}|{size}".encode('utf-8')).hexdigest()[:16]
+    temp_dir = xbmcvfs.translatePath('special://temp/')
+    return os.path.join(temp_dir, f'seedr_qr_{digest}.png')
+
 def create_qr_code(verification_url, temp_path, size=400):
-    """Create QR code using QR Server API with specific styling"""
+    """Render the QR code locally, reusing a cached image for the same URL and size"""
     try:
+        if os.path.exists(temp_path):
+            log(f"Using cached QR code: {temp_path}")
+            return True
+
         log(f"Creating QR code for: {verification_url}")
-        
-        # Use QR Server API with custom styling for Kodi theme
-        encoded_url = quote(verification_url, safe='')
-        qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size={size}x{size}&data={encoded_url}&format=png&bgcolor=000000&color=FFFFFF&margin=1"
-        
-        log(f"Requesting QR code from: {qr_url}")
-        response = requests.get(qr_url, timeout=10)
-        response.raise_for_status()
-        
-        with open(temp_path, 'wb') as f:
-            f.write(response.content)
-        
-        log(f"QR code saved to: {temp_path}")
+        start = time.time()
+        # Light modules on black to match the Kodi theme
+        qr_encoder.write_png(verification_url, temp_path, size)
+        log(f"QR code saved to: {temp_path} in {(time.time() - start) * 1000:.0f}ms")
         return True
         
     except Exception as e:
         log(f"Error creating QR code: {str(e)}", xbmc.LOGERROR)
         return False
 
+class DeviceCodePoller(object):
+    """Polls the token endpoint for a device code on a background thread.
+
+    The first poll is sent immediately. Waits honour the server's interval,
+    which grows on slow_down, and polling stops once the code's expires_in
+    has passed. Waits block on an Event, so cancel() ends polling at once and
+    a Kodi shutdown ends it within POLL_TICK seconds. on_status receives
+    progress text; on_done receives the final result, one of 'authorized',
+    'declined', 'expired', 'error' or 'cancelled'."""
+    POLL_TICK = 0.1
+    MAX_ERRORS = 5
+
+    def __init__(self, device_code, interval=5, expires_in=300, on_status=None, on_done=None):
+        self.device_code = device_code
+        self.interval = max(1, int(interval))
+        self.deadline = time.time() + int(expires_in)
+        self.on_status = on_status
+        self.on_done = on_done
+        self.result = None
+        self.finished = threading.Event()
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        """Block until polling finished; returns False on timeout"""
+        return self.finished.wait(timeout)
+
+    def _status(self, message):
+        if self.on_status and not self._cancelled.is_set():
+            try:
+                self.on_status(message)
+            except Exception as e:
+                log(f"Error updating polling status: {str(e)}", xbmc.LOGWARNING)
+
+    def _sleep(self, seconds):
+        """Wait between polls; returns False if cancelled or Kodi is exiting"""
+        monitor = xbmc.Monitor()
+        end = time.time() + seconds
+        while not self._cancelled.is_set():
+            if monitor.abortRequested():
+                log("Kodi is exiting, stopping token polling")
+                self.cancel()
+                break
+            remaining = min(end, self.deadline) - time.time()
+            if remaining <= 0:
+                return True
+            self._cancelled.wait(min(remaining, self.POLL_TICK))
+        return False
+
+    def _run(self):
+        attempts = 0
+        errors = 0
+        try:
+            while not self._cancelled.is_set():
+                if time.time() >= self.deadline:
+                    log("Device code expired while polling", xbmc.LOGWARNING)
+                    self.result = 'expired'
+                    break
+
+                attempts += 1
+                log(f"Background polling attempt {attempts}, interval {self.interval}s")
+                token_dict = client.poll_device_token(self.device_code)
+                if self._cancelled.is_set():
+                    break
+
+                error = token_dict.get('error')
+                if not error and token_dict.get('access_token'):
+                    log("Authentication successful in background!")
+                    client.store_tokens(token_dict)
+                    self.result = 'authorized'
+                    self._status("Authentication successful! Closing...")
+                    break
+
+                if error == 'authorization_pending':
+                    remaining = int(self.deadline - time.time())
+                    self._status(f"Waiting for authorization... ({remaining // 60}:{remaining % 60:02d} left)")
+                elif error == 'slow_down':
+                    self.interval += 5
+                    log(f"Server asked to slow down, polling every {self.interval}s", xbmc.LOGWARNING)
+                elif error in ('authorization_declined', 'access_denied'):
+                    log("User declined authorization", xbmc.LOGWARNING)
+                    self.result = 'declined'
+                    self._status("Authorization declined. Please try again.")
+                    break
+                elif error == 'expired_token':
+                    log("Device code expired", xbmc.LOGWARNING)
+                    self.result = 'expired'
+                    self._status("Code expired. Please restart authentication.")
+                    break
+                else:
+                    errors += 1
+                    log(f"Authentication error: {error}", xbmc.LOGERROR)
+                    self._status(f"Error: {error}")
+                    # Tolerate a few transient errors before giving up
+                    if errors >= self.MAX_ERRORS:
+                        self.result = 'error'
+                        break
+
+                if not self._sleep(self.interval):
+                    break
+        finally:
+            if self.result is None:
+                self.result = 'cancelled'
+            log(f"Token polling finished: {self.result}")
+            self.finished.set()
+            if self.on_done:
+                self.on_done(self.result)
+
+def ask_auth_retry(result):
+    """Offer to restart authentication after polling ended without a token"""
+    if result == 'declined':
+        retry_msg = "Authorization was declined.\n\nWould you like to try again with a new QR code?"
+    elif result == 'error':
+        retry_msg = "Authorization failed.\n\nWould you like to try again with a new QR code?"
+    else:
+        retry_msg = "Authorization timed out.\n\nWould you like to try again with a new QR code?"
+    if xbmcgui.Dialog().yesno("Seedr Authentication", retry_msg):
+        log("User chose to retry authentication - restarting process")
+        # Set flags to indicate retry is needed
+        settings['retry_auth'] = True
+        settings['cancel_auth'] = False  # Make sure cancel flag is cleared
+        log("Retry flags set, authentication will restart")
+    else:
+        log("User cancelled retry - exiting authentication")
+        settings['retry_auth'] = False
+        settings['cancel_auth'] = True  # Set flag to indicate user cancelled
+    settings.save()
+
 class QRAuthDialogWithPolling(xbmcgui.WindowDialog):
     """Custom QR code authentication dialog with background token polling"""
-    def __init__(self, qr_image_path, verification_url, user_code, device_code, interval, max_attempts):
+    def __init__(self, verification_url, user_code, poller, qr_future, qr_image_path):
         super(QRAuthDialogWithPolling, self).__init__()
-        self.device_code = device_code
-        self.interval = interval
-        self.max_attempts = max_attempts
-        self.authenticated = False
+        self.poller = poller
+        self.qr_image_path = qr_image_path
         
         # Get screen dimensions
         self.width = 1280
@@ -442,17 +599,17 @@ class QRAuthDialogWithPolling(xbmcgui.WindowDialog):
         # Left side - QR Code
         qr_x = padding
         qr_y = padding + 60
-        qr_image = xbmcgui.ControlImage(qr_x, qr_y, qr_size, qr_size, qr_image_path)
-        self.addControl(qr_image)
+        # Placeholder until the QR image has been rendered in the background
+        self.qr_image = xbmcgui.ControlImage(qr_x, qr_y, qr_size, qr_size, '')
+        self.addControl(self.qr_image)
         
         # QR Code label
-        qr_label = xbmcgui.ControlLabel(qr_x, qr_y + qr_size + 20, qr_size, 30, 
-                                      "Scan this QR code with your mobile device", 'font12', '0xFFFFFFFF', alignment=2)
-        self.addControl(qr_label)
+        self.qr_label = xbmcgui.ControlLabel(qr_x, qr_y + qr_size + 20, qr_size, 30, 
+                                           __language__(32105), 'font12', '0xFFFFFFFF', alignment=2)
+        self.addControl(self.qr_label)
         
         # Right side - Instructions
         text_x = qr_x + qr_size + padding * 2
-        text_y = qr_y
         text_width = self.width - text_x - padding
         
         # Center the text content vertically in the right panel
@@ -499,108 +656,42 @@ class QRAuthDialogWithPolling(xbmcgui.WindowDialog):
         self.cancel_button.setVisible(True)
         self.setFocus(self.cancel_button)
         
-        # Start background polling after a short delay
-        xbmc.sleep(2000)  # Wait 2 seconds before starting polling
-        self.start_polling()
-    
-    def start_polling(self):
-        """Start background token polling"""
-        import threading
-        
-        def poll_for_token():
-            attempts = 0
-            while attempts < self.max_attempts and not self.authenticated:
-                attempts += 1
-                log(f"Background polling attempt {attempts}/{self.max_attempts}")
-                
-                # Update status
-                self.status_label.setLabel(f"Checking authorization... ({attempts}/{self.max_attempts})")
-                
-                token_dict = get_token(self.device_code)
-                
-                if 'error' in token_dict:
-                    if token_dict['error'] == 'authorization_pending':
-                        log(f"Authorization still pending, waiting {self.interval}s...")
-                        self.status_label.setLabel(f"Waiting for authorization... ({attempts}/{self.max_attempts})")
-                        time.sleep(self.interval)
-                    elif token_dict['error'] == 'authorization_declined':
-                        log("User declined authorization", xbmc.LOGWARNING)
-                        self.status_label.setLabel("Authorization declined. Please try again.")
-                        break
-                    elif token_dict['error'] == 'expired_token':
-                        log("Device code expired", xbmc.LOGWARNING)
-                        self.status_label.setLabel("Code expired. Please restart authentication.")
-                        break
-                    else:
-                        log(f"Authentication error: {token_dict['error']}", xbmc.LOGERROR)
-                        self.status_label.setLabel(f"Error: {token_dict['error']}")
-                        # Don't break immediately, continue polling for a few more attempts
-                        if attempts >= 5:  # Only break after 5 attempts with error
-                            break
-                        time.sleep(self.interval)
-                else:
-                    access_token = token_dict.get('access_token')
-                    refresh_token = token_dict.get('refresh_token')
-                    if access_token:
-                        log("Authentication successful in background!")
-                        settings['access_token'] = access_token
-                        if refresh_token:
-                            settings['refresh_token'] = refresh_token
-                        save_dict(settings, data_file)
-                        self.authenticated = True
-                        self.status_label.setLabel("Authentication successful! Closing...")
-                        # Close dialog after short delay
-                        xbmc.sleep(1000)
-                        self.close()
-                        break
-            
-            # If we reach here and not authenticated, show retry option
-            if not self.authenticated:
-                log("Polling completed without authentication")
-                self.status_label.setLabel("Authorization timed out.")
-                xbmc.sleep(2000)  # Wait 2 seconds before showing retry dialog
-                self.show_retry_dialog()
-        
-        # Start polling thread
-        self.poll_thread = threading.Thread(target=poll_for_token)
-        self.poll_thread.daemon = True
-        self.poll_thread.start()
-    
-    def show_retry_dialog(self):
-        """Show retry dialog when polling times out"""
-        self.close()  # Close the QR dialog first
-        
-        # Show retry dialog
-        retry_msg = "Authorization timed out after 100 attempts.\n\nWould you like to try again with a new QR code?"
-        if xbmcgui.Dialog().yesno("Seedr Authentication", retry_msg):
-            log("User chose to retry authentication - restarting process")
-            # Set flags to indicate retry is needed
-            settings['retry_auth'] = True
-            settings['cancel_auth'] = False  # Make sure cancel flag is cleared
-            save_dict(settings, data_file)
-            log("Retry flags set, authentication will restart")
+        # Polling is already running; follow it from here on
+        self.poller.on_status = self.on_poll_status
+        self.poller.on_done = self.on_poll_done
+        qr_future.add_done_callback(self.on_qr_ready)
+
+    def on_qr_ready(self, future):
+        """Swap the placeholder for the QR image, or point to the URL if rendering failed"""
+        if future.result():
+            self.qr_image.setImage(self.qr_image_path, False)
+            self.qr_label.setLabel("Scan this QR code with your mobile device")
         else:
-            log("User cancelled retry - exiting authentication")
-            settings['retry_auth'] = False
+            self.qr_label.setLabel(__language__(32106))
+
+    def on_poll_status(self, message):
+        self.status_label.setLabel(message)
+
+    def on_poll_done(self, result):
+        self.close()
+
+    def cancel(self):
+        """Stop polling and close, recording that the user gave up unless the login already succeeded"""
+        self.poller.cancel()
+        if self.poller.result != 'authorized':
             settings['cancel_auth'] = True  # Set flag to indicate user cancelled
-            save_dict(settings, data_file)
-            # Don't raise exception, just return - this will end authentication
-    
+            settings.save()
+        self.close()
+
     def onControl(self, control):
         if control == self.cancel_button:
             log("User clicked Cancel button - stopping authentication")
-            self.authenticated = False
-            settings['cancel_auth'] = True  # Set flag to indicate user cancelled
-            save_dict(settings, data_file)
-            self.close()
+            self.cancel()
     
     def onAction(self, action):
         if action.getId() in [xbmcgui.ACTION_PREVIOUS_MENU, xbmcgui.ACTION_NAV_BACK]:
             log("User pressed back/escape - stopping authentication")
-            self.authenticated = False
-            settings['cancel_auth'] = True  # Set flag to indicate user cancelled
-            save_dict(settings, data_file)
-            self.close()
+            self.cancel()
 
 class QRAuthDialog(xbmcgui.WindowDialog):
     """Custom QR code authentication dialog with side-by-side layout"""
@@ -694,97 +785,69 @@ class QRAuthDialog(xbmcgui.WindowDialog):
         if action.getId() in [xbmcgui.ACTION_PREVIOUS_MENU, xbmcgui.ACTION_NAV_BACK]:
             self.close()
 
-def show_qr_code_dialog_with_polling(verification_url, user_code, device_code, interval, max_attempts):
-    """Show QR dialog with background token polling"""
+def show_qr_code_dialog_with_polling(verification_url, user_code, poller, qr_future, qr_image_path):
+    """Show QR dialog following an already running poller; the QR image fills in when ready"""
     try:
-        # Create temporary file path for QR image
-        temp_dir = xbmcvfs.translatePath('special://temp/')
-        qr_image_path = os.path.join(temp_dir, 'seedr_qr_code.png')
-        
-        # Generate QR code using QR server
-        qr_image_loaded = create_qr_code(verification_url, qr_image_path, 400)
-        
-        if qr_image_loaded and os.path.exists(qr_image_path):
-            # Show custom dialog with polling
-            dialog = QRAuthDialogWithPolling(qr_image_path, verification_url, user_code, device_code, interval, max_attempts)
-            dialog.doModal()
-            dialog.close()
-            
-        else:
-            # Fallback to text-only dialog with polling
-            log("QR code image failed to load, showing text-only dialog with polling", xbmc.LOGWARNING)
-            show_text_dialog_with_polling(verification_url, user_code, device_code, interval, max_attempts)
-        
-        # Clean up temporary file
-        if os.path.exists(qr_image_path):
+        dialog = QRAuthDialogWithPolling(verification_url, user_code, poller, qr_future, qr_image_path)
+        # on_poll_done can't close a dialog that isn't open yet, so polling that ends
+        # just before doModal() is caught by closing again until doModal() returns
+        modal_done = threading.Event()
+
+        def close_when_finished():
+            poller.wait()
+            while not modal_done.wait(DeviceCodePoller.POLL_TICK):
+                dialog.close()
+
+        if not poller.finished.is_set():
+            closer = threading.Thread(target=close_when_finished)
+            closer.daemon = True
+            closer.start()
             try:
-                os.remove(qr_image_path)
-                log("Cleaned up temporary QR image file")
-            except Exception as e:
-                log(f"Error cleaning up QR image file: {str(e)}", xbmc.LOGWARNING)
-        
+                dialog.doModal()
+            finally:
+                modal_done.set()
+        # However the dialog closed, polling must not outlive it
+        poller.cancel()
+        dialog.close()
+        if poller.result not in ('authorized', 'cancelled'):
+            ask_auth_retry(poller.result)
         return True
         
     except Exception as e:
         log(f"Error showing QR code dialog with polling: {str(e)}", xbmc.LOGERROR)
-        # Ultimate fallback to simple dialog
-        message = f"To use this Addon, Please Authorize Seedr at:\n\n{verification_url}\n\nUser Code: {user_code}"
-        xbmcgui.Dialog().ok(addonname, message)
+        # Fall back to the text dialog with the same device code and poller
+        show_text_dialog_with_polling(verification_url, user_code, poller)
         return False
 
-def show_text_dialog_with_polling(verification_url, user_code, device_code, interval, max_attempts):
-    """Show text-only dialog with background polling"""
+def show_text_dialog_with_polling(verification_url, user_code, poller):
+    """Show text-only progress dialog following an already running poller"""
     try:
-        # Start polling in background
-        import threading
-        
-        def poll_for_token():
-            attempts = 0
-            while attempts < max_attempts:
-                attempts += 1
-                log(f"Background polling attempt {attempts}/{max_attempts}")
-                
-                token_dict = get_token(device_code)
-                
-                if 'error' in token_dict:
-                    if token_dict['error'] == 'authorization_pending':
-                        log(f"Authorization still pending, waiting {interval}s...")
-                        time.sleep(interval)
-                    else:
-                        log(f"Authentication error: {token_dict['error']}", xbmc.LOGERROR)
-                        break
-                else:
-                    access_token = token_dict.get('access_token')
-                    refresh_token = token_dict.get('refresh_token')
-                    if access_token:
-                        log("Authentication successful in background!")
-                        settings['access_token'] = access_token
-                        if refresh_token:
-                            settings['refresh_token'] = refresh_token
-                        save_dict(settings, data_file)
-                        break
-        
-        # Start polling thread
-        poll_thread = threading.Thread(target=poll_for_token)
-        poll_thread.daemon = True
-        poll_thread.start()
-        
-        # Show text dialog
         message_lines = [
-            "Authentication Required",
-            "",
             "Visit this URL manually:",
             verification_url,
-            "",
             f"User Code: {user_code}",
-            "",
-            "The addon will automatically continue once you complete authorization in your browser."
+            "The addon will continue once you complete authorization in your browser."
         ]
-        message = "\n".join(message_lines)
-        xbmcgui.Dialog().ok("Seedr Authentication", message)
-        
-        # Wait for polling to complete
-        poll_thread.join(timeout=30)  # Wait up to 30 seconds
+        dialog = xbmcgui.DialogProgress()
+        dialog.create("Seedr Authentication", "\n".join(message_lines))
+        started = time.time()
+        expires_in = max(poller.deadline - started, 1)
+        try:
+            # Wake up often enough to react to Cancel, and as soon as polling ends
+            while not poller.wait(DeviceCodePoller.POLL_TICK):
+                if dialog.iscanceled():
+                    log("User cancelled text authentication dialog")
+                    poller.cancel()
+                    settings['cancel_auth'] = True
+                    settings.save()
+                    break
+                dialog.update(min(100, int((time.time() - started) * 100 / expires_in)))
+        finally:
+            dialog.close()
+
+        poller.cancel()
+        if poller.wait(1) and poller.result not in ('authorized', 'cancelled'):
+            ask_auth_retry(poller.result)
         
     except Exception as e:
         log(f"Error in text dialog with polling: {str(e)}", xbmc.LOGERROR)
@@ -792,11 +855,10 @@ def show_text_dialog_with_polling(verification_url, user_code, device_code, inte
 def show_qr_code_dialog(verification_url, user_code):
     """Show custom dialog with QR code and instructions side by side"""
     try:
-        # Create temporary file path for QR image
-        temp_dir = xbmcvfs.translatePath('special://temp/')
-        qr_image_path = os.path.join(temp_dir, 'seedr_qr_code.png')
+        # Cached QR image path for this URL
+        qr_image_path = get_qr_code_path(verification_url, 400)
         
-        # Generate QR code using QR server
+        # Generate QR code locally
         qr_image_loaded = create_qr_code(verification_url, qr_image_path, 400)
         
         if qr_image_loaded and os.path.exists(qr_image_path):
@@ -819,14 +881,6 @@ def show_qr_code_dialog(verification_url, user_code):
             message = "\n".join(message_lines)
             xbmcgui.Dialog().ok(__language__(32100), message)
         
-        # Clean up temporary file
-        if os.path.exists(qr_image_path):
-            try:
-                os.remove(qr_image_path)
-                log("Cleaned up temporary QR image file")
-            except Exception as e:
-                log(f"Error cleaning up QR image file: {str(e)}", xbmc.LOGWARNING)
-        
         return True
         
     except Exception as e:
@@ -844,7 +898,19 @@ if not os.path.isdir(__profile__):
     os.makedirs(__profile__)
 
 data_file = xbmcvfs.translatePath(os.path.join(__profile__, 'settings.json'))
-settings = load_dict(data_file)
+index_file = xbmcvfs.translatePath(os.path.join(__profile__, 'index.db'))
+strm_manifest_file = xbmcvfs.translatePath(os.path.join(__profile__, 'strm_manifest.json'))
+snapshot_dir = xbmcvfs.translatePath(os.path.join(__profile__, 'snapshots'))
+if not os.path.isdir(snapshot_dir):
+    os.makedirs(snapshot_dir)
+home_cache = window_cache.WindowCache(xbmcgui.Window(10000))
+settings = SettingsStore(data_file, cache=home_cache)
+metrics_file = xbmcvfs.translatePath(os.path.join(__profile__, 'metrics.json'))
+run_metrics = metrics.Metrics()
+# Metadata of files linked by this invocation, stored in one batch once it finishes
+listed_files = {}
+client = seedr_client.SeedrClient(settings, timeout=get_network_timeout, log=client_log,
+                                  on_request=run_metrics.record_request, on_event=run_metrics.increment)
 
 args = parse_qs(sys.argv[2][1:])
 mode = args.get('mode', None)
@@ -859,560 +925,1093 @@ log(f"Mode: {mode}")
 log(f"Base URL: {base_url}")
 log(f"Addon Handle: {addon_handle}")
 
-def get_best_image_url(image_urls, is_icon=False):
-    """Get the best image URL available.
-    Always prioritize 720 resolution for thumbnails.
-    Fall back to 220 > 64 > 48 in order."""
-    log(f"Getting best image URL from: {image_urls}")
-    
-    # Always prioritize 720 resolution
-    if '720' in image_urls:
-        return image_urls['720']
-    elif '220' in image_urls:
-        return image_urls['220']
-    elif '64' in image_urls:
-        return image_urls['64']
-    elif '48' in image_urls:
-        return image_urls['48']
-    
-    # If no sizes match, return default
-    return 'DefaultPicture.png'
+def open_index():
+    """Open the local index database, creating the schema on first use.
+    Every file and folder in the account is stored in `entries`; when the
+    bundled SQLite supports FTS5, `entries_fts` mirrors the names for
+    full-text search. `listings` tracks the binary snapshot mirroring the
+    contents response of each folder, so the tree can be browsed without
+    the API."""
+    conn = sqlite3.connect(index_file, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            parent_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            is_video INTEGER NOT NULL DEFAULT 0,
+            is_audio INTEGER NOT NULL DEFAULT 0,
+            last_update TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_parent ON entries(parent_id);
+        CREATE TABLE IF NOT EXISTS index_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """)
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(entries)')]
+    if 'last_update' not in columns:
+        # Databases created before the catalog mirror lack this column
+        conn.execute('ALTER TABLE entries ADD COLUMN last_update TEXT')
+    columns = [row['name'] for row in conn.execute('PRAGMA table_info(listings)')]
+    if 'payload' in columns:
+        # JSON mirrors predate snapshots; dropping them makes the next sync refetch
+        conn.execute('DROP TABLE listings')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS listings (
+            folder_id INTEGER PRIMARY KEY,
+            signature TEXT,
+            fetched_at INTEGER NOT NULL
+        )
+    """)
+    try:
+        conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                name, content='entries', content_rowid='key'
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, name) VALUES (new.key, new.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name) VALUES ('delete', old.key, old.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE OF name ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name) VALUES ('delete', old.key, old.name);
+                INSERT INTO entries_fts(rowid, name) VALUES (new.key, new.name);
+            END;
+        """)
+    except sqlite3.OperationalError as e:
+        # Older SQLite builds without FTS5 fall back to LIKE queries
+        log(f"FTS5 not available, search will use LIKE: {str(e)}", xbmc.LOGWARNING)
+    return conn
 
-def handle_playback(mode, args, settings, addon_handle):
-    if mode and mode[0] == 'file':
-        file_id = args['file_id'][0]
-        log(f"Fetching file details with ID: {file_id}", xbmc.LOGINFO)
-        
-        # Get the file details
-        data = call_api(f'/api/v0.1/p/fs/file/{file_id}', settings['access_token'])
+def index_has_fts(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'entries_fts'").fetchone()
+    return row is not None
+
+def get_index_state(conn, key, default=None):
+    row = conn.execute('SELECT value FROM index_state WHERE key = ?', (key,)).fetchone()
+    return row['value'] if row else default
+
+def set_index_state(conn, key, value):
+    conn.execute('INSERT INTO index_state(key, value) VALUES (?, ?) '
+                 'ON CONFLICT(key) DO UPDATE SET value = excluded.value', (key, str(value)))
+
+def entry_key(kind, entry_id):
+    """Files and folders have separate id spaces, so fold the kind into the row key"""
+    return int(entry_id) * 2 + (1 if kind == 'folder' else 0)
+
+def folder_signature(size, last_update):
+    """Change marker for a folder as seen in its parent listing"""
+    return f"{size or 0}:{last_update or ''}"
+
+def index_listing(conn, folder_id, data, signature=None):
+    """Replace the indexed children of folder_id with the entries of a contents response
+    and mirror the response itself. signature is the folder's change marker from its
+    parent listing; when omitted it is taken from the already indexed folder entry."""
+    rows = []
+    for folder in data.get('folders', []):
+        if isinstance(folder, dict) and folder.get('id'):
+            name = folder.get('path') or folder.get('name') or ''
+            rows.append((entry_key('folder', folder['id']), 'folder', int(folder['id']), folder_id,
+                         name, folder.get('size', 0) or 0, 0, 0, folder.get('last_update')))
+    for f in data.get('files', []):
+        if isinstance(f, dict) and f.get('id'):
+            rows.append((entry_key('file', f['id']), 'file', int(f['id']), folder_id,
+                         f.get('name', ''), f.get('size', 0) or 0,
+                         1 if f.get('is_video', False) else 0, 1 if f.get('is_audio', False) else 0,
+                         f.get('last_update')))
+
+    if signature is None:
+        row = conn.execute('SELECT size, last_update FROM entries WHERE key = ?',
+                           (entry_key('folder', folder_id),)).fetchone()
+        if row:
+            signature = folder_signature(row['size'], row['last_update'])
+
+    with conn:
+        conn.executemany("""
+            INSERT INTO entries(key, kind, id, parent_id, name, size, is_video, is_audio, last_update)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET parent_id = excluded.parent_id, name = excluded.name,
+                size = excluded.size, is_video = excluded.is_video, is_audio = excluded.is_audio,
+                last_update = excluded.last_update
+        """, rows)
+
+        # Drop children that disappeared, including everything below removed folders
+        current_keys = set(row[0] for row in rows)
+        stale = [row for row in conn.execute('SELECT key, kind, id FROM entries WHERE parent_id = ?', (folder_id,))
+                 if row['key'] not in current_keys]
+        for row in stale:
+            if row['kind'] == 'folder':
+                gone = [r[0] for r in conn.execute("""
+                    WITH RECURSIVE gone(id) AS (
+                        SELECT ?
+                        UNION SELECT e.id FROM entries e JOIN gone g ON e.parent_id = g.id AND e.kind = 'folder'
+                    )
+                    SELECT id FROM gone
+                """, (row['id'],))]
+                for gone_id in gone:
+                    conn.execute('DELETE FROM entries WHERE parent_id = ?', (gone_id,))
+                    conn.execute('DELETE FROM listings WHERE folder_id = ?', (gone_id,))
+                    remove_snapshot(gone_id)
+            conn.execute('DELETE FROM entries WHERE key = ?', (row['key'],))
+
+        fetched_at = int(time.time())
+        snapshot.write_snapshot(snapshot_path(folder_id), data, fetched_at)
+        conn.execute("""
+            INSERT INTO listings(folder_id, signature, fetched_at) VALUES (?, ?, ?)
+            ON CONFLICT(folder_id) DO UPDATE SET signature = excluded.signature,
+                fetched_at = excluded.fetched_at
+        """, (folder_id, signature, fetched_at))
+        set_index_state(conn, 'updated_at', int(time.time()))
+
+def snapshot_path(folder_id):
+    return os.path.join(snapshot_dir, f'{folder_id}.snap')
+
+def remove_snapshot(folder_id):
+    try:
+        os.remove(snapshot_path(folder_id))
+    except OSError:
+        pass
+
+def load_listing(folder_id):
+    """Return (data, fetched_at) for a mirrored folder, or (None, None).
+    The entry lists in data are lazy views over a copy of the snapshot's bytes;
+    the file itself is closed again, so the mirror can be rewritten."""
+    path = snapshot_path(folder_id)
+    if not os.path.exists(path):
+        return None, None
+    try:
+        with snapshot.SnapshotReader(path) as reader:
+            return reader.as_listing(), reader.fetched_at
+    except (IOError, OSError, snapshot.SnapshotError) as e:
+        log(f"Error reading catalog mirror: {str(e)}", xbmc.LOGWARNING)
+        return None, None
+
+def update_index(folder_id, data):
+    """Fold a freshly fetched listing into the index without failing the caller"""
+    try:
+        conn = open_index()
+        try:
+            index_listing(conn, folder_id, data)
+        finally:
+            conn.close()
+    except Exception as e:
+        log(f"Error updating search index: {str(e)}", xbmc.LOGWARNING)
+
+class RateLimiter(object):
+    """Spaces out calls from any number of tasks to at most rate per second"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.time()
+
+    async def acquire(self):
+        now = time.time()
+        wait_time = self.next_slot - now
+        self.next_slot = max(now, self.next_slot) + self.interval
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+def crawl_account(progress=None, full=False):
+    """Sync the catalog mirror with the account, fanning folder requests out
+    through AsyncSeedrClient on a small worker pool. The root is always
+    fetched; below it only folders whose size or last update differ from the
+    mirrored copy (or that were never mirrored) are fetched again, unless full
+    is set. progress, if given, is called with (done, total) and may return
+    False to cancel."""
+    log(f"Syncing catalog ({'full' if full else 'incremental'})")
+    root_data = client.root_contents()
+    if not root_data or 'error' in root_data:
+        log("Sync aborted: could not fetch root folder", xbmc.LOGERROR)
+        return False
+
+    conn = open_index()
+    try:
+        mirrored = {} if full else dict(conn.execute('SELECT folder_id, signature FROM listings').fetchall())
+        index_listing(conn, ROOT_FOLDER_ID, root_data)
+        done = 0
+        skipped = 0
+        cancelled = False
+        limiter = RateLimiter(CRAWL_REQUESTS_PER_SECOND)
+
+        async def fetch_folder(api, folder_id):
+            await limiter.acquire()
+            return await api.folder_contents(folder_id)
+
+        async def crawl(api):
+            nonlocal done, cancelled
+            pending = {}
+
+            def visit_children(data):
+                nonlocal skipped
+                for folder in data.get('folders', []):
+                    if not isinstance(folder, dict) or not folder.get('id'):
+                        continue
+                    folder_id = int(folder['id'])
+                    signature = folder_signature(folder.get('size', 0), folder.get('last_update'))
+                    if mirrored.get(folder_id) == signature:
+                        # Unchanged: walk the indexed children to pick up any folders never fetched
+                        children = conn.execute("SELECT id, size, last_update FROM entries "
+                                                "WHERE parent_id = ? AND kind = 'folder'", (folder_id,)).fetchall()
+                        skipped += 1
+                        visit_children({'folders': [dict(child) for child in children]})
+                        continue
+                    pending[asyncio.ensure_future(fetch_folder(api, folder_id))] = (folder_id, signature)
+
+            visit_children(root_data)
+            while pending:
+                finished, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    folder_id, signature = pending.pop(task)
+                    data = task.result()
+                    done += 1
+                    if data and 'error' not in data:
+                        index_listing(conn, folder_id, data, signature)
+                        visit_children(data)
+                    else:
+                        log(f"Sync could not fetch folder {folder_id}, keeping mirrored entries", xbmc.LOGWARNING)
+                if progress and progress(done, done + len(pending)) is False:
+                    log("Sync cancelled by user")
+                    cancelled = True
+                    for task in pending:
+                        task.cancel()
+                    break
+
+        async def run():
+            async with seedr_client.AsyncSeedrClient(client, CRAWL_WORKERS) as api:
+                await crawl(api)
+
+        asyncio.run(run())
+
+        if not cancelled:
+            with conn:
+                set_index_state(conn, 'crawled_at', int(time.time()))
+            home_cache.invalidate('listing')
+            home_cache.invalidate('widget')
+        log(f"Sync finished: {done} folders fetched, {skipped} unchanged")
+        return not cancelled
+    finally:
+        conn.close()
+
+def crawl_with_progress(full=False):
+    """Run crawl_account behind a background progress bar"""
+    progress_dialog = xbmcgui.DialogProgressBG()
+    progress_dialog.create(addonname, __language__(32203))
+    monitor = xbmc.Monitor()
+
+    def report(done, total):
+        progress_dialog.update(int(done * 100 / max(total, 1)), addonname, f"{__language__(32203)} ({done}/{total})")
+        return not monitor.abortRequested()
+
+    try:
+        return crawl_account(report, full)
+    finally:
+        progress_dialog.close()
+
+def background_crawl_progress(max_seconds=None):
+    """crawl_account progress callback for syncs without a dialog; cancels once Kodi is
+    exiting or, with max_seconds, once that much time is spent. Folders synced before a
+    cancel are kept, so the next sync carries on from there."""
+    monitor = xbmc.Monitor()
+    deadline = time.time() + max_seconds if max_seconds else None
+
+    def report(done, total):
+        if monitor.abortRequested():
+            return False
+        return deadline is None or time.time() < deadline
+    return report
+
+def search_index(query, limit=SEARCH_RESULT_LIMIT):
+    """Return indexed entries (as Entry records) whose names match every word of query"""
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return []
+    conn = open_index()
+    try:
+        if index_has_fts(conn):
+            match = ' '.join(f'"{term}"*' for term in terms)
+            rows = conn.execute("""
+                SELECT e.* FROM entries_fts JOIN entries e ON e.key = entries_fts.rowid
+                WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?
+            """, (match, limit)).fetchall()
+        else:
+            clauses = ' AND '.join('name LIKE ?' for _ in terms)
+            rows = conn.execute(f'SELECT * FROM entries WHERE {clauses} ORDER BY kind DESC, name LIMIT ?',
+                                [f'%{term}%' for term in terms] + [limit]).fetchall()
+        return [entries.index_entry(row) for row in rows]
+    finally:
+        conn.close()
+
+def index_is_built():
+    try:
+        conn = open_index()
+        try:
+            return get_index_state(conn, 'crawled_at') is not None
+        finally:
+            conn.close()
+    except Exception as e:
+        log(f"Error reading search index: {str(e)}", xbmc.LOGWARNING)
+        return False
+
+def file_url(entry):
+    """Plugin URL that plays a file. It only holds the file id, so watched state, resume
+    points and favourites survive renames; the metadata playback needs goes to the window cache."""
+    listed_files[str(entry.id)] = entries.encode_meta(entry)
+    return build_url({'mode': 'file', 'file_id': entry.id})
+
+def add_entry_item(entry):
+    """Add a directory item for a normalised entry, linking to the regular folder/file modes"""
+    label = entry.name
+    if entry.size > 0:
+        label += f" ({entry.size / (1024*1024):.1f} MB)"
+    li = xbmcgui.ListItem(label)
+    li.addContextMenuItems([(__language__(id=32006), f"RunPlugin({build_url({'mode': 'refresh'})})"),
+                          (__language__(id=32007), 'Action(ParentDir)')])
+    if entry.is_folder:
+        li.setArt({'icon': 'DefaultFolder.png'})
+        xbmcplugin.addDirectoryItem(handle=addon_handle, url=build_url({'mode': 'folder', 'folder_id': entry.id}),
+                                  listitem=li, isFolder=True)
+        return
+
+    if entry.kind == entries.KIND_AUDIO:
+        li.setInfo('music', infoLabels={'title': entry.name})
+        li.setArt({'icon': 'DefaultAudio.png', 'thumb': 'DefaultAudio.png'})
+    else:
+        li.setInfo('video', infoLabels={'title': entry.name})
+        if entry.kind == entries.KIND_VIDEO:
+            art = {'icon': 'DefaultVideo.png', 'thumb': 'DefaultVideo.png'}
+            art.update(entries.select_art(entry, get_art_profile(), ('icon', 'thumb')))
+            li.setArt(art)
+        elif entry.kind == entries.KIND_SUBTITLE:
+            li.setMimeType('text/plain')
+            li.setArt({'icon': 'DefaultFile.png', 'thumb': 'DefaultFile.png'})
+        else:
+            # Images and PDF previews (using video type since picture is not valid)
+            li.setMimeType('image/jpeg' if entry.kind == entries.KIND_PDF else entries.image_mime_type(entry.name))
+            if entry.thumbnail:
+                li.setArt(entries.select_art(entry, get_art_profile()))
+            else:
+                li.setArt({'icon': 'DefaultPicture.png', 'thumb': 'DefaultPicture.png'})
+
+    # Don't set subtitles as playable
+    if entry.is_playable:
+        li.setProperty('IsPlayable', 'True')
+    xbmcplugin.addDirectoryItem(handle=addon_handle, url=file_url(entry), listitem=li)
+
+def handle_search(args):
+    """List index entries matching a query; builds the index on first use"""
+    query = args.get('query', [None])[0]
+    if not query:
+        query = xbmcgui.Dialog().input(__language__(32201))
+    if not query:
+        xbmcplugin.endOfDirectory(addon_handle, succeeded=False)
+        return
+
+    if not index_is_built():
+        if 'access_token' not in settings and not get_access_token():
+            xbmcplugin.endOfDirectory(addon_handle, succeeded=False)
+            return
+        crawl_with_progress()
+
+    start = time.time()
+    results = search_index(query)
+    log(f"Search for '{query}' returned {len(results)} results in {(time.time() - start) * 1000:.1f}ms")
+
+    for entry in results:
+        add_entry_item(entry)
+
+    if not results:
+        xbmcgui.Dialog().notification(addonname, __language__(32204), xbmcgui.NOTIFICATION_INFO, 3000)
+    xbmcplugin.endOfDirectory(addon_handle, cacheToDisc=False)
+
+def query_library(library, limit=LIBRARY_RECENT_LIMIT):
+    """Entries of a virtual library straight from the index"""
+    conn = open_index()
+    try:
+        if library == 'videos':
+            rows = conn.execute("SELECT * FROM entries WHERE kind = 'file' AND is_video = 1 "
+                                "ORDER BY name COLLATE NOCASE").fetchall()
+        elif library == 'music':
+            rows = conn.execute("SELECT * FROM entries WHERE kind = 'file' AND is_audio = 1 "
+                                "ORDER BY name COLLATE NOCASE").fetchall()
+        else:
+            # Ids grow over time, so they order entries without a last_update
+            rows = conn.execute("SELECT * FROM entries ORDER BY last_update DESC, id DESC LIMIT ?",
+                                (limit,)).fetchall()
+        return [entries.index_entry(row) for row in rows]
+    finally:
+        conn.close()
+
+def catalog_age():
+    """Seconds since the last completed sync, or None if the catalog was never synced"""
+    try:
+        conn = open_index()
+        try:
+            crawled_at = get_index_state(conn, 'crawled_at')
+        finally:
+            conn.close()
+    except Exception as e:
+        log(f"Error reading catalog state: {str(e)}", xbmc.LOGWARNING)
+        return None
+    return None if crawled_at is None else time.time() - int(crawled_at)
+
+def handle_library(args):
+    """All Videos / All Music / Recently Added, served from the local index"""
+    library = args.get('library', ['videos'])[0]
+    age = catalog_age()
+    if age is None:
+        if 'access_token' not in settings and not get_access_token():
+            xbmcplugin.endOfDirectory(addon_handle, succeeded=False)
+            return
+        crawl_with_progress()
+
+    start = time.time()
+    results = query_library(library)
+    log(f"Library '{library}' returned {len(results)} entries in {(time.time() - start) * 1000:.1f}ms")
+
+    for entry in results:
+        add_entry_item(entry)
+    if library == 'music':
+        xbmcplugin.setContent(addon_handle, 'songs')
+    else:
+        xbmcplugin.setContent(addon_handle, 'videos')
+    if library != 'recent':
+        xbmcplugin.addSortMethod(addon_handle, xbmcplugin.SORT_METHOD_LABEL)
+    xbmcplugin.endOfDirectory(addon_handle)
+
+    # Refresh a stale catalog after the listing is shown; the next visit sees the result
+    if (age is not None and age > LIBRARY_MAX_AGE and 'access_token' in settings
+            and home_cache.get('library', 'sync') is None):
+        home_cache.set('library', 'sync', True, LIBRARY_SYNC_CLAIM)
+        log(f"Catalog is {int(age)}s old, syncing in the background")
+        crawl_account(background_crawl_progress(LIBRARY_SYNC_BUDGET))
+
+def query_widget(widget, limit=WIDGET_LIMIT):
+    """Entries of a home screen widget. The index is opened read-only with a short
+    timeout, so a running sync or a missing index yields an empty widget rather than a wait."""
+    if not os.path.exists(index_file):
+        return []
+    conn = sqlite3.connect('file:' + pathname2url(index_file) + '?mode=ro', uri=True, timeout=WIDGET_DB_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    try:
+        if widget == 'continue':
+            # The last played video and the ones after it in its folder
+            folder_id = get_index_state(conn, 'last_played_folder')
+            if folder_id is None:
+                return []
+            rows = conn.execute("SELECT * FROM entries WHERE kind = 'file' AND is_video = 1 AND parent_id = ? "
+                                "AND name >= ? COLLATE NOCASE ORDER BY name COLLATE NOCASE LIMIT ?",
+                                (int(folder_id), get_index_state(conn, 'last_played_name', ''), limit)).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM entries WHERE kind = 'file' AND is_video = 1 "
+                                "ORDER BY last_update DESC, id DESC LIMIT ?", (limit,)).fetchall()
+        return [entries.index_entry(row) for row in rows]
+    finally:
+        conn.close()
+
+def remember_played(entry):
+    """Note the video just played for the continue widget"""
+    if entry.kind != entries.KIND_VIDEO or not entry.folder_id:
+        return
+    try:
+        conn = open_index()
+        try:
+            with conn:
+                set_index_state(conn, 'last_played_folder', entry.folder_id)
+                set_index_state(conn, 'last_played_name', entry.name)
+        finally:
+            conn.close()
+        home_cache.delete('widget', 'continue')
+    except Exception as e:
+        log(f"Error recording played video: {str(e)}", xbmc.LOGWARNING)
+
+def handle_widget(args):
+    """Home screen widgets (recently added videos, continue in folder).
+    Skins call these whenever the home screen gains focus, so they never ask for
+    authentication or touch the API while rendering; a stale catalog is synced
+    afterwards for at most WIDGET_SYNC_BUDGET seconds, once per configured interval."""
+    widget = args.get('widget', ['recent'])[0]
+    start = time.time()
+    cached = home_cache.get('widget', widget)
+    if cached is not None:
+        results = [entries.Entry(*fields) for fields in cached]
+    else:
+        try:
+            results = query_widget(widget)
+        except sqlite3.Error as e:
+            log(f"Widget '{widget}' unavailable: {str(e)}", xbmc.LOGWARNING)
+            results = []
+        home_cache.set('widget', widget, [[e.kind, e.id, e.name, e.size, e.folder_id, e.thumbnail, e.images] for e in results],
+                       WIDGET_CACHE_TTL)
+
+    for entry in results:
+        add_entry_item(entry)
+    xbmcplugin.setContent(addon_handle, 'videos')
+    xbmcplugin.endOfDirectory(addon_handle, cacheToDisc=False)
+
+    elapsed = time.time() - start
+    run_metrics.record_timing(f'widget_{widget}', elapsed)
+    level = xbmc.LOGWARNING if elapsed > WIDGET_BUDGET else xbmc.LOGDEBUG
+    log(f"Widget '{widget}' returned {len(results)} entries in {elapsed * 1000:.1f}ms", level)
+
+    interval = addon.getSettingInt('widget_refresh') * 60
+    if interval <= 0 or 'access_token' not in settings or home_cache.get('widget', 'sync') is not None:
+        return
+    age = catalog_age()
+    if age is None or age > interval:
+        # Claimed in the window cache so widgets refreshing together don't all sync
+        home_cache.set('widget', 'sync', True, interval)
+        log("Catalog is stale, syncing in the background for widgets")
+        crawl_account(background_crawl_progress(WIDGET_SYNC_BUDGET))
+
+def safe_filename(name):
+    """Strip characters that are invalid in file names on common filesystems"""
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', name).strip(' .')
+    return name or '_'
+
+def unique_sibling_names(items):
+    """{id: name} for (id, parent_id, name) rows. Siblings whose names collide (ignoring
+    case, for case-insensitive filesystems) get ' [id]' appended, except the lowest id,
+    so adding a duplicate later doesn't move what was already exported."""
+    taken = set()
+    names = {}
+    for item_id, parent_id, name in sorted(items):
+        while (parent_id, name.lower()) in taken:
+            name = f"{name} [{item_id}]"
+        taken.add((parent_id, name.lower()))
+        names[item_id] = name
+    return names
+
+def strm_export_paths():
+    """Map each indexed video's file id to its .strm path relative to the export root,
+    mirroring the Seedr folder structure. Same-named videos (x.mkv and x.mp4) or sibling
+    folders are told apart by their id."""
+    conn = open_index()
+    try:
+        folder_rows = conn.execute("SELECT id, parent_id, name FROM entries WHERE kind = 'folder'").fetchall()
+        videos = conn.execute("SELECT id, parent_id, name FROM entries WHERE kind = 'file' AND is_video = 1").fetchall()
+    finally:
+        conn.close()
+
+    folder_parents = dict((row['id'], row['parent_id']) for row in folder_rows)
+    folder_names = unique_sibling_names((row['id'], row['parent_id'], safe_filename(row['name'].rsplit('/', 1)[-1]))
+                                        for row in folder_rows)
+    file_names = unique_sibling_names((row['id'], row['parent_id'], safe_filename(os.path.splitext(row['name'])[0]))
+                                      for row in videos)
+
+    folder_paths = {ROOT_FOLDER_ID: ''}
+    def folder_path(folder_id):
+        if folder_id not in folder_paths:
+            parent = folder_path(folder_parents.get(folder_id, ROOT_FOLDER_ID))
+            folder_paths[folder_id] = (parent + '/' if parent else '') + folder_names.get(folder_id, str(folder_id))
+        return folder_paths[folder_id]
+
+    paths = {}
+    for row in videos:
+        directory = folder_path(row['parent_id'])
+        paths[str(row['id'])] = (directory + '/' if directory else '') + file_names[row['id']] + '.strm'
+    return paths
+
+def prune_export_dirs(library_root, directories):
+    """Remove export folders that deleted .strm files left empty, walking up towards but
+    never removing library_root. Returns the relative paths of the removed folders."""
+    pruned = set()
+    for directory in sorted(directories, key=lambda d: d.count('/'), reverse=True):
+        while directory and directory not in pruned:
+            path = f'{library_root}/{directory}/'
+            subdirs, files = xbmcvfs.listdir(path)
+            if subdirs or files or not xbmcvfs.rmdir(path):
+                break
+            pruned.add(directory)
+            directory = os.path.dirname(directory)
+    return pruned
+
+def handle_export():
+    """Write .strm files for every video into the library folder, touching only what
+    changed since the last export, then scan just the affected paths"""
+    if 'access_token' not in settings and not get_access_token():
+        return
+    if not crawl_with_progress():
+        log("Export aborted: catalog sync did not complete", xbmc.LOGWARNING)
+        return
+
+    library_root = addon.getSetting('library_folder') or os.path.join(__profile__, 'library')
+    library_root = library_root.rstrip('/\\')
+    manifest = {}
+    if xbmcvfs.exists(strm_manifest_file):
+        with xbmcvfs.File(strm_manifest_file) as f:
+            manifest = json.loads(f.read() or '{}')
+    # A different export folder starts from scratch
+    exported = manifest.get('files', {}) if manifest.get('root') == library_root else {}
+
+    wanted = strm_export_paths()
+    changed_dirs = set()
+    added = 0
+    removed = 0
+
+    for file_id, rel_path in exported.items():
+        if wanted.get(file_id) != rel_path:
+            xbmcvfs.delete(f'{library_root}/{rel_path}')
+            changed_dirs.add(os.path.dirname(rel_path))
+            removed += 1
+
+    for file_id, rel_path in wanted.items():
+        if exported.get(file_id) == rel_path:
+            continue
+        directory = f'{library_root}/{os.path.dirname(rel_path)}'.rstrip('/')
+        xbmcvfs.mkdirs(directory + '/')
+        with xbmcvfs.File(f'{library_root}/{rel_path}', 'w') as f:
+            f.write(build_url({'mode': 'file', 'file_id': file_id}))
+        changed_dirs.add(os.path.dirname(rel_path))
+        added += 1
+
+    # Renamed and removed folders would otherwise stay behind empty in the library source
+    pruned_dirs = prune_export_dirs(library_root, changed_dirs)
+    changed_dirs -= pruned_dirs
+
+    with xbmcvfs.File(strm_manifest_file, 'w') as f:
+        f.write(json.dumps({'root': library_root, 'files': wanted}))
+    log(f"STRM export: {added} written, {removed} removed, {len(changed_dirs)} folders changed, "
+        f"{len(pruned_dirs)} emptied folders removed")
+
+    # Scan only the folders that changed; many changes scan the export root once
+    if removed:
+        xbmc.executebuiltin(f'CleanLibrary(video,false,{library_root}/)')
+    if changed_dirs:
+        if len(changed_dirs) > STRM_SCAN_MAX_PATHS:
+            xbmc.executebuiltin(f'UpdateLibrary(video,{library_root}/)')
+        else:
+            for directory in sorted(changed_dirs):
+                scan_path = f'{library_root}/{directory}/' if directory else f'{library_root}/'
+                xbmc.executebuiltin(f'UpdateLibrary(video,{scan_path})')
+    xbmcgui.Dialog().notification(addonname, __language__(32213) % (added, removed),
+                                  xbmcgui.NOTIFICATION_INFO, 5000)
+
+def handle_refresh():
+    """Refresh the current listing with data fresh from the API rather than the window cache"""
+    home_cache.invalidate('listing')
+    xbmc.executebuiltin('Container.Refresh')
+
+def handle_reindex(full=True):
+    """Sync the catalog (context menu action); full rebuilds it from scratch"""
+    if 'access_token' not in settings and not get_access_token():
+        return
+    if crawl_with_progress(full):
+        xbmcgui.Dialog().notification(addonname, __language__(32205 if full else 32208),
+                                      xbmcgui.NOTIFICATION_INFO, 3000)
+        xbmc.executebuiltin('Container.Refresh')
+
+def format_age(seconds):
+    """Short human readable age for the offline indicator"""
+    seconds = max(0, int(seconds))
+    if seconds < 3600:
+        return f"{seconds // 60} min"
+    if seconds < 86400:
+        return f"{seconds // 3600} h"
+    return f"{seconds // 86400} d"
+
+def store_listed_files():
+    """Cache the metadata of the files this invocation linked to for their playback"""
+    if listed_files:
+        home_cache.set_many('file', listed_files, FILE_META_CACHE_TTL, FILE_META_CACHE_ENTRIES)
+
+def flush_metrics():
+    """Add this invocation's metrics to the persisted totals"""
+    try:
+        with file_lock(metrics_file):
+            run_metrics.save(metrics_file)
+    except (IOError, OSError) as e:
+        log(f"Error saving metrics: {str(e)}", xbmc.LOGWARNING)
+
+def export_diagnostics(totals):
+    """Write the report and raw totals to a folder picked by the user, for attaching to bug reports"""
+    folder = xbmcgui.Dialog().browse(3, __language__(32216), 'files')
+    if not folder:
+        return
+    path = os.path.join(xbmcvfs.translatePath(folder), f"seedr-diagnostics-{time.strftime('%Y%m%d-%H%M%S')}.txt")
+    try:
+        with open(path, 'w') as f:
+            f.write(f"Seedr {addon.getAddonInfo('version')}, Kodi {xbmc.getInfoLabel('System.BuildVersion')}\n")
+            f.write(f"Collected since {time.strftime('%Y-%m-%d %H:%M', time.localtime(totals.since))}\n\n")
+            f.write('\n'.join(metrics.report_lines(totals)) + '\n\n')
+            json.dump(totals.to_dict(), f)
+    except (IOError, OSError) as e:
+        log(f"Error exporting diagnostics: {str(e)}", xbmc.LOGERROR)
+        xbmcgui.Dialog().ok(addonname, str(e))
+        return
+    xbmcgui.Dialog().notification(addonname, __language__(32217) % path, xbmcgui.NOTIFICATION_INFO, 5000)
+
+def handle_diagnostics(args):
+    """Hidden view (plugin://plugin.video.seedr/?mode=diagnostics) with the persisted metrics"""
+    action = args.get('action', [None])[0]
+    flush_metrics()
+    totals = metrics.load(metrics_file)
+    if action == 'export':
+        export_diagnostics(totals)
+        return
+    if action == 'reset':
+        with file_lock(metrics_file):
+            try:
+                os.remove(metrics_file)
+            except OSError:
+                pass
+        xbmc.executebuiltin('Container.Refresh')
+        return
+    if action == 'refresh':
+        xbmc.executebuiltin('Container.Refresh')
+        return
+
+    for label, item_action in ((__language__(32216), 'export'), (__language__(32218), 'reset')):
+        li = xbmcgui.ListItem(f"[B]{label}[/B]")
+        li.setArt({'icon': 'DefaultAddonService.png'})
+        xbmcplugin.addDirectoryItem(handle=addon_handle, url=build_url({'mode': 'diagnostics', 'action': item_action}),
+                                  listitem=li, isFolder=False)
+    since = time.strftime('%Y-%m-%d %H:%M', time.localtime(totals.since))
+    lines = metrics.report_lines(totals) or [__language__(32219)]
+    for line in [__language__(32215) % since] + lines:
+        li = xbmcgui.ListItem(line)
+        li.setArt({'icon': 'DefaultIconInfo.png'})
+        xbmcplugin.addDirectoryItem(handle=addon_handle, url=build_url({'mode': 'diagnostics', 'action': 'refresh'}),
+                                  listitem=li, isFolder=False)
+    xbmcplugin.endOfDirectory(addon_handle, cacheToDisc=False)
+
+def cache_listing(folder_id, data):
+    home_cache.set('listing', str(folder_id), data, LISTING_CACHE_TTL, LISTING_CACHE_ENTRIES, LISTING_CACHE_MAX_BYTES)
+
+def descend_single_folders(folder_id, data, mirror_fetched_at=None):
+    """Follow folders whose only visible child is another folder, as torrents often
+    produce Name/Name/media. Each level comes from the window cache or the API, or
+    from the mirror when browsing it, and API results are cached and mirrored like
+    any listing. Returns (folder_id, data, mirror_fetched_at) of the deepest level."""
+    for _ in range(DESCEND_MAX_DEPTH):
+        folders = data.get('folders', [])
+        files = data.get('files', [])
+        if len(folders) != 1 or len(files) > DESCEND_MAX_FILES:
+            break
+        folder_entries, file_entries = entries.listing_entries(folders, files)
+        if len(folder_entries) != 1 or file_entries:
+            break
+
+        child_id = int(folder_entries[0].id)
+        if mirror_fetched_at is not None:
+            child, child_fetched_at = load_listing(child_id)
+        else:
+            child_fetched_at = None
+            child = home_cache.get('listing', str(child_id))
+            if child is None:
+                child = client.folder_contents(child_id)
+                if isinstance(child, dict) and 'error' not in child:
+                    update_index(child_id, child)
+                    cache_listing(child_id, child)
+                else:
+                    child = None
+        if child is None:
+            break
+        log(f"Folder {folder_id} only contains folder {child_id}, descending")
+        folder_id, data, mirror_fetched_at = child_id, child, child_fetched_at
+    return folder_id, data, mirror_fetched_at
+
+def folder_contents(folder_id):
+    """Contents response of a folder (the root when folder_id is None), from the
+    window cache when the folder was listed moments ago"""
+    key = str(folder_id or ROOT_FOLDER_ID)
+    data = home_cache.get('listing', key)
+    run_metrics.record_cache('window_listing', data is not None)
+    if data is not None:
+        return data
+    if folder_id:
+        data = client.folder_contents(folder_id)
+    else:
+        data = client.root_contents()
+    if isinstance(data, dict) and 'error' not in data:
+        cache_listing(folder_id or ROOT_FOLDER_ID, data)
+    return data
+
+def find_folder_file(folder_id, file_id):
+    """Entry for file_id from its folder's contents (the root when folder_id is None).
+    Folder listings carry the presentation URLs that file details often lack."""
+    log(f"Searching for file {file_id} in folder ID: {folder_id or ROOT_FOLDER_ID}", xbmc.LOGINFO)
+    folder_data = folder_contents(folder_id)
+    if folder_data and 'files' in folder_data:
+        for raw in folder_data['files']:
+            if isinstance(raw, dict) and raw.get('id') == int(file_id):
+                return entries.file_entry(raw)
+    return None
+
+def folder_file_entries(folder_id):
+    """Normalised files of a folder, or an empty list if it can't be fetched"""
+    folder_data = folder_contents(folder_id)
+    if not folder_data or 'files' not in folder_data:
+        return []
+    return [e for e in (entries.file_entry(f) for f in folder_data['files']) if e is not None]
+
+def fetch_stream_url(fetch, file_id):
+    """'url' returned by fetch(file_id), one of the client's download or presentation
+    endpoints. URLs resolved in the last few minutes come from the window cache, so
+    replays, resumes and queued items skip the API."""
+    endpoint = f"{fetch.__name__}/{file_id}"
+    url = home_cache.get('stream', endpoint)
+    run_metrics.record_cache('window_stream', url is not None)
+    if url:
+        log(f"Using URL from window cache for {endpoint}")
+        return url
+
+    data = fetch(file_id)
+    if data is None:
+        log(f"{endpoint} returned None - this indicates a connection or authentication error", xbmc.LOGERROR)
+        return None
+    if not isinstance(data, dict) or data.get('error') or not data.get('url'):
+        log(f"{endpoint} returned no URL: {data}", xbmc.LOGERROR)
+        return None
+    log(f"{endpoint} returned URL: {data['url']}")
+    home_cache.set('stream', endpoint, data['url'], STREAM_URL_CACHE_TTL, STREAM_URL_CACHE_ENTRIES)
+    return data['url']
+
+def resolve_playback(li):
+    """Hand a resolved item to Kodi, recording how long it took since the invocation started"""
+    xbmcplugin.setResolvedUrl(addon_handle, True, li)
+    run_metrics.record_timing('playback_resolve', time.time() - invocation_started)
+
+def fail_playback(message):
+    xbmcplugin.setResolvedUrl(addon_handle, False, xbmcgui.ListItem())
+    run_metrics.increment('playback_failed')
+    show_auto_close_notification(addonname, message)
+
+def use_direct_play(entry):
+    """Whether a video is played from its original file instead of the HLS presentation"""
+    playback_mode = get_playback_mode()
+    if playback_mode != 'auto':
+        return playback_mode == 'direct'
+    extension = os.path.splitext(entry.name)[1].lower()
+    return extension in DIRECT_PLAY_TYPES and entry.size <= DIRECT_PLAY_MAX_SIZE
+
+def resolve_entry(entry, file_id):
+    """Resolve a file for playback. Returns None on success or a message describing the failure."""
+    if entry.kind == entries.KIND_SUBTITLE:
+        log(f"This is a subtitle file: {entry.name}", xbmc.LOGINFO)
         
-        # Log full raw data
-        log(f"Full file details response for ID {file_id}: {data}", xbmc.LOGINFO)
+        # For subtitle files, we'll download the content and display it
+        try:
+            subtitle_url = fetch_stream_url(client.file_download, file_id)
+            if not subtitle_url:
+                log("Failed to get subtitle download URL", xbmc.LOGERROR)
+                return "Failed to load subtitle file. Please try again."
+            
+            log(f"Subtitle download URL: {subtitle_url}", xbmc.LOGINFO)
+            li = xbmcgui.ListItem(path=subtitle_url)
+            li.setInfo('video', {'title': entry.name})
+            li.setMimeType('text/plain')
+            li.setArt({
+                'icon': 'DefaultFile.png',
+                'thumb': 'DefaultFile.png'
+            })
+            resolve_playback(li)
+            return None
+        except Exception as e:
+            log(f"Error handling subtitle file: {str(e)}", xbmc.LOGERROR)
+            return f"Error handling subtitle: {str(e)}"
+    
+    if entry.kind == entries.KIND_VIDEO:
+        # The original file skips the HLS manifest round trips; the presentation is the fallback
+        direct = use_direct_play(entry)
+        url = None
+        if direct:
+            log("Resolving original file for direct play", xbmc.LOGINFO)
+            url = fetch_stream_url(client.download_url, file_id)
+            if not url:
+                log("No download URL for direct play, falling back to HLS", xbmc.LOGWARNING)
+                direct = False
+        if not direct:
+            log("Making video API call...", xbmc.LOGWARNING)
+            url = fetch_stream_url(client.hls_presentation, file_id)
+        if not url:
+            return "Failed to get video URL from both APIs. Please try again."
+        run_metrics.increment('playback_direct' if direct else 'playback_hls')
+        
+        # First, check if there's a matching subtitle file in the same folder
+        subtitle_url = None
+        if entry.folder_id:
+            # Get the video file's base name (without extension)
+            video_base_name = os.path.splitext(entry.name)[0]
+            log(f"Looking for subtitles matching: {video_base_name}", xbmc.LOGINFO)
+            
+            for folder_file in folder_file_entries(entry.folder_id):
+                # Check if this is a subtitle file that matches the video name
+                if folder_file.kind == entries.KIND_SUBTITLE and os.path.splitext(folder_file.name)[0] == video_base_name:
+                    subtitle_url = fetch_stream_url(client.file_download, folder_file.id)
+                    if subtitle_url:
+                        log(f"Found matching subtitle: {folder_file.name}, URL: {subtitle_url}", xbmc.LOGINFO)
+                        break
         
-        if data and not data.get('error'):
-            file_name = data.get('name', 'Unknown')
-            file_ext = file_name.lower()
+        # Validate the URL format
+        if not url.startswith('https://'):
+            log(f"WARNING: URL doesn't start with https: {url}", xbmc.LOGERROR)
+        if not direct and 'master' not in url.lower() and 'm3u8' not in url.lower():
+            log(f"WARNING: URL doesn't appear to be HLS format: {url}", xbmc.LOGWARNING)
+        
+        li = xbmcgui.ListItem(path=url)
+        li.setInfo('video', {'title': entry.name})
+        # Without a thumbnail Kodi keeps the art of the listing item
+        art = entries.select_art(entry, get_art_profile(), ('icon', 'thumb'))
+        if art:
+            li.setArt(art)
+        
+        if direct:
+            # Kodi's own demuxer streams the file with range requests; a known
+            # container also saves the HEAD request Kodi would make to sniff it
+            mime_type = DIRECT_PLAY_TYPES.get(os.path.splitext(entry.name)[1].lower())
+            if mime_type:
+                li.setMimeType(mime_type)
+                li.setContentLookup(False)
+        else:
+            # Set required properties for HLS playback
+            li.setProperty('inputstream', 'inputstream.adaptive')
+            li.setProperty('inputstream.adaptive.manifest_type', 'hls')
+            li.setMimeType('application/x-mpegURL')
+            li.setContentLookup(False)
+        
+        # Add subtitle if found
+        if subtitle_url:
+            log(f"Adding subtitle to video: {subtitle_url}", xbmc.LOGINFO)
+            li.setSubtitles([subtitle_url])
+        
+        log(f"Resolving {'direct' if direct else 'HLS'} URL for playback", xbmc.LOGWARNING)
+        resolve_playback(li)
+        return None
+    
+    if entry.kind == entries.KIND_AUDIO:
+        # Get the audio streaming URL from the download/view endpoint
+        url = fetch_stream_url(client.download_url, file_id)
+        if not url:
+            return "Failed to get audio URL from both APIs. Please try again."
+        
+        log(f"Creating audio ListItem with download/view API URL: {url}", xbmc.LOGWARNING)
+        current_li = xbmcgui.ListItem(path=url)
+        
+        # Use the InfoTagMusic approach to avoid deprecation warning
+        info_tag = current_li.getMusicInfoTag()
+        info_tag.setTitle(entry.name)
+        info_tag.setMediaType('song')
+        
+        current_li.setArt({
+            'icon': 'DefaultAudio.png',
+            'thumb': 'DefaultAudio.png'
+        })
+        
+        # Queue the rest of the folder's audio files after this one
+        if entry.folder_id:
+            log(f"Getting folder contents for playlist creation, folder ID: {entry.folder_id}", xbmc.LOGINFO)
+            audio_files = [e for e in folder_file_entries(entry.folder_id) if e.kind == entries.KIND_AUDIO]
             
-            # Check if this is a subtitle file (SRT)
-            if file_ext.endswith('.srt'):
-                log(f"This is a subtitle file: {file_name}", xbmc.LOGINFO)
-                
-                # For subtitle files, we'll download the content and display it
-                try:
-                    # Get the subtitle content URL
-                    subtitle_data = call_api(f'/api/v0.1/p/fs/file/{file_id}/download', settings['access_token'])
-                    
-                    if subtitle_data and 'url' in subtitle_data:
-                        subtitle_url = subtitle_data['url']
-                        log(f"Subtitle download URL: {subtitle_url}", xbmc.LOGINFO)
-                        
-                        # Display the subtitle content
-                        li = xbmcgui.ListItem(path=subtitle_url)
-                        li.setInfo('video', {'title': file_name})
-                        li.setMimeType('text/plain')
-                        li.setArt({
-                            'icon': 'DefaultFile.png',
-                            'thumb': 'DefaultFile.png'
-                        })
-                        xbmcplugin.setResolvedUrl(addon_handle, True, li)
-                        return
-                    else:
-                        log("Failed to get subtitle download URL", xbmc.LOGERROR)
-                        li = xbmcgui.ListItem()
-                        xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                        show_auto_close_notification(addonname, "Failed to load subtitle file. Please try again.")
-                        return
-                except Exception as e:
-                    log(f"Error handling subtitle file: {str(e)}", xbmc.LOGERROR)
-                    li = xbmcgui.ListItem()
-                    xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                    show_auto_close_notification(addonname, f"Error handling subtitle: {str(e)}")
-                    return
+            # Sort audio files by name for consistent playlist order
+            audio_files.sort(key=lambda e: e.name.lower())
             
-            elif data.get('is_video', False):
-            # Get the video streaming URL - direct media API call
-                log("Making video API call...", xbmc.LOGWARNING)
-                video_data = call_api(f'/api/v0.1/p/presentations/file/{file_id}/hls', settings['access_token'])
-                log(f"Alternative API response type: {type(video_data)}", xbmc.LOGWARNING)
-                
-                if video_data is None:
-                    log("Alternative API returned None - this indicates a connection or authentication error", xbmc.LOGERROR)
-                elif isinstance(video_data, dict) and video_data.get('error'):
-                    log(f"Alternative API returned error: {video_data.get('error')}", xbmc.LOGERROR)
-                elif isinstance(video_data, dict) and 'url' in video_data:
-                    log(f"Alternative API returned URL: {video_data.get('url')}", xbmc.LOGWARNING)
-                else:
-                    log(f"Alternative API returned unexpected format: {video_data}", xbmc.LOGERROR)
-                               
-                if video_data and not video_data.get('error'):
-                    url = video_data.get('url')
-                    if url:
-                                                
-                        # First, check if there's a matching subtitle file in the same folder
-                        subtitle_url = None
-                        folder_id = data.get('folder_id')
-                        
-                        if folder_id:
-                            # Get the video file's base name (without extension)
-                            video_base_name = os.path.splitext(file_name)[0]
-                            log(f"Looking for subtitles matching: {video_base_name}", xbmc.LOGINFO)
-                            
-                            # Get all files in the folder
-                            folder_data = call_api(f'/api/v0.1/p/fs/folder/{folder_id}/contents', settings['access_token'])
-                            
-                            if folder_data and 'files' in folder_data:
-                                for folder_file in folder_data['files']:
-                                    # Check if this is a subtitle file that matches the video name
-                                    sub_name = folder_file.get('name', '')
-                                    if sub_name.lower().endswith('.srt'):
-                                        sub_base_name = os.path.splitext(sub_name)[0]
-                                        log(f"Found SRT file: {sub_name}, base name: {sub_base_name}", xbmc.LOGINFO)
-                                        
-                                        # Check if the base names match
-                                        if sub_base_name == video_base_name:
-                                            # Get the subtitle download URL
-                                            sub_id = folder_file.get('id')
-                                            if sub_id:
-                                                subtitle_data = call_api(f'/api/v0.1/p/fs/file/{sub_id}/download', settings['access_token'])
-                                                if subtitle_data and 'url' in subtitle_data:
-                                                    subtitle_url = subtitle_data['url']
-                                                    log(f"Found matching subtitle: {sub_name}, URL: {subtitle_url}", xbmc.LOGINFO)
-                                                    break
-                        
-                        # Create ListItem with all required properties
-                        log(f"Creating ListItem with alternative API URL: {url}", xbmc.LOGWARNING)
-                        
-                        # Validate the URL format
-                        if not url.startswith('https://'):
-                            log(f"WARNING: URL doesn't start with https: {url}", xbmc.LOGERROR)
-                        if 'master' not in url.lower() and 'm3u8' not in url.lower():
-                            log(f"WARNING: URL doesn't appear to be HLS format: {url}", xbmc.LOGWARNING)
-                                                
-                        li = xbmcgui.ListItem(path=url)
-                        li.setInfo('video', {'title': data.get('name', 'Unknown Video')})
-                        
-                        # Set default video icon while loading
-                        li.setArt({
-                            'icon': 'DefaultVideo.png',
-                            'thumb': 'DefaultVideo.png'
-                        })
-                        
-                        # Safely handle presentation URLs
-                        presentation_urls = data.get('presentation_urls', {})
-                        if isinstance(presentation_urls, dict):
-                            image_urls = presentation_urls.get('image', {})
-                            if isinstance(image_urls, dict):
-                                thumbnail = get_best_image_url(image_urls)
-                                li.setArt({
-                                    'icon': thumbnail,
-                                    'thumb': thumbnail
-                                })
-                        else:
-                            # If no preview URL found, use default file icon
-                            li.setArt({
-                                'icon': 'DefaultFile.png',
-                                'thumb': 'DefaultFile.png'
-                            })
-                        
-                        # Set required properties for HLS playback
-                        log("Setting HLS properties for alternative API playback", xbmc.LOGWARNING)
-                        li.setProperty('inputstream', 'inputstream.adaptive')
-                        li.setProperty('inputstream.adaptive.manifest_type', 'hls')
-                        li.setMimeType('application/x-mpegURL')
-                        li.setContentLookup(False)
-                        
-                        # Add subtitle if found
-                        if subtitle_url:
-                            log(f"Adding subtitle to video: {subtitle_url}", xbmc.LOGINFO)
-                            li.setSubtitles([subtitle_url])
-                        
-                        # Resolve the URL first
-                        log("Resolving alternative API URL for playback", xbmc.LOGWARNING)
-                        xbmcplugin.setResolvedUrl(addon_handle, True, li)
-                        log("Alternative API playback initiated successfully!", xbmc.LOGWARNING)
-                        return
-                    else:
-                        # Handle failure case - no URL from alternative API
-                        log("FAILED: Alternative API returned no video URL", xbmc.LOGERROR)
-                        li = xbmcgui.ListItem()
-                        xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                        log("No video URL returned from alternative API", xbmc.LOGERROR)
-                        show_auto_close_notification(addonname, "Failed to get video URL from both APIs. Please try again.")
-                else:
-                    # Handle failure case - both APIs failed
-                    log("FAILED: API failed", xbmc.LOGERROR)
-                    log(f" API error details: {video_data}", xbmc.LOGERROR)
-                    li = xbmcgui.ListItem()
-                    xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                    log("Both video APIs failed", xbmc.LOGERROR)
-                    show_auto_close_notification(addonname, "Failed to get video URL from both APIs. Please try again.")
-            elif data.get('is_audio', False):
-            # Get the audio streaming URL - direct media API call
-                
-                log("ATTEMPTING AUDIO FALLBACK: Trying download/view endpoint", xbmc.LOGWARNING)                    
-                log("Making  audio API call...", xbmc.LOGWARNING)
-
-                alternative_url = f'/api/v0.1/p/download/file/{file_id}/url'
-                
-                log(f" audio API endpoint: {alternative_url}", xbmc.LOGWARNING)
-                audio_data = call_api(alternative_url, settings['access_token'])
-                log(f" audio URL response: {audio_data}")
-                log(f" audio API response type: {type(audio_data)}", xbmc.LOGWARNING)
-                
-                if audio_data is None:
-                    log(" audio API returned None - this indicates a connection or authentication error", xbmc.LOGERROR)
-                elif isinstance(audio_data, dict) and audio_data.get('error'):
-                    log(f" audio API returned error: {audio_data.get('error')}", xbmc.LOGERROR)
-                elif isinstance(audio_data, dict) and 'url' in audio_data:
-                    log(f" audio API returned URL: {audio_data.get('url')}", xbmc.LOGWARNING)
-                else:
-                    log(f" audio API returned unexpected format: {audio_data}", xbmc.LOGERROR)
-                                                    
-                if audio_data and not audio_data.get('error'):
-                    url = audio_data.get('url')
-                    if url:
-                        log(f"SUCCESS: API returned audio URL: {url}")                        
-                        log("USING DOWNLOAD/VIEW API URL FOR AUDIO PLAYBACK", xbmc.LOGWARNING)
-                        log(f"Creating audio ListItem with download/view API URL: {url}", xbmc.LOGWARNING)
-                                                    
-                        file_name = data.get('name', 'Unknown Audio')
-                        current_li = xbmcgui.ListItem(path=url)
-                        
-                        # Use the InfoTagMusic approach to avoid deprecation warning
-                        info_tag = current_li.getMusicInfoTag()
-                        info_tag.setTitle(file_name)
-                        info_tag.setMediaType('song')
-                        
-                        current_li.setArt({
-                            'icon': 'DefaultAudio.png',
-                            'thumb': 'DefaultAudio.png'
-                        })
-                                                    
-                        # Get folder contents to create playlist
-                        folder_id = data.get('folder_id')
-                        if folder_id:
-                            log(f"Getting folder contents for playlist creation, folder ID: {folder_id}", xbmc.LOGINFO)
-                            folder_data = call_api(f'/api/v0.1/p/fs/folder/{folder_id}/contents', settings['access_token'])
-                            
-                            if folder_data and 'files' in folder_data:
-                                # Create a new playlist for this folder
-                                playlist = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
-                                playlist.clear()  # Clear any existing playlist
-                                
-                                # Add all audio files to the playlist
-                                audio_files = []
-                                for file_item in folder_data['files']:
-                                    if file_item.get('is_audio', False):
-                                        audio_files.append(file_item)
-                                
-                                # Sort audio files by name for consistent playlist order
-                                audio_files.sort(key=lambda x: x.get('name', '').lower())
-                                
-                                # Find the index of the current file in the list
-                                current_file_index = -1
-                                for idx, file_item in enumerate(audio_files):
-                                    if file_item.get('id') == int(file_id):
-                                        current_file_index = idx
-                                        break
-                                
-                                if current_file_index >= 0:
-                                    # Put the current file first in the playlist
-                                    playlist.add(url, current_li)
-                                    
-                                    # Add the remaining files in order, after the current one
-                                    remaining_files = audio_files[current_file_index+1:] + audio_files[:current_file_index]
-                                    
-                                    for file_item in remaining_files:
-                                        f_id = file_item.get('id')
-                                        f_name = file_item.get('name', 'Unknown Audio')
-                                        
-                                        # Use playlist_item_url to create a URL for playlist items
-                                        playlist_item_url = build_url({'mode': 'file', 'file_id': str(f_id)})
-                                        
-                                        # Create list item for this audio file
-                                        li = xbmcgui.ListItem(f_name, path=playlist_item_url)
-                                        music_tag = li.getMusicInfoTag()
-                                        music_tag.setTitle(f_name)
-                                        music_tag.setMediaType('song')
-                                        
-                                        li.setArt({
-                                            'icon': 'DefaultAudio.png',
-                                            'thumb': 'DefaultAudio.png'
-                                        })
-                                        
-                                        # Add to playlist
-                                        playlist.add(playlist_item_url, li)
-                                    
-                                    log(f"Created music playlist with {len(audio_files)} items", xbmc.LOGINFO)
-                                                
-                            # Set resolved URL and play directly
-                            log("Resolving  download/view audio API URL for playback", xbmc.LOGWARNING)
-                            xbmcplugin.setResolvedUrl(addon_handle, True, current_li)
-                            return
-                    else:
-                        # Handle failure case - no URL from  audio API
-                        log("FAILED: audio API returned no URL", xbmc.LOGERROR)
-                        li = xbmcgui.ListItem()
-                        xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                        log("No audio URL returned from alternative API", xbmc.LOGERROR)
-                        show_auto_close_notification(addonname, "Failed to get audio URL from both APIs. Please try again.")
-                else:
-                    # Handle failure case - both audio APIs failed
-                    log("FAILED: Both primary and alternative audio APIs failed", xbmc.LOGERROR)
-                    log(f"Alternative audio API error details: {audio_data}", xbmc.LOGERROR)
-                    li = xbmcgui.ListItem()
-                    xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                    log("Both audio APIs failed", xbmc.LOGERROR)
-                    show_auto_close_notification(addonname, "Failed to get audio URL from both APIs. Please try again.")
-            elif data.get('is_image', False):
-                # Handle image files - directly use ShowPicture
-                log("Handling image file", xbmc.LOGINFO)
-                log(f"File ID: {file_id}", xbmc.LOGINFO)
-                log(f"File name: {data.get('name', 'Unknown')}", xbmc.LOGINFO)
-                
-                # Check if this is a PDF file
-                file_name = data.get('name', '').lower()
-                is_pdf = file_name.endswith('.pdf')
-                
-                if is_pdf:
-                    log(f"File is a PDF document: {file_name}", xbmc.LOGINFO)
-                    # For PDFs, we'll try to display the presentation image
-                    image_url = None
-                    
-                    # First search for the file in the folder contents or root
-                    folder_data = None
-                    if 'folder_id' in data:
-                        folder_id = data.get('folder_id')
-                        log(f"Searching for PDF image in folder ID: {folder_id}", xbmc.LOGINFO)
-                        folder_data = call_api(f'/api/v0.1/p/fs/folder/{folder_id}/contents', settings['access_token'])
-                    else:
-                        log("Searching for PDF image in root folder", xbmc.LOGINFO)
-                        folder_data = call_api('/api/v0.1/p/fs/root/contents', settings['access_token'])
-                    
-                    # Find the file in the folder data
-                    if folder_data and 'files' in folder_data:
-                        log(f"Found {len(folder_data['files'])} files in folder", xbmc.LOGINFO)
-                        for file_item in folder_data['files']:
-                            if file_item.get('id') == int(file_id):
-                                log(f"Found matching file in folder: {file_item.get('name')}", xbmc.LOGINFO)
-                                log(f"File data: {file_item}", xbmc.LOGINFO)
-                                
-                                # Check for presentation URLs
-                                if 'presentation_urls' in file_item and isinstance(file_item['presentation_urls'], dict):
-                                    log("Found presentation_urls in folder data", xbmc.LOGINFO)
-                                    if 'image' in file_item['presentation_urls'] and isinstance(file_item['presentation_urls']['image'], dict):
-                                        image_urls = file_item['presentation_urls']['image']
-                                        log(f"Found image URLs in folder data: {image_urls}", xbmc.LOGINFO)
-                                        
-                                        # Try to get the highest resolution
-                                        if '720' in image_urls:
-                                            image_url = image_urls['720']
-                                            log(f"Selected 720p image: {image_url}", xbmc.LOGINFO)
-                                        elif '220' in image_urls:
-                                            image_url = image_urls['220']
-                                            log(f"Selected 220p image: {image_url}", xbmc.LOGINFO)
-                                        elif '64' in image_urls:
-                                            image_url = image_urls['64']
-                                            log(f"Selected 64p image: {image_url}", xbmc.LOGINFO)
-                                        elif '48' in image_urls:
-                                            image_url = image_urls['48']
-                                            log(f"Selected 48p image: {image_url}", xbmc.LOGINFO)
-                                
-                                # Also check for thumb
-                                if not image_url and 'thumb' in file_item:
-                                    image_url = file_item['thumb']
-                                    log(f"Using thumb URL from folder data: {image_url}", xbmc.LOGINFO)
-                    
-                    # Fallback to regular paths
-                    if not image_url:
-                        log("No image URL found in folder data, checking file data directly", xbmc.LOGINFO)
-                        
-                        # Check for presentation URLs in the file data
-                        if 'presentation_urls' in data and isinstance(data['presentation_urls'], dict):
-                            log("Found presentation_urls in file data", xbmc.LOGINFO)
-                            if 'image' in data['presentation_urls'] and isinstance(data['presentation_urls']['image'], dict):
-                                image_urls = data['presentation_urls']['image']
-                                log(f"Found image URLs in file data: {image_urls}", xbmc.LOGINFO)
-                                
-                                # Try to get the highest resolution
-                                if '720' in image_urls:
-                                    image_url = image_urls['720']
-                                    log(f"Selected 720p image from file data: {image_url}", xbmc.LOGINFO)
-                                elif '220' in image_urls:
-                                    image_url = image_urls['220']
-                                    log(f"Selected 220p image from file data: {image_url}", xbmc.LOGINFO)
-                                elif '64' in image_urls:
-                                    image_url = image_urls['64']
-                                    log(f"Selected 64p image from file data: {image_url}", xbmc.LOGINFO)
-                                elif '48' in image_urls:
-                                    image_url = image_urls['48']
-                                    log(f"Selected 48p image from file data: {image_url}", xbmc.LOGINFO)
-                        
-                        # Fallback to thumb in file data
-                        if not image_url and 'thumb' in data:
-                            image_url = data['thumb']
-                            log(f"Using thumb URL from file data: {image_url}", xbmc.LOGINFO)
-                    
-                    if image_url:
-                        log(f"Final PDF preview image URL for ShowPicture: {image_url}", xbmc.LOGINFO)
-                        
-                        # Create a proper ListItem to avoid "unplayable item" error
-                        li = xbmcgui.ListItem(path=image_url)
-                        li.setInfo('video', {'title': data.get('name', 'Unknown PDF')})
-                        li.setArt({
-                            'icon': image_url,
-                            'thumb': image_url,
-                            'poster': image_url,
-                            'fanart': image_url
-                        })
-                        
-                        # Set MIME type for the image
-                        li.setMimeType('image/jpeg')  # Default for preview images
-                        
-                        # First set the resolved URL with TRUE to avoid error messages
-                        log("Setting resolved URL with proper ListItem for PDF preview", xbmc.LOGINFO)
-                        xbmcplugin.setResolvedUrl(addon_handle, True, li)
-                        
-                        # Short delay to allow Kodi to process
-                        xbmc.sleep(200)
-                        
-                        # Direct command to show the picture
-                        cmd = f'ShowPicture({image_url})'
-                        log(f"Executing ShowPicture command for PDF preview: {cmd}", xbmc.LOGINFO)
-                        xbmc.executebuiltin(cmd)
-                        log("ShowPicture command executed for PDF preview", xbmc.LOGINFO)
-                        return
-                    else:
-                        # If we can't get a preview image, show a notification
-                        log("No preview image found for PDF file", xbmc.LOGERROR)
-                        li = xbmcgui.ListItem()
-                        xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                        show_auto_close_notification(addonname, "Cannot display PDF preview. No preview image available.")
-                        return
-                else:
-                    # We need to get the original file listing to access the presentation URLs
-                    image_url = None
-                    
-                    # First search for the file in the folder contents or root
-                    folder_data = None
-                    if 'folder_id' in data:
-                        folder_id = data.get('folder_id')
-                        log(f"Searching for image in folder ID: {folder_id}", xbmc.LOGINFO)
-                        folder_data = call_api(f'/api/v0.1/p/fs/folder/{folder_id}/contents', settings['access_token'])
-                    else:
-                        log("Searching for image in root folder", xbmc.LOGINFO)
-                        folder_data = call_api('/api/v0.1/p/fs/root/contents', settings['access_token'])
-                    
-                    # Find the file in the folder data
-                    if folder_data and 'files' in folder_data:
-                        log(f"Found {len(folder_data['files'])} files in folder", xbmc.LOGINFO)
-                        for file_item in folder_data['files']:
-                            if file_item.get('id') == int(file_id):
-                                log(f"Found matching file in folder: {file_item.get('name')}", xbmc.LOGINFO)
-                                log(f"File data: {file_item}", xbmc.LOGINFO)
-                                
-                                # Check for presentation URLs
-                                if 'presentation_urls' in file_item and isinstance(file_item['presentation_urls'], dict):
-                                    log("Found presentation_urls in folder data", xbmc.LOGINFO)
-                                    if 'image' in file_item['presentation_urls'] and isinstance(file_item['presentation_urls']['image'], dict):
-                                        image_urls = file_item['presentation_urls']['image']
-                                        log(f"Found image URLs in folder data: {image_urls}", xbmc.LOGINFO)
-                                        
-                                        # Try to get the highest resolution
-                                        if '720' in image_urls:
-                                            image_url = image_urls['720']
-                                            log(f"Selected 720p image: {image_url}", xbmc.LOGINFO)
-                                        elif '220' in image_urls:
-                                            image_url = image_urls['220']
-                                            log(f"Selected 220p image: {image_url}", xbmc.LOGINFO)
-                                        elif '64' in image_urls:
-                                            image_url = image_urls['64']
-                                            log(f"Selected 64p image: {image_url}", xbmc.LOGINFO)
-                                        elif '48' in image_urls:
-                                            image_url = image_urls['48']
-                                            log(f"Selected 48p image: {image_url}", xbmc.LOGINFO)
-                            
-                                # Also check for thumb
-                                if not image_url and 'thumb' in file_item:
-                                    image_url = file_item['thumb']
-                                    log(f"Using thumb URL from folder data: {image_url}", xbmc.LOGINFO)
+            # Find the index of the current file in the list
+            current_file_index = next((i for i, e in enumerate(audio_files) if e.id == int(file_id)), -1)
+            
+            if current_file_index >= 0:
+                # Create a new playlist for this folder
+                playlist = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
+                playlist.clear()  # Clear any existing playlist
                 
-                    # Fallback to regular paths
-                    if not image_url:
-                        log("No image URL found in folder data, checking file data directly", xbmc.LOGINFO)
-                        
-                        # Check for presentation URLs in the file data
-                        if 'presentation_urls' in data and isinstance(data['presentation_urls'], dict):
-                            log("Found presentation_urls in file data", xbmc.LOGINFO)
-                            if 'image' in data['presentation_urls'] and isinstance(data['presentation_urls']['image'], dict):
-                                image_urls = data['presentation_urls']['image']
-                                log(f"Found image URLs in file data: {image_urls}", xbmc.LOGINFO)
-                                
-                                # Try to get the highest resolution
-                                if '720' in image_urls:
-                                    image_url = image_urls['720']
-                                    log(f"Selected 720p image from file data: {image_url}", xbmc.LOGINFO)
-                                elif '220' in image_urls:
-                                    image_url = image_urls['220']
-                                    log(f"Selected 220p image from file data: {image_url}", xbmc.LOGINFO)
-                                elif '64' in image_urls:
-                                    image_url = image_urls['64']
-                                    log(f"Selected 64p image from file data: {image_url}", xbmc.LOGINFO)
-                                elif '48' in image_urls:
-                                    image_url = image_urls['48']
-                                    log(f"Selected 48p image from file data: {image_url}", xbmc.LOGINFO)
-                        
-                        # Fallback to thumb in file data
-                        if not image_url and 'thumb' in data:
-                            image_url = data['thumb']
-                            log(f"Using thumb URL from file data: {image_url}", xbmc.LOGINFO)
+                # Put the current file first in the playlist
+                playlist.add(url, current_li)
                 
-                if image_url:
-                    log(f"Final image URL for ShowPicture: {image_url}", xbmc.LOGINFO)
-                    
-                    # Create a proper ListItem to avoid "unplayable item" error
-                    li = xbmcgui.ListItem(path=image_url)
-                    li.setInfo('video', {'title': data.get('name', 'Unknown Image')})
+                # Add the remaining files in order, after the current one
+                for audio_file in audio_files[current_file_index+1:] + audio_files[:current_file_index]:
+                    if not audio_file.folder_id:
+                        audio_file.folder_id = entry.folder_id
+                    playlist_item_url = file_url(audio_file)
+                    li = xbmcgui.ListItem(audio_file.name, path=playlist_item_url)
+                    music_tag = li.getMusicInfoTag()
+                    music_tag.setTitle(audio_file.name)
+                    music_tag.setMediaType('song')
                     li.setArt({
-                        'icon': image_url,
-                        'thumb': image_url,
-                        'poster': image_url,
-                        'fanart': image_url
+                        'icon': 'DefaultAudio.png',
+                        'thumb': 'DefaultAudio.png'
                     })
-                    
-                    # Set MIME type for the image
-                    if image_url.lower().endswith('.jpg') or image_url.lower().endswith('.jpeg'):
-                        li.setMimeType('image/jpeg')
-                    elif image_url.lower().endswith('.png'):
-                        li.setMimeType('image/png')
-                    elif image_url.lower().endswith('.gif'):
-                        li.setMimeType('image/gif')
-                    else:
-                        li.setMimeType('image/jpeg')  # default
-                    
-                    # First set the resolved URL with TRUE to avoid error messages
-                    log("Setting resolved URL with proper ListItem", xbmc.LOGINFO)
-                    xbmcplugin.setResolvedUrl(addon_handle, True, li)
-                    
-                    # Short delay to allow Kodi to process
-                    xbmc.sleep(200)
-                    
-                    # Direct command to show the picture
-                    cmd = f'ShowPicture({image_url})'
-                    log(f"Executing ShowPicture command: {cmd}", xbmc.LOGINFO)
-                    xbmc.executebuiltin(cmd)
-                    log("ShowPicture command executed", xbmc.LOGINFO)
-                else:
-                    # If we get here, we couldn't get an image URL
-                    log("No image URL found in data", xbmc.LOGERROR)
-                    li = xbmcgui.ListItem()
-                    xbmcplugin.setResolvedUrl(addon_handle, False, li)
-                    show_auto_close_notification(addonname, "Failed to display image. Please try again.")
+                    playlist.add(playlist_item_url, li)
+                
+                log(f"Created music playlist with {len(audio_files)} items", xbmc.LOGINFO)
+        
+        log("Resolving download/view audio API URL for playback", xbmc.LOGWARNING)
+        resolve_playback(current_li)
+        return None
+    
+    # Images and PDF previews are shown with ShowPicture. Listings carry the
+    # presentation URLs; without one the folder contents are searched for it.
+    log(f"Handling {entry.kind} file: {entry.name}", xbmc.LOGINFO)
+    image_url = entry.thumbnail
+    if not image_url:
+        folder_file = find_folder_file(entry.folder_id, file_id)
+        if folder_file is not None:
+            entry = folder_file
+            image_url = folder_file.thumbnail
+    
+    if not image_url:
+        log(f"No image URL found for {entry.name}", xbmc.LOGERROR)
+        if entry.kind == entries.KIND_PDF:
+            return "Cannot display PDF preview. No preview image available."
+        return "Failed to display image. Please try again."
+    
+    log(f"Final image URL for ShowPicture: {image_url}", xbmc.LOGINFO)
+    
+    # Create a proper ListItem to avoid "unplayable item" error
+    li = xbmcgui.ListItem(path=image_url)
+    li.setInfo('video', {'title': entry.name})
+    # The picture itself is shown at full size; only the art follows the device profile
+    li.setArt(entries.select_art(entry, get_art_profile()))
+    li.setMimeType(entries.image_mime_type(image_url))
+    
+    # First set the resolved URL with TRUE to avoid error messages
+    resolve_playback(li)
+    
+    # Short delay to allow Kodi to process
+    xbmc.sleep(200)
+    
+    # Direct command to show the picture
+    xbmc.executebuiltin(f'ShowPicture({image_url})')
+    log("ShowPicture command executed", xbmc.LOGINFO)
+    return None
+
+def handle_playback(mode, args, settings, addon_handle):
+    if mode and mode[0] == 'file':
+        file_id = args['file_id'][0]
+
+        # Listings cache what playback needs, which saves the file details call
+        entry = entries.decode_meta(file_id, home_cache.get('file', str(file_id)))
+        if entry is not None:
+            log(f"Using cached file metadata for ID: {file_id}", xbmc.LOGINFO)
+            failure = resolve_entry(entry, file_id)
+            run_metrics.record_cache('file_metadata', failure is None)
+            if failure is None:
+                remember_played(entry)
+                return
+            # The metadata may be stale (file moved or changed), so retry with fresh details
+            log(f"Playback from cached metadata failed: {failure}", xbmc.LOGWARNING)
+            home_cache.delete('file', str(file_id))
         else:
-            li = xbmcgui.ListItem()
-            xbmcplugin.setResolvedUrl(addon_handle, False, li)
+            run_metrics.record_cache('file_metadata', False)
+
+        log(f"Fetching file details with ID: {file_id}", xbmc.LOGINFO)
+        data = client.file_details(file_id)
+        log(f"Full file details response for ID {file_id}: {data}", xbmc.LOGINFO)
+        
+        entry = entries.file_entry(data) if data and not data.get('error') else None
+        if entry is None:
             log(f"Failed to get file details: {data}", xbmc.LOGERROR)
-            show_auto_close_notification(addonname, "Failed to get file details. Please try again.")
+            fail_playback("Failed to get file details. Please try again.")
+            return
+
+        failure = resolve_entry(entry, file_id)
+        if failure is not None:
+            log(f"FAILED: {failure}", xbmc.LOGERROR)
+            fail_playback(failure)
+            return
+        remember_played(entry)
         return
 
 # Main execution flow
@@ -1420,256 +2019,172 @@ success = False
 max_retries = 2
 retries = 0
 
-if mode and mode[0] == 'file':
-    handle_playback(mode, args, settings, addon_handle)
-else:
-    while not success and retries < max_retries:
-        if 'access_token' not in settings:
-            if not get_access_token():
-                break
-        
-        if 'access_token' in settings:
-            if mode is None:
-                log("Fetching root folder contents")
-                data = call_api('/api/v0.1/p/fs/root/contents', settings['access_token'])
-            elif mode[0] == 'folder':
-                folder_id = args['folder_id'][0]
-                log(f"Fetching folder contents with ID: {folder_id}")
-                data = call_api(f'/api/v0.1/p/fs/folder/{folder_id}/contents', settings['access_token'])
-            
-            if data is None:
-                # Token is invalid, retry with new token
-                retries += 1
-                continue
+try:
+    if mode and mode[0] == 'file':
+        handle_playback(mode, args, settings, addon_handle)
+    elif mode and mode[0] == 'search':
+        handle_search(args)
+    elif mode and mode[0] == 'reindex':
+        handle_reindex()
+    elif mode and mode[0] == 'sync':
+        handle_reindex(full=False)
+    elif mode and mode[0] == 'library':
+        handle_library(args)
+    elif mode and mode[0] == 'export':
+        handle_export()
+    elif mode and mode[0] == 'widget':
+        handle_widget(args)
+    elif mode and mode[0] == 'refresh':
+        handle_refresh()
+    elif mode and mode[0] == 'diagnostics':
+        handle_diagnostics(args)
+    else:
+        mirror_fetched_at = None
+        while not success and retries < max_retries:
+            listing_folder_id = ROOT_FOLDER_ID if mode is None else int(args['folder_id'][0])
+            # Folders fetched moments ago (going back up, paging through) are still in memory
+            data = home_cache.get('listing', str(listing_folder_id))
+            listing_cached = data is not None
+            run_metrics.record_cache('window_listing', listing_cached)
+            if listing_cached:
+                log(f"Folder {listing_folder_id} served from window cache")
+                success = True
+            elif addon.getSettingBool('offline_mode'):
+                # Offline mode browses the mirror and only goes online for unmirrored folders
+                data, mirror_fetched_at = load_listing(listing_folder_id)
+                run_metrics.record_cache('catalog_mirror', data is not None)
+                if data is not None:
+                    log(f"Browsing folder {listing_folder_id} from catalog mirror")
+                    success = True
+
+            if not success and 'access_token' not in settings:
+                if not get_access_token():
+                    break
+        
+            if success or 'access_token' in settings:
+                if not success:
+                    if mode is None:
+                        log("Fetching root folder contents")
+                        data = client.root_contents()
+                    elif mode[0] == 'folder':
+                        folder_id = args['folder_id'][0]
+                        log(f"Fetching folder contents with ID: {folder_id}")
+                        data = client.folder_contents(folder_id)
+
+                    if data is None and 'access_token' in settings:
+                        # Tokens are still there, so this was a network failure rather than an auth one
+                        data, mirror_fetched_at = load_listing(listing_folder_id)
+                        run_metrics.record_cache('catalog_mirror', data is not None)
+                        if data is not None:
+                            log(f"API unreachable, browsing folder {listing_folder_id} from catalog mirror", xbmc.LOGWARNING)
+
+                if data is None:
+                    # Token is invalid, retry with new token
+                    retries += 1
+                    continue
                 
-            if 'error' in data:
-                # Clear token and retry
-                if 'access_token' in settings:
-                    del settings['access_token']
-                save_dict(settings, data_file)
-                retries += 1
-                continue
+                if 'error' in data:
+                    # Clear token and retry
+                    if 'access_token' in settings:
+                        del settings['access_token']
+                    settings.save()
+                    retries += 1
+                    continue
                 
-            # If we got here, we have valid data
-            success = True
-            log("Successfully retrieved data from API")
+                # If we got here, we have valid data
+                success = True
+                if mirror_fetched_at is None and not listing_cached:
+                    log("Successfully retrieved data from API")
+                    update_index(listing_folder_id, data)
+                    cache_listing(listing_folder_id, data)
             
-            # Log the data structure for debugging
-            log(f"Data structure: {type(data)}")
-            log(f"Folders type: {type(data.get('folders'))}")
-            log(f"Files type: {type(data.get('files'))}")
+                # '..' leads above any levels skipped below, and never descends again
+                listing_parent = data.get('parent', -1)
+                if mode is not None and args.get('descend', ['1'])[0] != '0':
+                    listing_folder_id, data, mirror_fetched_at = descend_single_folders(
+                        listing_folder_id, data, mirror_fetched_at)
             
-            folders = data.get('folders', [])
-            files = data.get('files', [])
-            log(f"Found {len(folders)} folders and {len(files)} files")
-
-            # Add parent folder if not in root
-            if data.get('parent', -1) != -1:
-                parent_url = build_url({'mode': 'folder', 'folder_id': data['parent']})
-                parent_li = xbmcgui.ListItem('..')
-                parent_li.setArt({'icon':'DefaultFolder.png'})
-                xbmcplugin.addDirectoryItem(handle=addon_handle, url=parent_url,
-                                          listitem=parent_li, isFolder=True)
-
-            # Add folders
-            for folder in folders:
-                try:
-                    if isinstance(folder, dict):
-                        folder_id = folder.get('id')
-                        folder_path = folder.get('path', 'Unknown Folder')
-                        if folder_id:
-                            url = build_url({'mode': 'folder', 'folder_id': folder_id})
-                            li = xbmcgui.ListItem(folder_path)
-                            li.setArt({'icon':'DefaultFolder.png'})
-                            # Add folder size if available
-                            if folder.get('size', 0) > 0:
-                                size_str = f" ({folder['size'] / (1024*1024):.1f} MB)"
-                                li.setLabel(folder_path + size_str)
-                            li.addContextMenuItems([(__language__(id=32006), 'Container.Refresh'),
-                                                  (__language__(id=32007), 'Action(ParentDir)')])
-                            xbmcplugin.addDirectoryItem(handle=addon_handle, url=url,
-                                                      listitem=li, isFolder=True)
-                except Exception as e:
-                    log(f"Error processing folder: {str(e)}", xbmc.LOGERROR)
-                    continue
+                # Log the data structure for debugging
+                log(f"Data structure: {type(data)}")
+                log(f"Folders type: {type(data.get('folders'))}")
+                log(f"Files type: {type(data.get('files'))}")
+            
+                folders = data.get('folders', [])
+                files = data.get('files', [])
+                log(f"Found {len(folders)} folders and {len(files)} files")
+
+                # Large folders are shown a page at a time; snapshot views only decode the page shown
+                page = int(args.get('page', ['0'])[0])
+                page_start = page * LISTING_PAGE_SIZE
+                page_end = page_start + LISTING_PAGE_SIZE
+                has_next_page = len(folders) + len(files) > page_end
+                files = files[max(0, page_start - len(folders)):max(0, page_end - len(folders))]
+                folders = folders[page_start:page_end]
+
+                # Add parent folder if not in root
+                if listing_parent != -1:
+                    parent_url = build_url({'mode': 'folder', 'folder_id': listing_parent, 'descend': 0})
+                    parent_li = xbmcgui.ListItem('..')
+                    parent_li.setArt({'icon':'DefaultFolder.png'})
+                    xbmcplugin.addDirectoryItem(handle=addon_handle, url=parent_url,
+                                              listitem=parent_li, isFolder=True)
+
+                # Show how old the data is when browsing the mirror; selecting it syncs
+                if mirror_fetched_at is not None:
+                    age = format_age(time.time() - mirror_fetched_at)
+                    xbmcplugin.setPluginCategory(addon_handle, __language__(32206) % age)
+                    offline_li = xbmcgui.ListItem(f"[COLOR yellow]{__language__(32206) % age}[/COLOR]")
+                    offline_li.setArt({'icon': 'DefaultIconWarning.png'})
+                    xbmcplugin.addDirectoryItem(handle=addon_handle, url=build_url({'mode': 'sync'}),
+                                              listitem=offline_li, isFolder=False)
 
-            # Add files
-            for f in files:
-                try:
-                    if not isinstance(f, dict):
-                        log(f"Skipping non-dictionary file: {f}")
+                # Add search entry at the root
+                if mode is None and page == 0:
+                    search_li = xbmcgui.ListItem(__language__(32200))
+                    search_li.setArt({'icon': 'DefaultAddonsSearch.png'})
+                    search_li.addContextMenuItems([(__language__(32207), f"RunPlugin({build_url({'mode': 'sync'})})"),
+                                                   (__language__(32202), f"RunPlugin({build_url({'mode': 'reindex'})})")])
+                    xbmcplugin.addDirectoryItem(handle=addon_handle, url=build_url({'mode': 'search'}),
+                                              listitem=search_li, isFolder=True)
+
+                    # Virtual libraries across the whole account
+                    for library, label_id, icon in (('videos', 32210, 'DefaultMovies.png'),
+                                                    ('music', 32211, 'DefaultMusicSongs.png'),
+                                                    ('recent', 32212, 'DefaultRecentlyAddedMovies.png')):
+                        library_li = xbmcgui.ListItem(__language__(label_id))
+                        library_li.setArt({'icon': icon})
+                        xbmcplugin.addDirectoryItem(handle=addon_handle,
+                                                  url=build_url({'mode': 'library', 'library': library}),
+                                                  listitem=library_li, isFolder=True)
+
+                # Normalise only the page being shown, then render folders followed by files
+                folder_entries, file_entries = entries.listing_entries(folders, files, listing_folder_id)
+                for entry in folder_entries + file_entries:
+                    try:
+                        log(f"Adding {entry.kind} item: {entry.name} (ID: {entry.id})")
+                        add_entry_item(entry)
+                    except Exception as e:
+                        log(f"Error processing {entry.kind} {entry.id}: {str(e)}", xbmc.LOGERROR)
                         continue
-                    
-                    file_name = f.get('name', 'Unknown File')
-                    file_id = f.get('id', 'Unknown ID')
-                    log(f"Processing file: {file_name} (ID: {file_id})", xbmc.LOGINFO)
-                    
-                    # Check if it's a media file or has presentation URLs
-                    is_video = f.get('is_video', False)
-                    is_audio = f.get('is_audio', False)
-                    file_ext = file_name.lower()
-                    is_image = (not is_video and not is_audio and 
-                               (file_ext.endswith('.jpg') or file_ext.endswith('.jpeg') or 
-                                file_ext.endswith('.png') or file_ext.endswith('.gif')))
-                    is_subtitle = file_ext.endswith('.srt')
-                    is_pdf = file_ext.endswith('.pdf')
-                    
-                    if is_image:
-                        log(f"File is an image: {file_name}", xbmc.LOGINFO)
-                    elif is_video:
-                        log(f"File is a video: {file_name}", xbmc.LOGINFO)
-                    elif is_audio:
-                        log(f"File is audio: {file_name}", xbmc.LOGINFO)
-                    elif is_subtitle:
-                        log(f"File is a subtitle: {file_name}", xbmc.LOGINFO)
-                    elif is_pdf:
-                        log(f"File is a PDF document: {file_name}", xbmc.LOGINFO)
-                    
-                    # Check for presentation URLs
-                    presentation_urls = f.get('presentation_urls', {})
-                    has_presentation = isinstance(presentation_urls, dict) and 'image' in presentation_urls
-                    has_thumb = 'thumb' in f and f['thumb']
-                    
-                    if has_presentation:
-                        log(f"File has presentation URLs: {file_name}", xbmc.LOGINFO)
-                    if has_thumb:
-                        log(f"File has thumb URL: {file_name}", xbmc.LOGINFO)
-                    
-                    if is_video or is_audio or is_image or has_presentation or has_thumb or is_subtitle or is_pdf:
-                        file_id = f.get('id')
-                        if not file_id:
-                            log(f"Skipping file without ID: {file_name}", xbmc.LOGWARNING)
-                            continue
-                            
-                        url = build_url({'mode': 'file', 'file_id': file_id})
-                        log(f"Built URL for file: {url}", xbmc.LOGINFO)
-                        li = xbmcgui.ListItem(file_name)
-                        
-                        # Add file size if available
-                        if f.get('size', 0) > 0:
-                            size_str = f" ({f['size'] / (1024*1024):.1f} MB)"
-                            li.setLabel(file_name + size_str)
-                        
-                        # Get thumbnail URL directly (prioritize high resolution)
-                        thumbnail = None
-                        if has_presentation:
-                            image_urls = presentation_urls.get('image', {})
-                            log(f"Available presentation URLs for {file_name}: {image_urls}", xbmc.LOGINFO)
-                            if isinstance(image_urls, dict):
-                                if '720' in image_urls:
-                                    thumbnail = image_urls['720']
-                                    log(f"Using 720p image for {file_name}: {thumbnail}", xbmc.LOGINFO)
-                                elif '220' in image_urls:
-                                    thumbnail = image_urls['220']
-                                    log(f"Using 220p image for {file_name}: {thumbnail}", xbmc.LOGINFO)
-                                elif '64' in image_urls:
-                                    thumbnail = image_urls['64']
-                                    log(f"Using 64p image for {file_name}: {thumbnail}", xbmc.LOGINFO)
-                                elif '48' in image_urls:
-                                    thumbnail = image_urls['48']
-                                    log(f"Using 48p image for {file_name}: {thumbnail}", xbmc.LOGINFO)
-                        elif has_thumb:
-                            thumbnail = f['thumb']
-                            log(f"Using thumb URL for {file_name}: {thumbnail}", xbmc.LOGINFO)
-                            
-                        # Set appropriate icon and info based on content type
-                        if is_video:
-                            li.setInfo('video', infoLabels={'title': file_name})
-                            if thumbnail:
-                                li.setArt({
-                                    'icon': thumbnail,
-                                    'thumb': thumbnail
-                                })
-                            else:
-                                # Set default video icon when no thumbnail is available
-                                li.setArt({
-                                    'icon': 'DefaultVideo.png',
-                                    'thumb': 'DefaultVideo.png'
-                                })
-                        elif is_audio:
-                            li.setInfo('music', infoLabels={'title': file_name})
-                            li.setArt({
-                                'icon': 'DefaultAudio.png',
-                                'thumb': 'DefaultAudio.png'
-                            })
-                        elif is_subtitle:
-                            # Handle subtitle files (SRT)
-                            li.setInfo('video', infoLabels={'title': file_name})
-                            li.setMimeType('text/plain')
-                            li.setArt({
-                                'icon': 'DefaultFile.png',
-                                'thumb': 'DefaultFile.png'
-                            })
-                        elif is_pdf:
-                            # Handle PDF files
-                            li.setInfo('video', infoLabels={'title': file_name})
-                            li.setMimeType('image/jpeg')  # Treat as image
-                            # Use thumbnail if available, or default to file icon
-                            if thumbnail:
-                                li.setArt({
-                                    'icon': thumbnail,
-                                    'thumb': thumbnail,
-                                    'poster': thumbnail,
-                                    'fanart': thumbnail
-                                })
-                            else:
-                                li.setArt({
-                                    'icon': 'DefaultPicture.png',
-                                    'thumb': 'DefaultPicture.png'
-                                })
-                            # PDF files should be displayed as images
-                            li.setProperty('IsPlayable', 'True')
-                        else:
-                            # Handle image files (using video type since picture is not valid)
-                            li.setInfo('video', infoLabels={'title': file_name})
-                            log(f"Setting image info for {file_name}", xbmc.LOGINFO)
-                            
-                            # Set appropriate MIME type for display
-                            if file_ext.endswith('.jpg') or file_ext.endswith('.jpeg'):
-                                li.setMimeType('image/jpeg')
-                                log("Setting MIME type: image/jpeg", xbmc.LOGINFO)
-                            elif file_ext.endswith('.png'):
-                                li.setMimeType('image/png')
-                                log("Setting MIME type: image/png", xbmc.LOGINFO)
-                            elif file_ext.endswith('.gif'):
-                                li.setMimeType('image/gif')
-                                log("Setting MIME type: image/gif", xbmc.LOGINFO)
-                            else:
-                                li.setMimeType('image/jpeg')  # default
-                                log("Setting default MIME type: image/jpeg", xbmc.LOGINFO)
-                            
-                            # Set the thumbnail if available
-                            if thumbnail:
-                                log(f"Setting art for {file_name} with thumbnail: {thumbnail}", xbmc.LOGINFO)
-                                li.setArt({
-                                    'icon': thumbnail,
-                                    'thumb': thumbnail,
-                                    'poster': thumbnail,
-                                    'fanart': thumbnail
-                                })
-                            else:
-                                log(f"No thumbnail available for {file_name}, using default", xbmc.LOGINFO)
-                                li.setArt({
-                                    'icon': 'DefaultPicture.png',
-                                    'thumb': 'DefaultPicture.png'
-                                })
-
-                        # Don't set subtitles as playable
-                        if not is_subtitle:
-                            li.setProperty('IsPlayable', 'True')
-                            log(f"Setting IsPlayable=True for {file_name}", xbmc.LOGINFO)
-                        
-                        li.addContextMenuItems([(__language__(id=32006), 'Container.Refresh'),
-                                              (__language__(id=32007), 'Action(ParentDir)')])
-                        log(f"Adding directory item for {file_name}", xbmc.LOGINFO)
-                        xbmcplugin.addDirectoryItem(handle=addon_handle, url=url, listitem=li)
-                except Exception as e:
-                    log(f"Error processing file: {str(e)}", xbmc.LOGERROR)
-                    continue
 
-    if success:
-        xbmcplugin.addSortMethod(addon_handle, xbmcplugin.SORT_METHOD_FILE)
-        xbmcplugin.endOfDirectory(addon_handle)
-    else:
-        xbmcgui.Dialog().ok(addonname, "Failed to load content. Please try again.")
+                if has_next_page:
+                    next_query = {'page': page + 1}
+                    if mode is not None:
+                        next_query.update({'mode': 'folder', 'folder_id': listing_folder_id})
+                    next_li = xbmcgui.ListItem(__language__(32214) % (page + 2))
+                    next_li.setArt({'icon': 'DefaultFolder.png'})
+                    xbmcplugin.addDirectoryItem(handle=addon_handle, url=build_url(next_query),
+                                              listitem=next_li, isFolder=True)
 
+        if success:
+            xbmcplugin.addSortMethod(addon_handle, xbmcplugin.SORT_METHOD_FILE)
+            xbmcplugin.endOfDirectory(addon_handle)
+        else:
+            xbmcgui.Dialog().ok(addonname, "Failed to load content. Please try again.")
+finally:
+    # Write settings changes, listed file metadata and this invocation's metrics even when a handler failed
+    save_error = settings.flush()
+    store_listed_files()
+    flush_metrics()
+    if save_error:
+        xbmcgui.Dialog().ok(addonname, save_error)
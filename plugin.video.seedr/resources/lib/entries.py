@@ -0,0 +1,193 @@
+"""
+    Normalised folder and file entries
+    API responses, snapshot views and index rows all describe entries with
+    slightly different dicts. Each raw entry is turned once into a slotted
+    Entry carrying only what the UI and playback need, so classification
+    and thumbnail selection live here instead of at every call site.
+"""
+
+import base64
+import json
+
+# Presentation image sizes from best to worst
+IMAGE_SIZES = ('720', '220', '64', '48')
+
+# Preferred presentation image sizes for each art slot, per device profile.
+# Small list thumbnails don't need the 720px variant, and low-RAM devices skip fanart.
+ART_PROFILES = {
+    'low': {'icon': ('48', '64', '220'), 'thumb': ('64', '220', '48'),
+            'poster': ('220', '64'), 'fanart': ()},
+    'standard': {'icon': ('220', '64', '720', '48'), 'thumb': ('220', '720', '64', '48'),
+                 'poster': ('720', '220'), 'fanart': ('720', '220')},
+    'high': {'icon': ('720', '220', '64', '48'), 'thumb': ('720', '220', '64', '48'),
+             'poster': ('720', '220'), 'fanart': ('720', '220')},
+}
+ART_SLOTS = ('icon', 'thumb', 'poster', 'fanart')
+
+IMAGE_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+}
+
+KIND_FOLDER = 'folder'
+KIND_VIDEO = 'video'
+KIND_AUDIO = 'audio'
+KIND_SUBTITLE = 'subtitle'
+KIND_PDF = 'pdf'
+KIND_IMAGE = 'image'
+KIND_OTHER = 'other'
+
+# Version of the metadata carried in file URLs; older URLs fall back to the details call
+META_VERSION = 1
+_META_KINDS = (KIND_VIDEO, KIND_AUDIO, KIND_SUBTITLE, KIND_PDF, KIND_IMAGE, KIND_OTHER)
+# Kinds whose playback shows the thumbnail itself, so it is worth carrying
+_META_THUMBNAIL_KINDS = (KIND_PDF, KIND_IMAGE, KIND_OTHER)
+
+def best_image_url(image_urls):
+    """Highest resolution presentation image (720 > 220 > 64 > 48), or None"""
+    if not isinstance(image_urls, dict):
+        return None
+    for size in IMAGE_SIZES:
+        url = image_urls.get(size)
+        if url:
+            return url
+    return None
+
+def select_art(entry, profile, slots=ART_SLOTS):
+    """Art for the given slots under a device profile. Each slot gets its preferred
+    presentation size; entries that only know one thumbnail (index rows, cached metadata)
+    use it for every slot the profile fills."""
+    preferences = ART_PROFILES.get(profile, ART_PROFILES['standard'])
+    art = {}
+    for slot in slots:
+        sizes = preferences[slot]
+        if not sizes:
+            continue
+        url = None
+        if entry.images:
+            url = next((entry.images[size] for size in sizes if entry.images.get(size)), None)
+        url = url or entry.thumbnail
+        if url:
+            art[slot] = url
+    return art
+
+def image_mime_type(path):
+    """MIME type for an image name or URL, defaulting to JPEG"""
+    path = path.lower()
+    for ext, mime_type in IMAGE_MIME_TYPES.items():
+        if path.endswith(ext):
+            return mime_type
+    return 'image/jpeg'
+
+def classify(name, is_video=False, is_audio=False, is_image=False):
+    """Kind of a file from the API media flags and its extension"""
+    lower_name = name.lower()
+    if is_video:
+        return KIND_VIDEO
+    if is_audio:
+        return KIND_AUDIO
+    if lower_name.endswith('.srt'):
+        return KIND_SUBTITLE
+    if lower_name.endswith('.pdf'):
+        return KIND_PDF
+    if is_image or lower_name.endswith(tuple(IMAGE_MIME_TYPES)):
+        return KIND_IMAGE
+    return KIND_OTHER
+
+class Entry(object):
+    """One folder or file, normalised from whatever source described it"""
+    __slots__ = ('kind', 'id', 'name', 'size', 'folder_id', 'thumbnail', 'images')
+
+    def __init__(self, kind, entry_id, name, size=0, folder_id=None, thumbnail=None, images=None):
+        self.kind = kind
+        self.id = entry_id
+        self.name = name
+        self.size = size
+        self.folder_id = folder_id
+        # Best available image, and every presentation size by name when known
+        self.thumbnail = thumbnail
+        self.images = images
+
+    def __repr__(self):
+        return f"Entry({self.kind!r}, {self.id!r}, {self.name!r})"
+
+    @property
+    def is_folder(self):
+        return self.kind == KIND_FOLDER
+
+    @property
+    def is_playable(self):
+        """Subtitles are opened as text, everything else is resolved for playback"""
+        return self.kind not in (KIND_FOLDER, KIND_SUBTITLE)
+
+    @property
+    def is_listed(self):
+        """Files of unknown type are only worth listing when they have a preview"""
+        return self.kind != KIND_OTHER or bool(self.thumbnail)
+
+def folder_entry(raw):
+    """Entry for a folder from a contents response, or None if unusable"""
+    if not isinstance(raw, dict) or not raw.get('id'):
+        return None
+    return Entry(KIND_FOLDER, raw['id'], raw.get('path') or raw.get('name') or 'Unknown Folder',
+                 raw.get('size') or 0)
+
+def file_entry(raw):
+    """Entry for a file from a contents or file details response, or None if unusable"""
+    if not isinstance(raw, dict) or not raw.get('id'):
+        return None
+    name = raw.get('name') or 'Unknown File'
+    thumbnail = None
+    images = None
+    presentation_urls = raw.get('presentation_urls')
+    if isinstance(presentation_urls, dict) and isinstance(presentation_urls.get('image'), dict):
+        images = dict((size, url) for size, url in presentation_urls['image'].items() if url) or None
+        thumbnail = best_image_url(images)
+    if not thumbnail:
+        thumbnail = raw.get('thumb') or None
+    return Entry(classify(name, raw.get('is_video', False), raw.get('is_audio', False), raw.get('is_image', False)),
+                 raw['id'], name, raw.get('size') or 0, raw.get('folder_id'), thumbnail, images)
+
+def index_entry(row):
+    """Entry for a row of the local index"""
+    if row['kind'] == KIND_FOLDER:
+        return Entry(KIND_FOLDER, row['id'], row['name'], row['size'] or 0, row['parent_id'])
+    return Entry(classify(row['name'], row['is_video'], row['is_audio']),
+                 row['id'], row['name'], row['size'] or 0, row['parent_id'])
+
+def listing_entries(folders, files, folder_id=None):
+    """Normalise one page of a contents response, dropping unusable and unlistable entries.
+    Files without a folder_id are given the id of the folder being listed."""
+    folder_entries = [e for e in (folder_entry(f) for f in folders) if e is not None]
+    file_entries = [e for e in (file_entry(f) for f in files) if e is not None and e.is_listed]
+    if folder_id:
+        for entry in file_entries:
+            if not entry.folder_id:
+                entry.folder_id = folder_id
+    return folder_entries, file_entries
+
+def encode_meta(entry):
+    """Compact encoding of what playback needs to know about a file, including its
+    size for the direct play decision. The thumbnail is only kept for kinds that
+    display it, which keeps the cached metadata of videos and audio small."""
+    fields = [META_VERSION, _META_KINDS.index(entry.kind), entry.name, entry.folder_id or 0, int(entry.size or 0)]
+    if entry.kind in _META_THUMBNAIL_KINDS and entry.thumbnail:
+        fields.append(entry.thumbnail)
+    encoded = json.dumps(fields, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(encoded).decode('ascii').rstrip('=')
+
+def decode_meta(file_id, meta):
+    """Entry for file_id from encode_meta output, or None if missing, malformed or of another version"""
+    if not meta:
+        return None
+    try:
+        fields = json.loads(base64.urlsafe_b64decode(meta + '=' * (-len(meta) % 4)).decode('utf-8'))
+        if not isinstance(fields, list) or len(fields) < 5 or fields[0] != META_VERSION:
+            return None
+        kind = _META_KINDS[fields[1]]
+        thumbnail = fields[5] if len(fields) > 5 else None
+        return Entry(kind, int(file_id), str(fields[2]), int(fields[4]), int(fields[3]) or None, thumbnail)
+    except (ValueError, TypeError, IndexError):
+        return None
@@ -0,0 +1,225 @@
+"""
+    Runtime metrics for the diagnostics view
+    Every invocation records request latencies, errors and transfer sizes per
+    API endpoint, cache hits and misses, counters and playback timings into
+    fixed-size histograms. Recording is a bisect and an increment; nothing
+    touches the disk until save(), which adds this invocation's numbers to
+    the totals persisted by earlier ones.
+
+    Histograms use logarithmic buckets growing by 25% from 1 ms to about
+    two minutes, so percentiles are exact to within one bucket.
+"""
+
+import bisect
+import json
+import math
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+VERSION = 1
+
+# Upper bounds of the latency buckets in milliseconds; one more bucket catches anything slower
+LATENCY_BOUNDS = tuple(1.25 ** i for i in range(53))
+
+_API_PREFIX = '/api/v0.1/p'
+
+def endpoint_name(url):
+    """Endpoint of an API URL with ids replaced, so all folders share one entry"""
+    path = urlparse(url).path
+    if path.startswith(_API_PREFIX):
+        path = path[len(_API_PREFIX):]
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path) or '/'
+
+class Histogram(object):
+    """Fixed-size latency histogram"""
+    __slots__ = ('counts', 'count')
+
+    def __init__(self, counts=None):
+        self.counts = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.count = 0
+        if counts:
+            self.merge(counts)
+
+    def record(self, milliseconds):
+        self.counts[bisect.bisect_left(LATENCY_BOUNDS, milliseconds)] += 1
+        self.count += 1
+
+    def merge(self, counts):
+        for i, n in enumerate(counts[:len(self.counts)]):
+            self.counts[i] += n
+            self.count += n
+
+    def percentile(self, p):
+        """Upper bound in milliseconds of the bucket holding the p-th percentile, or None if empty"""
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BOUNDS[min(i, len(LATENCY_BOUNDS) - 1)]
+        return LATENCY_BOUNDS[-1]
+
+    def to_list(self):
+        """Counts without trailing empty buckets"""
+        end = len(self.counts)
+        while end and not self.counts[end - 1]:
+            end -= 1
+        return self.counts[:end]
+
+class RequestStats(object):
+    """Totals for one API endpoint"""
+    __slots__ = ('errors', 'bytes', 'latency')
+
+    def __init__(self):
+        self.errors = 0
+        self.bytes = 0
+        self.latency = Histogram()
+
+    @property
+    def count(self):
+        return self.latency.count
+
+    @property
+    def error_rate(self):
+        return self.errors / float(self.count) if self.count else 0.0
+
+class Metrics(object):
+    """Metrics of the current invocation, optionally combined with persisted totals.
+    Safe to record from the polling and crawl threads."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.since = int(time.time())
+        self.requests = {}
+        self.counters = {}
+        self.timings = {}
+
+    def __bool__(self):
+        return bool(self.requests or self.counters or self.timings)
+
+    def record_request(self, url, seconds, size=0, error=False):
+        name = endpoint_name(url)
+        with self.lock:
+            stats = self.requests.get(name)
+            if stats is None:
+                stats = self.requests[name] = RequestStats()
+            stats.latency.record(seconds * 1000.0)
+            stats.bytes += size
+            if error:
+                stats.errors += 1
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_cache(self, name, hit):
+        self.increment(f"{name}.{'hit' if hit else 'miss'}")
+
+    def record_timing(self, name, seconds):
+        with self.lock:
+            histogram = self.timings.get(name)
+            if histogram is None:
+                histogram = self.timings[name] = Histogram()
+            histogram.record(seconds * 1000.0)
+
+    def cache_ratio(self, name):
+        """(hits, misses) recorded for a cache"""
+        return self.counters.get(f"{name}.hit", 0), self.counters.get(f"{name}.miss", 0)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'version': VERSION,
+                'since': self.since,
+                'requests': dict((name, {'errors': s.errors, 'bytes': s.bytes, 'latency': s.latency.to_list()})
+                                 for name, s in self.requests.items()),
+                'counters': dict(self.counters),
+                'timings': dict((name, h.to_list()) for name, h in self.timings.items()),
+            }
+
+    def merge(self, data):
+        """Add the totals of a to_dict() result; data of another version is ignored"""
+        if not isinstance(data, dict) or data.get('version') != VERSION:
+            return
+        with self.lock:
+            self.since = min(self.since, int(data.get('since', self.since)))
+            for name, values in data.get('requests', {}).items():
+                stats = self.requests.get(name)
+                if stats is None:
+                    stats = self.requests[name] = RequestStats()
+                stats.errors += values.get('errors', 0)
+                stats.bytes += values.get('bytes', 0)
+                stats.latency.merge(values.get('latency', []))
+            for name, value in data.get('counters', {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, counts in data.get('timings', {}).items():
+                histogram = self.timings.get(name)
+                if histogram is None:
+                    histogram = self.timings[name] = Histogram()
+                histogram.merge(counts)
+
+    def save(self, path):
+        """Add what was recorded to the totals in path and start over.
+        Callers serialise concurrent invocations with a file lock."""
+        if not self:
+            return
+        totals = load(path)
+        totals.merge(self.to_dict())
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(totals.to_dict(), f, separators=(',', ':'))
+        os.replace(temp_path, path)
+        with self.lock:
+            self.since = int(time.time())
+            self.requests = {}
+            self.counters = {}
+            self.timings = {}
+
+def load(path):
+    """Persisted totals as a Metrics object; empty if the file is missing or unreadable"""
+    totals = Metrics()
+    try:
+        with open(path, 'r') as f:
+            totals.merge(json.load(f))
+    except (IOError, OSError, ValueError):
+        pass
+    return totals
+
+def format_milliseconds(milliseconds):
+    if milliseconds is None:
+        return '-'
+    if milliseconds < 1000:
+        return f"{milliseconds:.0f} ms"
+    return f"{milliseconds / 1000.0:.1f} s"
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} GB"
+
+def format_percentiles(histogram):
+    return ' / '.join(format_milliseconds(histogram.percentile(p)) for p in (50, 95, 99))
+
+def report_lines(totals):
+    """Human readable summary, one line per endpoint, cache, counter and timing"""
+    lines = []
+    for name in sorted(totals.requests):
+        stats = totals.requests[name]
+        lines.append(f"{name}: {stats.count} calls, p50/p95/p99 {format_percentiles(stats.latency)}, "
+                     f"{stats.error_rate * 100:.1f}% errors, {format_bytes(stats.bytes)}")
+    caches = sorted(set(key.rsplit('.', 1)[0] for key in totals.counters if key.endswith(('.hit', '.miss'))))
+    for name in caches:
+        hits, misses = totals.cache_ratio(name)
+        lines.append(f"{name} cache: {hits} hits, {misses} misses ({hits * 100.0 / max(hits + misses, 1):.0f}% hit rate)")
+    for name in sorted(key for key in totals.counters if not key.endswith(('.hit', '.miss'))):
+        lines.append(f"{name}: {totals.counters[name]}")
+    for name in sorted(totals.timings):
+        histogram = totals.timings[name]
+        lines.append(f"{name}: {histogram.count} times, p50/p95/p99 {format_percentiles(histogram)}")
+    return lines
@@ -0,0 +1,367 @@
+"""
+    Pure-Python QR code encoder
+    Encodes text in byte mode (ISO/IEC 18004, versions 1-40) and writes the
+    symbol as a grayscale PNG using only zlib and struct, so the addon can
+    render its login QR code without any network round trip.
+"""
+
+import struct
+import zlib
+
+ECC_LOW = 0
+ECC_MEDIUM = 1
+ECC_QUARTILE = 2
+ECC_HIGH = 3
+
+# Format information value of each error correction level
+_FORMAT_BITS = (1, 0, 3, 2)
+
+# Error correction codewords per block, indexed by [level][version]
+_ECC_CODEWORDS_PER_BLOCK = (
+    (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+     28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+     26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+     28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+     30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+)
+
+# Number of error correction blocks, indexed by [level][version]
+_NUM_ERROR_CORRECTION_BLOCKS = (
+    (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+     8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+     17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+     23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+     25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+)
+
+_MASK_PATTERNS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+class QRCodeError(ValueError):
+    """Raised when the data does not fit in a version 40 symbol"""
+    pass
+
+def _get_bit(value, index):
+    return ((value >> index) & 1) != 0
+
+def _num_raw_data_modules(version):
+    """Modules available for data and error correction after function patterns"""
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+def _num_data_codewords(version, ecc):
+    return (_num_raw_data_modules(version) // 8
+            - _ECC_CODEWORDS_PER_BLOCK[ecc][version] * _NUM_ERROR_CORRECTION_BLOCKS[ecc][version])
+
+def _rs_multiply(x, y):
+    """Multiply in GF(2^8) modulo x^8 + x^4 + x^3 + x^2 + 1"""
+    z = 0
+    for i in reversed(range(8)):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+def _rs_divisor(degree):
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _rs_multiply(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _rs_multiply(root, 0x02)
+    return result
+
+def _rs_remainder(data, divisor):
+    result = [0] * len(divisor)
+    for b in data:
+        factor = b ^ result.pop(0)
+        result.append(0)
+        for i, coef in enumerate(divisor):
+            result[i] ^= _rs_multiply(coef, factor)
+    return result
+
+def _encode_data(data, ecc):
+    """Pick the smallest version that fits and return (version, data codewords)"""
+    for version in range(1, 41):
+        count_bits = 8 if version <= 9 else 16
+        capacity_bits = _num_data_codewords(version, ecc) * 8
+        if 4 + count_bits + len(data) * 8 <= capacity_bits:
+            break
+    else:
+        raise QRCodeError(f"Data too long for a QR code: {len(data)} bytes")
+
+    bits = []
+    def append(value, length):
+        bits.extend(_get_bit(value, i) for i in reversed(range(length)))
+
+    append(0x4, 4)  # Byte mode
+    append(len(data), count_bits)
+    for b in data:
+        append(b, 8)
+    append(0, min(4, capacity_bits - len(bits)))
+    append(0, -len(bits) % 8)
+
+    codewords = [sum(1 << (7 - j) for j in range(8) if bits[i + j]) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(codewords) < capacity_bits // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+    return version, codewords
+
+def _add_error_correction(version, ecc, data):
+    """Split data into blocks, append Reed-Solomon codewords and interleave"""
+    num_blocks = _NUM_ERROR_CORRECTION_BLOCKS[ecc][version]
+    block_ecc_len = _ECC_CODEWORDS_PER_BLOCK[ecc][version]
+    raw_codewords = _num_raw_data_modules(version) // 8
+    num_short_blocks = num_blocks - raw_codewords % num_blocks
+    short_block_len = raw_codewords // num_blocks
+
+    divisor = _rs_divisor(block_ecc_len)
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        length = short_block_len - block_ecc_len + (0 if i < num_short_blocks else 1)
+        block = data[k:k + length]
+        k += length
+        ecc_codewords = _rs_remainder(block, divisor)
+        if i < num_short_blocks:
+            block.append(0)
+        blocks.append(block + ecc_codewords)
+
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            # Skip the padding byte of short blocks
+            if i != short_block_len - block_ecc_len or j >= num_short_blocks:
+                result.append(block[i])
+    return result
+
+class _Symbol(object):
+    __slots__ = ('version', 'ecc', 'size', 'modules', 'is_function')
+
+    def __init__(self, version, ecc):
+        self.version = version
+        self.ecc = ecc
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def alignment_positions(self):
+        if self.version == 1:
+            return []
+        num_align = self.version // 7 + 2
+        step = (self.version * 8 + num_align * 3 + 5) // (num_align * 4 - 4) * 2
+        positions = [self.size - 7 - i * step for i in range(num_align - 1)] + [6]
+        return list(reversed(positions))
+
+    def draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self.set_function(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+
+        positions = self.alignment_positions()
+        last = len(positions) - 1
+        for i, cx in enumerate(positions):
+            for j, cy in enumerate(positions):
+                # The three corners overlap the finder patterns
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+
+        # Reserve the format areas with a dummy mask, overwritten later
+        self.draw_format_bits(0)
+        self.draw_version()
+
+    def draw_format_bits(self, mask):
+        size = self.size
+        data = _FORMAT_BITS[self.ecc] << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+
+        for i in range(0, 6):
+            self.set_function(8, i, _get_bit(bits, i))
+        self.set_function(8, 7, _get_bit(bits, 6))
+        self.set_function(8, 8, _get_bit(bits, 7))
+        self.set_function(7, 8, _get_bit(bits, 8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, _get_bit(bits, i))
+
+        for i in range(0, 8):
+            self.set_function(size - 1 - i, 8, _get_bit(bits, i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, _get_bit(bits, i))
+        self.set_function(8, size - 8, True)  # Always dark
+
+    def draw_version(self):
+        if self.version < 7:
+            return
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+        for i in range(18):
+            bit = _get_bit(bits, i)
+            a = self.size - 11 + i % 3
+            b = i // 3
+            self.set_function(a, b, bit)
+            self.set_function(b, a, bit)
+
+    def draw_codewords(self, data):
+        size = self.size
+        i = 0
+        total_bits = len(data) * 8
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = ((right + 1) & 2) == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for j in range(2):
+                    x = right - j
+                    if not self.is_function[y][x] and i < total_bits:
+                        self.modules[y][x] = _get_bit(data[i >> 3], 7 - (i & 7))
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask):
+        pattern = _MASK_PATTERNS[mask]
+        for y in range(self.size):
+            row = self.modules[y]
+            function_row = self.is_function[y]
+            for x in range(self.size):
+                if not function_row[x] and pattern(x, y):
+                    row[x] = not row[x]
+
+    def penalty_score(self):
+        size = self.size
+        modules = self.modules
+        result = 0
+        lines = modules + [list(column) for column in zip(*modules)]
+
+        # Runs of five or more same-colored modules
+        for line in lines:
+            run = 1
+            for a, b in zip(line, line[1:]):
+                if a == b:
+                    run += 1
+                else:
+                    if run >= 5:
+                        result += run - 2
+                    run = 1
+            if run >= 5:
+                result += run - 2
+
+        # 2x2 blocks of one color
+        for y in range(size - 1):
+            for x in range(size - 1):
+                color = modules[y][x]
+                if color == modules[y][x + 1] == modules[y + 1][x] == modules[y + 1][x + 1]:
+                    result += 3
+
+        # Finder-like 1:1:3:1:1 patterns with four light modules on one side
+        patterns = ((True, False, True, True, True, False, True, False, False, False, False),
+                    (False, False, False, False, True, False, True, True, True, False, True))
+        for line in lines:
+            line = tuple(line)
+            for i in range(size - 10):
+                if line[i:i + 11] in patterns:
+                    result += 40
+
+        # Balance of dark and light modules
+        total = size * size
+        dark = sum(sum(row) for row in modules)
+        k = (abs(dark * 20 - total * 10) + total - 1) // total - 1
+        result += k * 10
+        return result
+
+def encode(text, ecc=ECC_MEDIUM):
+    """Encode text and return the symbol as rows of booleans (True is dark)"""
+    data = text.encode('utf-8') if isinstance(text, str) else bytes(text)
+    version, codewords = _encode_data(data, ecc)
+    symbol = _Symbol(version, ecc)
+    symbol.draw_function_patterns()
+    symbol.draw_codewords(_add_error_correction(version, ecc, codewords))
+
+    best_mask = None
+    best_score = None
+    for mask in range(8):
+        symbol.apply_mask(mask)
+        symbol.draw_format_bits(mask)
+        score = symbol.penalty_score()
+        if best_score is None or score < best_score:
+            best_mask, best_score = mask, score
+        symbol.apply_mask(mask)  # XOR again to undo
+
+    symbol.apply_mask(best_mask)
+    symbol.draw_format_bits(best_mask)
+    return symbol.modules
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+def to_png(modules, size=400, border=2, dark=255, light=0):
+    """Render a module matrix as 8-bit grayscale PNG bytes no larger than size pixels.
+    The defaults draw light modules on black to match the Kodi dialog theme."""
+    count = len(modules) + border * 2
+    scale = max(1, size // count)
+    width = count * scale
+
+    quiet_row = b'\x00' + bytes([light]) * width
+    rows = [quiet_row] * (border * scale)
+    for row in modules:
+        pixels = bytearray([light]) * (border * scale)
+        for module in row:
+            pixels += bytes([dark if module else light]) * scale
+        pixels += bytearray([light]) * (border * scale)
+        rows.extend([b'\x00' + bytes(pixels)] * scale)
+    rows.extend([quiet_row] * (border * scale))
+
+    header = struct.pack('>IIBBBBB', width, width, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(b''.join(rows), 9))
+            + _png_chunk(b'IEND', b''))
+
+def write_png(text, path, size=400, ecc=ECC_MEDIUM):
+    """Encode text and write the QR code PNG to path"""
+    png = to_png(encode(text, ecc), size)
+    with open(path, 'wb') as f:
+        f.write(png)
+    return path
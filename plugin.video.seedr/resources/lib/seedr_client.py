@@ -0,0 +1,326 @@
+"""
+    Seedr API client
+    SeedrClient wraps the device-code login, token refresh and the file system
+    endpoints behind typed methods. Tokens live in an injected store: any dict
+    with a save() method, such as the add-on's SettingsStore or a
+    MemoryTokenStore, so the client runs (and can be exercised) outside Kodi.
+
+    One client is safe to share between threads. Each thread keeps its own
+    HTTP session so connections are reused, and a token refresh triggered by
+    several failing requests at once happens only once.
+
+    AsyncSeedrClient offers the same endpoints as coroutines for concurrent
+    fan-out (crawls, batches of file details) with asyncio.gather.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+API_URL = 'https://v2.seedr.cc'
+API_PREFIX = '/api/v0.1/p'
+CLIENT_ID = 'EKp43IJEBXiGjaRg6cd7F17R3z3zv6VL'
+SCOPES = 'files.read profile account.read media.read'
+USER_AGENT = 'Kodi/Seedr Addon'
+
+class MemoryTokenStore(dict):
+    """Token store that keeps tokens for the lifetime of the process"""
+    def save(self):
+        pass
+
+class SeedrClient(object):
+    """Synchronous Seedr API client.
+
+    timeout is in seconds, or a callable returning it so a setting can change
+    between requests. log is called as log(message, level) with level one of
+    'debug', 'info', 'warning' or 'error'. on_request(url, seconds, size, error)
+    is called after every HTTP request and on_event(name) for token refreshes.
+    session_factory builds the per-thread HTTP sessions, requests.Session by default."""
+    def __init__(self, tokens, timeout=10, log=None, on_request=None, on_event=None, session_factory=None):
+        self.tokens = tokens
+        self._session_factory = session_factory or requests.Session
+        self.timeout = timeout
+        self._log = log or (lambda message, level='debug': None)
+        self._on_request = on_request
+        self._on_event = on_event
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._session_factory()
+            session.headers.update({
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'User-Agent': USER_AGENT,
+                'Accept': 'application/json'
+            })
+        return session
+
+    def _timeout(self):
+        return self.timeout() if callable(self.timeout) else self.timeout
+
+    def _event(self, name):
+        if self._on_event:
+            self._on_event(name)
+
+    def _post(self, url, params):
+        """Raw POST for the OAuth endpoints, reported like any other request"""
+        start = time.time()
+        try:
+            response = self._session().post(url, data=params, timeout=self._timeout())
+        except requests.exceptions.RequestException:
+            if self._on_request:
+                self._on_request(url, time.time() - start, 0, True)
+            raise
+        if self._on_request:
+            self._on_request(url, time.time() - start, len(response.content), response.status_code >= 400)
+        return response
+
+    def fetch_json(self, url, post_params=None, access_token=None):
+        """JSON body of a GET (or POST with post_params) to url. HTTP errors are returned
+        as {'error': reason, 'status_code': code}; network errors raise."""
+        headers = {'Authorization': f'Bearer {access_token}'} if access_token else None
+        self._log(f"Making request to: {url}")
+        start = time.time()
+        try:
+            if post_params is not None:
+                self._log(f"POST params: {post_params}")
+                r = self._session().post(url, data=post_params, headers=headers, timeout=self._timeout())
+            else:
+                r = self._session().get(url, headers=headers, timeout=self._timeout())
+        except requests.exceptions.RequestException:
+            if self._on_request:
+                self._on_request(url, time.time() - start, 0, True)
+            raise
+        if self._on_request:
+            self._on_request(url, time.time() - start, len(r.content), r.status_code >= 400)
+        self._log(f"API Response: {r.status_code} {r.text}")
+
+        if r.status_code >= 400:
+            try:
+                error_msg = r.json().get('reason_phrase', 'Unknown error')
+            except ValueError:
+                error_msg = 'Unknown error'
+            self._log(f"HTTP Error {r.status_code}: {error_msg}", 'error')
+            return {'error': error_msg, 'status_code': r.status_code}
+        return r.json()
+
+    # Device code login
+
+    def request_device_code(self):
+        """Device and user codes for a new login, or None on failure"""
+        params = {
+            'client_id': CLIENT_ID,
+            'scope': SCOPES,
+            'response_type': 'device_code'
+        }
+        try:
+            response = self._post(API_URL + API_PREFIX + '/oauth/device/code', params)
+            self._log(f"Device code response: {response.status_code} {response.text}")
+            if response.status_code != 200:
+                self._log(f"HTTP Error {response.status_code}: {response.text}", 'error')
+                return None
+            data = response.json()
+            if 'device_code' not in data:
+                self._log("Error: No device_code in response", 'error')
+                return None
+            return data
+        except requests.exceptions.RequestException as e:
+            self._log(f"Network error making device code request: {str(e)}", 'error')
+            return None
+        except Exception as e:
+            self._log(f"Error processing device code response: {str(e)}", 'error')
+            return None
+
+    def poll_device_token(self, device_code):
+        """One poll of the token endpoint: the token response, or {'error': ...}
+        (authorization_pending, slow_down, expired_token, ...)"""
+        params = {
+            'device_code': device_code,
+            'client_id': CLIENT_ID
+        }
+        try:
+            response = self._post(API_URL + API_PREFIX + '/oauth/device/token', params)
+            self._log(f"Token response: {response.status_code} {response.text}")
+            if response.status_code == 200:
+                return response.json()
+            try:
+                error_msg = response.json().get('error', 'Unknown error')
+                self._log(f"Token error: {error_msg}", 'error')
+                return {'error': error_msg}
+            except ValueError:
+                self._log(f"Token HTTP Error {response.status_code}: {response.text}", 'error')
+                return {'error': f'HTTP {response.status_code}'}
+        except requests.exceptions.RequestException as e:
+            self._log(f"Network error getting token: {str(e)}", 'error')
+            return {'error': 'Network error'}
+        except Exception as e:
+            self._log(f"Error getting token: {str(e)}", 'error')
+            return {'error': 'Unknown error'}
+
+    # Tokens
+
+    def store_tokens(self, response):
+        """Keep the tokens of a token response. A new refresh token is only sent sometimes."""
+        self.tokens['access_token'] = response['access_token']
+        if response.get('refresh_token'):
+            self.tokens['refresh_token'] = response['refresh_token']
+        if response.get('expires_in'):
+            self.tokens['token_expires_at'] = int(time.time()) + int(response['expires_in'])
+        else:
+            self.tokens.pop('token_expires_at', None)
+        self.tokens.save()
+
+    def clear_tokens(self):
+        for key in ('access_token', 'refresh_token', 'token_expires_at'):
+            if key in self.tokens:
+                del self.tokens[key]
+        self.tokens.save()
+
+    def refresh_access_token(self, stale_token=None):
+        """New access token from the refresh token, or None. When stale_token is given
+        and another thread already replaced it, the replacement is returned instead."""
+        with self._refresh_lock:
+            current = self.tokens.get('access_token')
+            if stale_token and current and current != stale_token:
+                return current
+            if 'refresh_token' not in self.tokens:
+                self._log("No refresh token available", 'error')
+                return None
+
+            self._log("Attempting to refresh access token")
+            self._event('token_refresh')
+            params = {
+                'grant_type': 'refresh_token',
+                'refresh_token': self.tokens['refresh_token'],
+                'client_id': CLIENT_ID
+            }
+            try:
+                response = self.fetch_json(API_URL + API_PREFIX + '/oauth/token', params)
+                if 'access_token' in response:
+                    self._log("Successfully refreshed access token")
+                    self.store_tokens(response)
+                    return response['access_token']
+                self._log(f"Failed to refresh token: {response.get('error', 'Unknown error')}", 'error')
+            except Exception as e:
+                self._log(f"Error refreshing token: {str(e)}", 'error')
+            self._event('token_refresh_failed')
+            return None
+
+    # Authenticated calls
+
+    def call(self, path, params=None, access_token=None, retry=True):
+        """Response of an API path (e.g. '/api/v0.1/p/fs/root/contents'), or None on
+        failure. Expired tokens are refreshed and the call retried once; tokens that
+        can't be refreshed or lack a scope are cleared so the next run logs in again."""
+        try:
+            token = access_token or self.tokens.get('access_token')
+            response = self.fetch_json(API_URL + path, params, token)
+
+            expired = False
+            if 'status_code' in response:
+                if response['status_code'] == 401:
+                    expired = True
+                elif response['status_code'] == 403 and 'Missing required scope' in response.get('error', ''):
+                    self._log("Missing required scope, clearing tokens to re-authenticate", 'warning')
+                    self.clear_tokens()
+                    return None
+                else:
+                    return None
+            elif 'error' in response:
+                if response.get('error') not in ('invalid_token', 'expired_token'):
+                    self._log(f"API error: {response.get('error')}", 'error')
+                    return None
+                expired = True
+
+            if expired:
+                if not retry:
+                    self._log(f"Refreshed token was rejected for {path}", 'error')
+                    return None
+                self._log("Token expired or invalid, attempting to refresh", 'warning')
+                new_token = self.refresh_access_token(token)
+                if not new_token:
+                    self._log("Failed to refresh token, clearing stored tokens", 'error')
+                    self.clear_tokens()
+                    return None
+                return self.call(path, params, new_token, retry=False)
+            return response
+        except Exception as e:
+            self._log(f"API call error: {str(e)}", 'error')
+            return None
+
+    def root_contents(self):
+        return self.call(API_PREFIX + '/fs/root/contents')
+
+    def folder_contents(self, folder_id):
+        return self.call(f'{API_PREFIX}/fs/folder/{folder_id}/contents')
+
+    def file_details(self, file_id):
+        return self.call(f'{API_PREFIX}/fs/file/{file_id}')
+
+    def file_download(self, file_id):
+        """{'url': ...} to download a file (used for subtitles)"""
+        return self.call(f'{API_PREFIX}/fs/file/{file_id}/download')
+
+    def download_url(self, file_id):
+        """{'url': ...} of the original file, served with byte ranges"""
+        return self.call(f'{API_PREFIX}/download/file/{file_id}/url')
+
+    def hls_presentation(self, file_id):
+        """{'url': ...} of the transcoded HLS presentation of a video"""
+        return self.call(f'{API_PREFIX}/presentations/file/{file_id}/hls')
+
+class AsyncSeedrClient(object):
+    """asyncio interface to a SeedrClient. Requests run on a pool of max_workers
+    threads, so any number of tasks can await at once while the number of open
+    connections stays bounded."""
+    def __init__(self, client, max_workers=4):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+
+    async def call(self, path, params=None):
+        return await self._run(self.client.call, path, params)
+
+    async def root_contents(self):
+        return await self._run(self.client.root_contents)
+
+    async def folder_contents(self, folder_id):
+        return await self._run(self.client.folder_contents, folder_id)
+
+    async def file_details(self, file_id):
+        return await self._run(self.client.file_details, file_id)
+
+    async def file_download(self, file_id):
+        return await self._run(self.client.file_download, file_id)
+
+    async def download_url(self, file_id):
+        return await self._run(self.client.download_url, file_id)
+
+    async def hls_presentation(self, file_id):
+        return await self._run(self.client.hls_presentation, file_id)
+
+    async def folders_contents(self, folder_ids):
+        """Contents of many folders concurrently, in the order of folder_ids"""
+        return await asyncio.gather(*(self.folder_contents(folder_id) for folder_id in folder_ids))
+
+    async def files_details(self, file_ids):
+        """Details of many files concurrently, in the order of file_ids"""
+        return await asyncio.gather(*(self.file_details(file_id) for file_id in file_ids))
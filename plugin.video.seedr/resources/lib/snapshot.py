@@ -0,0 +1,214 @@
+"""
+    Compact binary snapshots of folder listings
+    A snapshot holds one folder's contents as fixed-width records packed with
+    struct, followed by a shared, deduplicated UTF-8 string table. Readers map
+    the file with mmap and decode records on access, so showing one page of
+    a large folder touches only that page's records and strings instead of
+    parsing the whole JSON response.
+
+    Layout (little endian):
+        header   magic, version, folder count, file count, parent id,
+                 fetched_at, string table offset and length
+        records  folders first, then files
+        strings  every string once, referenced by (offset, length)
+"""
+
+import mmap
+import os
+import struct
+
+MAGIC = b'SDRS'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHxxIIqqII')
+# kind, flags, id, size, folder_id, then (offset, length) for each of
+# name, last_update, thumb and the 720/220/64/48 presentation images
+_RECORD = struct.Struct('<BBxxqqq14I')
+
+KIND_FOLDER = 0
+KIND_FILE = 1
+
+FLAG_VIDEO = 1
+FLAG_AUDIO = 2
+
+IMAGE_SIZES = ('720', '220', '64', '48')
+
+class SnapshotError(ValueError):
+    """Raised for files that are not snapshots of the supported version"""
+    pass
+
+class _StringTable(object):
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, value):
+        if not value:
+            return 0, 0
+        encoded = str(value).encode('utf-8')
+        offset = self.offsets.get(encoded)
+        if offset is None:
+            offset = len(self.data)
+            self.offsets[encoded] = offset
+            self.data += encoded
+        return offset, len(encoded)
+
+def _pack_entry(strings, kind, entry):
+    flags = 0
+    if entry.get('is_video'):
+        flags |= FLAG_VIDEO
+    if entry.get('is_audio'):
+        flags |= FLAG_AUDIO
+
+    if kind == KIND_FOLDER:
+        name = entry.get('path') or entry.get('name')
+    else:
+        name = entry.get('name')
+    images = {}
+    presentation_urls = entry.get('presentation_urls')
+    if isinstance(presentation_urls, dict) and isinstance(presentation_urls.get('image'), dict):
+        images = presentation_urls['image']
+
+    refs = []
+    for value in (name, entry.get('last_update'), entry.get('thumb')) + tuple(images.get(s) for s in IMAGE_SIZES):
+        refs.extend(strings.add(value))
+    return _RECORD.pack(kind, flags, int(entry.get('id') or 0), int(entry.get('size') or 0),
+                        int(entry.get('folder_id') or 0), *refs)
+
+def write_snapshot(path, data, fetched_at=0):
+    """Write a contents response (dict with 'folders', 'files' and 'parent') to path atomically"""
+    folders = [f for f in data.get('folders', []) if isinstance(f, dict)]
+    files = [f for f in data.get('files', []) if isinstance(f, dict)]
+    strings = _StringTable()
+    records = [_pack_entry(strings, KIND_FOLDER, f) for f in folders]
+    records += [_pack_entry(strings, KIND_FILE, f) for f in files]
+
+    strings_offset = _HEADER.size + _RECORD.size * len(records)
+    parent = data.get('parent', -1)
+    header = _HEADER.pack(MAGIC, VERSION, len(folders), len(files),
+                          -1 if parent is None else int(parent), int(fetched_at),
+                          strings_offset, len(strings.data))
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(records))
+        f.write(strings.data)
+    os.replace(temp_path, path)
+
+class _RecordView(object):
+    """Lazy sequence over a run of records; slicing decodes nothing until accessed"""
+    __slots__ = ('reader', 'start', 'stop')
+
+    def __init__(self, reader, start, stop):
+        self.reader = reader
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return _RecordView(self.reader, self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.reader.entry(self.start + index)
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield self.reader.entry(i)
+
+class _Snapshot(object):
+    """Decodes a snapshot held in any buffer: bytes, or the mmap of a SnapshotReader.
+    folders and files are lazy sequences of dicts shaped like API entries."""
+    def __init__(self, buffer, path):
+        magic, version, folder_count, file_count, parent, fetched_at, strings_offset, strings_length = \
+            _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"Unsupported snapshot: {path}")
+        self._buffer = buffer
+        self.parent = parent
+        self.fetched_at = fetched_at
+        self._strings_offset = strings_offset
+        self.folders = _RecordView(self, 0, folder_count)
+        self.files = _RecordView(self, folder_count, folder_count + file_count)
+
+    def __len__(self):
+        return len(self.folders) + len(self.files)
+
+    def _string(self, offset, length):
+        if not length:
+            return None
+        start = self._strings_offset + offset
+        return self._buffer[start:start + length].decode('utf-8')
+
+    def record(self, index):
+        """Raw decoded record: (kind, flags, id, size, folder_id, name, last_update, thumb, images)"""
+        values = _RECORD.unpack_from(self._buffer, _HEADER.size + _RECORD.size * index)
+        kind, flags, entry_id, size, folder_id = values[:5]
+        refs = values[5:]
+        strings = [self._string(refs[i], refs[i + 1]) for i in range(0, len(refs), 2)]
+        images = dict((s, url) for s, url in zip(IMAGE_SIZES, strings[3:]) if url)
+        return kind, flags, entry_id, size, folder_id, strings[0], strings[1], strings[2], images
+
+    def entry(self, index):
+        kind, flags, entry_id, size, folder_id, name, last_update, thumb, images = self.record(index)
+        entry = {'id': entry_id, 'size': size}
+        if last_update:
+            entry['last_update'] = last_update
+        if kind == KIND_FOLDER:
+            entry['path'] = name or ''
+            return entry
+        entry['name'] = name or ''
+        entry['is_video'] = bool(flags & FLAG_VIDEO)
+        entry['is_audio'] = bool(flags & FLAG_AUDIO)
+        if folder_id:
+            entry['folder_id'] = folder_id
+        if thumb:
+            entry['thumb'] = thumb
+        if images:
+            entry['presentation_urls'] = {'image': images}
+        return entry
+
+    def as_listing(self):
+        """Contents-response shaped dict whose entry lists stay lazy"""
+        return {'parent': self.parent, 'folders': self.folders, 'files': self.files}
+
+class SnapshotReader(_Snapshot):
+    """Memory-mapped view of a snapshot file; close it, or use it as a context manager"""
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError(f"Empty snapshot: {path}")
+        try:
+            _Snapshot.__init__(self, buffer, path)
+        except Exception:
+            buffer.close()
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        self._file.close()
+
+    def as_listing(self):
+        """Contents-response shaped dict whose entry lists stay lazy. They decode from a
+        copy of the mapped bytes, so the listing outlives the reader and its file."""
+        return _Snapshot(self._buffer[:], self._file.name).as_listing()
@@ -0,0 +1,89 @@
+"""
+    Cross-invocation memory cache kept in Kodi window properties
+    Every listing, playback or context menu action runs main.py in a fresh
+    interpreter, so nothing survives in Python memory. Properties of the home
+    window (id 10000) live as long as Kodi does and are read without touching
+    the disk, which makes them a cheap cache tier in front of the profile
+    files and the API.
+
+    Values are JSON encoded together with the generation of their namespace
+    and an expiry time. Bumping a namespace's generation invalidates all of
+    its entries at once. Each namespace keeps a small LRU index of its keys
+    so the number of entries and the size of each value stay bounded.
+"""
+
+import json
+import time
+
+class WindowCache(object):
+    """Namespaced, size-capped cache over the properties of a xbmcgui.Window"""
+    def __init__(self, window, prefix='seedr'):
+        self.window = window
+        self.prefix = prefix
+
+    def _property(self, namespace, name):
+        return f"{self.prefix}.{namespace}.{name}"
+
+    def _index(self, namespace):
+        try:
+            return json.loads(self.window.getProperty(self._property(namespace, '_index')) or '[]')
+        except ValueError:
+            return []
+
+    def generation(self, namespace):
+        try:
+            return int(self.window.getProperty(self._property(namespace, '_generation')) or 0)
+        except ValueError:
+            return 0
+
+    def get(self, namespace, key):
+        """Cached value, or None if missing, expired or from an older generation"""
+        raw = self.window.getProperty(self._property(namespace, key))
+        if not raw:
+            return None
+        try:
+            generation, expires_at, value = json.loads(raw)
+        except ValueError:
+            return None
+        if generation != self.generation(namespace) or time.time() >= expires_at:
+            return None
+        return value
+
+    def set(self, namespace, key, value, ttl, max_entries=32, max_bytes=65536):
+        """Store value for ttl seconds. Values larger than max_bytes are not cached;
+        beyond max_entries the least recently stored keys are evicted."""
+        return self.set_many(namespace, {key: value}, ttl, max_entries, max_bytes) == 1
+
+    def set_many(self, namespace, values, ttl, max_entries=32, max_bytes=65536):
+        """Store every key and value of a dict like set(), updating the index once.
+        Returns the number of values stored."""
+        if ttl <= 0:
+            for key in values:
+                self.delete(namespace, key)
+            return 0
+        generation, expires_at = self.generation(namespace), time.time() + ttl
+        stored = []
+        for key, value in values.items():
+            raw = json.dumps([generation, expires_at, value], separators=(',', ':'))
+            if len(raw) > max_bytes:
+                self.delete(namespace, key)
+                continue
+            self.window.setProperty(self._property(namespace, key), raw)
+            stored.append(str(key))
+        if stored:
+            new_keys = set(stored)
+            index = [k for k in self._index(namespace) if k not in new_keys] + stored
+            for evicted in index[:-max_entries]:
+                self.window.clearProperty(self._property(namespace, evicted))
+            self.window.setProperty(self._property(namespace, '_index'), json.dumps(index[-max_entries:]))
+        return len(stored)
+
+    def delete(self, namespace, key):
+        self.window.clearProperty(self._property(namespace, key))
+
+    def invalidate(self, namespace):
+        """Drop every entry of a namespace, including ones stored by concurrent invocations"""
+        self.window.setProperty(self._property(namespace, '_generation'), str(self.generation(namespace) + 1))
+        for key in self._index(namespace):
+            self.window.clearProperty(self._property(namespace, key))
+        self.window.clearProperty(self._property(namespace, '_index'))
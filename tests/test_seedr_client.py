@@ -0,0 +1,212 @@
+"""
+    SeedrClient tests
+    HTTP is replaced by FakeSession, passed as the client's session_factory,
+    which answers requests from a table of handlers keyed by API path, so no
+    request leaves the machine. Without the requests package a minimal
+    stand-in provides the exception types the client catches.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugin.video.seedr'))
+
+try:
+    import requests
+except ImportError:
+    requests = types.ModuleType('requests')
+    requests.exceptions = types.SimpleNamespace(RequestException=type('RequestException', (IOError,), {}))
+    requests.Session = None
+    sys.modules['requests'] = requests
+
+from resources.lib import seedr_client
+
+class FakeResponse(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self.content = self.text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+class FakeSession(object):
+    """Stands in for requests.Session. Every instance and request is recorded on
+    the class; handlers are called as handler(access_token, data)."""
+    routes = {}
+    sessions = []
+    calls = []
+    delay = 0
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        cls.routes = {'/oauth/token': refresh}
+        cls.sessions = []
+        cls.calls = []
+        cls.delay = 0
+        cls.active = 0
+        cls.peak = 0
+
+    def __init__(self):
+        self.headers = {}
+        with FakeSession.lock:
+            FakeSession.sessions.append(self)
+
+    def _request(self, method, url, data=None, headers=None, timeout=None):
+        path = url[len(seedr_client.API_URL + seedr_client.API_PREFIX):]
+        authorization = (headers or {}).get('Authorization', '')
+        token = authorization[len('Bearer '):] or None
+        with FakeSession.lock:
+            FakeSession.calls.append((method, path, token, threading.current_thread().name))
+            FakeSession.active += 1
+            FakeSession.peak = max(FakeSession.peak, FakeSession.active)
+        try:
+            if FakeSession.delay:
+                time.sleep(FakeSession.delay)
+            handler = FakeSession.routes.get(path)
+            if handler is None:
+                raise requests.exceptions.RequestException(f"no route for {path}")
+            return handler(token, data)
+        finally:
+            with FakeSession.lock:
+                FakeSession.active -= 1
+
+    def get(self, url, headers=None, timeout=None):
+        return self._request('GET', url, headers=headers, timeout=timeout)
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        return self._request('POST', url, data, headers, timeout)
+
+def contents(token, data):
+    if token != 'fresh':
+        return FakeResponse(401, {'reason_phrase': 'Unauthorized'})
+    return FakeResponse(200, {'folders': [], 'files': []})
+
+def refresh(token, data):
+    return FakeResponse(200, {'access_token': 'fresh', 'expires_in': 3600})
+
+def refresh_rejected(token, data):
+    return FakeResponse(400, {'reason_phrase': 'invalid_grant'})
+
+def details(token, data):
+    return FakeResponse(200, {'id': token})
+
+class ClientTestCase(unittest.TestCase):
+    def setUp(self):
+        FakeSession.reset()
+        self.events = []
+        self.tokens = seedr_client.MemoryTokenStore(access_token='stale', refresh_token='refresh')
+        self.client = seedr_client.SeedrClient(self.tokens, on_event=self.events.append,
+                                               session_factory=FakeSession)
+
+    def requests_to(self, path):
+        return [call for call in FakeSession.calls if call[1] == path]
+
+class SeedrClientTest(ClientTestCase):
+    def test_expired_token_is_refreshed_and_call_retried(self):
+        FakeSession.routes['/fs/root/contents'] = contents
+        self.assertEqual(self.client.root_contents(), {'folders': [], 'files': []})
+        self.assertEqual([call[2] for call in self.requests_to('/fs/root/contents')], ['stale', 'fresh'])
+        self.assertEqual(len(self.requests_to('/oauth/token')), 1)
+        self.assertEqual(self.tokens['access_token'], 'fresh')
+        self.assertEqual(self.tokens['refresh_token'], 'refresh')
+        self.assertIn('token_expires_at', self.tokens)
+        self.assertEqual(self.events, ['token_refresh'])
+
+    def test_rejected_refreshed_token_is_not_refreshed_again(self):
+        FakeSession.routes['/fs/root/contents'] = lambda token, data: FakeResponse(401, {})
+        self.assertIsNone(self.client.root_contents())
+        self.assertEqual(len(self.requests_to('/oauth/token')), 1)
+        self.assertEqual(len(self.requests_to('/fs/root/contents')), 2)
+
+    def test_failed_refresh_clears_tokens(self):
+        FakeSession.routes['/fs/root/contents'] = contents
+        FakeSession.routes['/oauth/token'] = refresh_rejected
+        self.assertIsNone(self.client.root_contents())
+        self.assertNotIn('access_token', self.tokens)
+        self.assertNotIn('refresh_token', self.tokens)
+        self.assertEqual(self.events, ['token_refresh', 'token_refresh_failed'])
+
+    def test_network_error_returns_none(self):
+        self.assertIsNone(self.client.folder_contents(1))
+        self.assertIn('access_token', self.tokens)
+
+    def test_concurrent_expired_calls_refresh_once(self):
+        for folder_id in range(8):
+            FakeSession.routes[f'/fs/folder/{folder_id}/contents'] = contents
+        FakeSession.delay = 0.02
+        results = {}
+
+        def fetch(folder_id):
+            results[folder_id] = self.client.folder_contents(folder_id)
+
+        threads = [threading.Thread(target=fetch, args=(folder_id,)) for folder_id in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, dict((folder_id, {'folders': [], 'files': []}) for folder_id in range(8)))
+        self.assertEqual(len(self.requests_to('/oauth/token')), 1)
+        self.assertEqual(self.events, ['token_refresh'])
+
+    def test_sessions_are_per_thread_and_reused(self):
+        FakeSession.routes['/fs/file/1'] = details
+        self.client.file_details(1)
+        self.client.file_details(1)
+        self.assertEqual(len(FakeSession.sessions), 1)
+        self.assertEqual(FakeSession.sessions[0].headers['User-Agent'], seedr_client.USER_AGENT)
+
+        thread = threading.Thread(target=self.client.file_details, args=(1,))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(FakeSession.sessions), 2)
+
+class AsyncSeedrClientTest(ClientTestCase):
+    def run_async(self, coroutine_function, max_workers=4):
+        async def main():
+            async with seedr_client.AsyncSeedrClient(self.client, max_workers) as api:
+                return await coroutine_function(api)
+        return asyncio.run(main())
+
+    def test_folders_contents_keeps_order_and_refreshes_once(self):
+        for folder_id in range(8):
+            FakeSession.routes[f'/fs/folder/{folder_id}/contents'] = (
+                lambda token, data, folder_id=folder_id:
+                    FakeResponse(200, {'id': folder_id}) if token == 'fresh' else FakeResponse(401, {}))
+        FakeSession.delay = 0.02
+        results = self.run_async(lambda api: api.folders_contents(range(8)))
+        self.assertEqual(results, [{'id': folder_id} for folder_id in range(8)])
+        self.assertEqual(len(self.requests_to('/oauth/token')), 1)
+
+    def test_files_details_runs_on_bounded_pool(self):
+        self.tokens['access_token'] = 'fresh'
+        for file_id in range(12):
+            FakeSession.routes[f'/fs/file/{file_id}'] = details
+        FakeSession.delay = 0.02
+        results = self.run_async(lambda api: api.files_details(range(12)), max_workers=3)
+        self.assertEqual(results, [{'id': 'fresh'}] * 12)
+        self.assertGreater(FakeSession.peak, 1)
+        self.assertLessEqual(FakeSession.peak, 3)
+        self.assertLessEqual(len(FakeSession.sessions), 3)
+
+    def test_typed_endpoints(self):
+        self.tokens['access_token'] = 'fresh'
+        for path in ('/fs/file/5/download', '/download/file/5/url', '/presentations/file/5/hls'):
+            FakeSession.routes[path] = lambda token, data, path=path: FakeResponse(200, {'url': path})
+
+        async def resolve(api):
+            return await asyncio.gather(api.file_download(5), api.download_url(5), api.hls_presentation(5))
+        self.assertEqual([result['url'] for result in self.run_async(resolve)],
+                         ['/fs/file/5/download', '/download/file/5/url', '/presentations/file/5/hls'])
+
+if __name__ == '__main__':
+    unittest.main()
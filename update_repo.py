@@ -2,25 +2,71 @@
 """
     Repository updater script
     This script will scan the repository directories and generate:
-    - addons.xml
-    - addons.xml.md5
+    - addons.xml and a gzip-compressed addons.xml.gz
+    - MD5 and SHA-256 checksum files for the indexes and every ZIP file
     - ZIP files for each addon
+
+    Builds are incremental: a content hash of each addon's source tree is kept
+    in .build_manifest.json and addons whose sources are unchanged are skipped.
+    Run with --force to rebuild everything. Changed addons are packaged in
+    parallel, and archives are byte-reproducible, so their checksums only
+    change when their content does. Files are streamed from the source tree
+    into each archive and its checksums are taken from the bytes being written.
+    --index compressed switches the repository addon to addons.xml.gz.
+    Build outputs and other --exclude globs are kept out of the archives,
+    already-compressed files are stored rather than deflated, and a size
+    report is printed for every addon packaged.
+    --watch keeps running and repackages an addon whenever its files change
+    (inotify on Linux, polling elsewhere).
 """
 
 import os
 import sys
+import argparse
+import fnmatch
+import gzip
+import json
+import re
+import select
+import struct
+import time
+import ctypes
+import ctypes.util
 import xml.etree.ElementTree as ET
 import hashlib
-import zipfile
 import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-def cleanup_pyc_files(addon_dir):
-    """Remove *.pyc files to reduce ZIP size"""
-    for root, dirs, files in os.walk(addon_dir):
-        for filename in files:
-            if filename.endswith(".pyc"):
-                os.remove(os.path.join(root, filename))
+MANIFEST_FILE = ".build_manifest.json"
+MANIFEST_VERSION = 1
+
+# Fixed archive metadata so the same sources always produce the same bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o100644
+ZIP_COMPRESS_LEVEL = 9
+
+# Never packed into addon archives (matched against file names and relative paths);
+# --exclude adds to these
+DEFAULT_EXCLUDES = ("*.pyc", "__pycache__", ".*", "*.zip", "*.zip.md5", "*.zip.sha256", "index.html")
+
+# Already-compressed formats are stored, deflating them costs time for no gain
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".zip", ".gz", ".mp3", ".mp4")
+
+CHECKSUM_TYPES = ("md5", "sha256")
+
+# --watch waits this long after the last change before rebuilding, so a burst
+# of saves (or a git checkout) triggers one build
+WATCH_DEBOUNCE = 0.5
+WATCH_POLL_INTERVAL = 1.0
+
+# Index URLs the repository addon points Kodi clients at:
+# mode -> (info compressed attribute, checksum file, checksum attributes)
+INDEX_MODES = {
+    "plain": ("false", "addons.xml.md5", ""),
+    "compressed": ("true", "addons.xml.gz.sha256", ' verify="sha256"'),
+}
 
 def read_addon_xml(addon_dir):
     """Read the addon.xml file"""
@@ -35,127 +81,484 @@ def read_addon_xml(addon_dir):
         print(f"Error parsing {addon_xml_path}: {e}")
         return None
 
-def generate_addons_xml():
-    """Generate addons.xml from the repository contents"""
+def get_addon_dirs():
+    """Sorted addon directories (those with an addon.xml), excluding hidden items"""
+    addon_dirs = [d for d in os.listdir('.') if os.path.isdir(d) and not d.startswith('.')]
+    return sorted(d for d in addon_dirs if os.path.exists(os.path.join(d, "addon.xml")))
+
+def load_manifest():
+    """Load the build manifest, or an empty one if it is missing or from another version"""
+    try:
+        with open(MANIFEST_FILE, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "addons": {}}
+
+def save_manifest(manifest):
+    """Write the build manifest"""
+    write_if_changed(MANIFEST_FILE, json.dumps(manifest, indent=4, sort_keys=True) + "\n")
+
+def write_if_changed(file_path, content):
+    """Write text content to file_path unless it already holds the same text.
+    Returns (bytes of the file as stored, whether it was written)."""
+    data = content.encode('utf-8')
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as f:
+            existing = f.read()
+        # A checkout's line endings don't count as a change
+        if existing.replace(b"\r\n", b"\n") == data:
+            return existing, False
+    with open(file_path, "wb") as f:
+        f.write(data)
+    return data, True
+
+def is_excluded(rel_path, excludes):
+    """True if a file or directory matches one of the exclude globs"""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(rel_path, pattern) for pattern in excludes)
+
+def iter_addon_files(addon_dir, excludes=DEFAULT_EXCLUDES):
+    """Yield (path, relative path) of the files that make up an addon, in sorted order.
+    Excluded directories are not descended into."""
+    for root, dirs, files in os.walk(addon_dir):
+        rel_root = os.path.relpath(root, addon_dir).replace('\\', '/')
+        rel_root = '' if rel_root == '.' else rel_root + '/'
+        dirs[:] = sorted(d for d in dirs if not is_excluded(rel_root + d, excludes))
+        for filename in sorted(files):
+            rel_path = rel_root + filename
+            if not is_excluded(rel_path, excludes):
+                yield os.path.join(root, filename), rel_path
+
+def hash_addon_tree(addon_dir, excludes=DEFAULT_EXCLUDES):
+    """SHA-256 over the packaging rules and the relative paths and contents of an addon's files"""
+    tree_hash = hashlib.sha256()
+    tree_hash.update("\n".join(sorted(excludes) + list(STORED_EXTENSIONS)).encode('utf-8') + b"\0")
+    for file_path, rel_path in iter_addon_files(addon_dir, excludes):
+        tree_hash.update(rel_path.encode('utf-8') + b"\0")
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                tree_hash.update(chunk)
+        tree_hash.update(b"\0")
+    return tree_hash.hexdigest()
+
+def generate_addons_xml(addon_roots):
+    """Generate addons.xml and addons.xml.gz from the parsed addon.xml of every addon.
+    The indexes and their checksums are only rewritten when the content changes."""
     print("Generating addons.xml file")
     addons_xml = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<addons>\n'
     
-    # Get all addon directories (excluding hidden and non-directory items)
-    addon_dirs = [d for d in os.listdir('.') if os.path.isdir(d) and not d.startswith('.')]
-    
-    # Filter for valid addon directories (those with addon.xml)
-    valid_addon_dirs = []
-    for addon_dir in addon_dirs:
-        if os.path.exists(os.path.join(addon_dir, "addon.xml")):
-            valid_addon_dirs.append(addon_dir)
-    
-    # Sort the addon directories
-    valid_addon_dirs.sort()
-    
     # Process each addon
-    for addon_dir in valid_addon_dirs:
-        addon_xml_root = read_addon_xml(addon_dir)
-        if addon_xml_root is not None:
-            addon_xml_str = ET.tostring(addon_xml_root, encoding='utf-8').decode('utf-8')
-            # Format the XML string
-            indent = "    "
-            lines = addon_xml_str.split('\n')
-            formatted_lines = []
-            for line in lines:
-                formatted_lines.append(indent + line)
-            formatted_xml = '\n'.join(formatted_lines)
-            addons_xml += formatted_xml + "\n"
+    for addon_xml_root in addon_roots:
+        addon_xml_str = ET.tostring(addon_xml_root, encoding='utf-8').decode('utf-8')
+        # Format the XML string
+        indent = "    "
+        lines = addon_xml_str.split('\n')
+        formatted_lines = []
+        for line in lines:
+            formatted_lines.append(indent + line)
+        formatted_xml = '\n'.join(formatted_lines)
+        addons_xml += formatted_xml + "\n"
     
     addons_xml += "</addons>\n"
     
     # Write the addons.xml file
-    with open("addons.xml", "w", encoding='utf-8') as f:
-        f.write(addons_xml)
-    print("addons.xml generated successfully")
+    data, written = write_if_changed("addons.xml", addons_xml)
+    if written:
+        print("addons.xml generated successfully")
+    else:
+        print("addons.xml is up to date")
     
-    # Generate MD5 hash
-    generate_md5_file("addons.xml")
+    # Checksums of the bytes as stored
+    generate_checksum_files("addons.xml", data)
+    
+    # Compressed index for clients using <info compressed="true">; mtime=0 keeps it reproducible
+    write_with_checksums("addons.xml.gz", gzip.compress(data, compresslevel=9, mtime=0))
+
+def compute_digests(data):
+    """Hex digests of every checksum type, from a single pass over data"""
+    hashes = [hashlib.new(t) for t in CHECKSUM_TYPES]
+    view = memoryview(data)
+    for offset in range(0, len(view), 65536):
+        chunk = view[offset:offset + 65536]
+        for h in hashes:
+            h.update(chunk)
+    return dict((t, h.hexdigest()) for t, h in zip(CHECKSUM_TYPES, hashes))
+
+def generate_checksum_files(file_path, data):
+    """Write file_path.md5 and file_path.sha256 for data (the contents of file_path).
+    Returns the digests by checksum type."""
+    digests = compute_digests(data)
+    for checksum_type, digest in digests.items():
+        if write_if_changed(f"{file_path}.{checksum_type}", digest)[1]:
+            print(f"{file_path}.{checksum_type} generated successfully")
+    return digests
+
+def checksums_match(file_path, digests):
+    """True if file_path exists and its checksum files already hold digests"""
+    if not os.path.exists(file_path):
+        return False
+    for checksum_type, digest in digests.items():
+        try:
+            with open(f"{file_path}.{checksum_type}", encoding='utf-8') as f:
+                if f.read().strip() != digest:
+                    return False
+        except OSError:
+            return False
+    return True
 
-def generate_md5_file(file_path):
-    """Generate MD5 hash for the given file"""
-    print(f"Generating MD5 hash for {file_path}")
-    md5_hash = hashlib.md5()
+def write_with_checksums(file_path, data):
+    """Write data and its checksum files in one pass over its bytes.
+    A file whose checksums already match is left untouched. Returns the digests."""
+    digests = compute_digests(data)
+    if checksums_match(file_path, digests):
+        print(f"{file_path} is up to date")
+        return digests
+    with open(file_path, "wb") as f:
+        f.write(data)
+    print(f"{file_path} generated successfully")
+    for checksum_type, digest in digests.items():
+        write_if_changed(f"{file_path}.{checksum_type}", digest)
+    return digests
+
+def set_repository_index(addon_dir, mode):
+    """Point a repository addon at the plain or compressed index, keeping the file's formatting.
+    Returns True if its addon.xml changed."""
+    addon_xml_path = os.path.join(addon_dir, "addon.xml")
+    with open(addon_xml_path, encoding='utf-8', newline='') as f:
+        text = f.read()
+    if 'point="xbmc.addon.repository"' not in text:
+        return False
     
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            md5_hash.update(chunk)
+    compressed, checksum_name, checksum_attributes = INDEX_MODES[mode]
+    updated = re.sub(r'<info compressed="[^"]*">', f'<info compressed="{compressed}">', text)
+    updated = re.sub(r'<checksum[^>]*>([^<]*/)[^</]*</checksum>',
+                     lambda m: f'<checksum{checksum_attributes}>{m.group(1)}{checksum_name}</checksum>', updated)
+    if updated == text:
+        return False
+    with open(addon_xml_path, "w", encoding='utf-8', newline='') as f:
+        f.write(updated)
+    print(f"{addon_dir} now uses the {mode} index; bump its version so installed clients pick it up")
+    return True
+
+def make_zip_info(zip_path):
+    """ZipInfo with normalised timestamp, permissions, host system and compression"""
+    info = zipfile.ZipInfo(zip_path, date_time=ZIP_DATE_TIME)
+    info.create_system = 3
+    info.external_attr = ZIP_FILE_MODE << 16
+    if zip_path.lower().endswith(STORED_EXTENSIONS):
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+        # ZipFile.open() takes the level from the ZipInfo rather than the archive, and
+        # only writestr() has a parameter for it (public as compress_level from 3.13)
+        info._compresslevel = ZIP_COMPRESS_LEVEL
+    return info
+
+class HashingWriter(object):
+    """Write-only file wrapper that feeds every checksum type and counts the bytes passing
+    through. Having no seek() or tell(), it makes ZipFile write each entry once, followed
+    by a data descriptor, instead of going back to patch its header."""
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+        self.hashes = [hashlib.new(t) for t in CHECKSUM_TYPES]
+
+    def write(self, data):
+        for h in self.hashes:
+            h.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def digests(self):
+        return dict((t, h.hexdigest()) for t, h in zip(CHECKSUM_TYPES, self.hashes))
+
+def create_zipfile(addon_dir, addon_id, zip_name, excludes=DEFAULT_EXCLUDES):
+    """Stream the files of an addon straight from its source tree into zip_name with an
+    addon_id/ prefix (like v72 structure), computing its checksums from the bytes as they
+    are written. An archive whose checksums already match is left untouched.
+    Returns the digests, the archive size and the ZipInfo of every entry."""
+    # Hidden, so the default excludes keep it out of source hashes and watchers
+    temp_name = os.path.join(os.path.dirname(zip_name), f".{os.path.basename(zip_name)}.tmp")
+    with open(temp_name, "wb") as f:
+        output = HashingWriter(f)
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESS_LEVEL) as zip_ref:
+            for file_path, rel_path in iter_addon_files(addon_dir, excludes):
+                with open(file_path, "rb") as source, zip_ref.open(make_zip_info(f"{addon_id}/{rel_path}"), 'w') as target:
+                    shutil.copyfileobj(source, target, 65536)
+            entries = zip_ref.infolist()
+    digests = output.digests()
+    if checksums_match(zip_name, digests):
+        os.remove(temp_name)
+        print(f"{zip_name} is up to date")
+    else:
+        os.replace(temp_name, zip_name)
+        print(f"{zip_name} generated successfully")
+        for checksum_type, digest in digests.items():
+            write_if_changed(f"{zip_name}.{checksum_type}", digest)
+    return digests, output.size, entries
+
+def format_size(size):
+    return f"{size / 1024:.1f} KB"
+
+def size_report(addon_id, archive_size, entries, largest=3):
+    """Lines describing an archive: totals, stored entries and the largest entries"""
+    source_size = sum(e.file_size for e in entries)
+    stored = [e for e in entries if e.compress_type == zipfile.ZIP_STORED]
+    ratio = archive_size * 100 / source_size if source_size else 100
+    lines = [f"{addon_id}: {len(entries)} files, {format_size(source_size)} -> {format_size(archive_size)} "
+             f"({ratio:.0f}%), {len(stored)} stored"]
+    for e in sorted(entries, key=lambda e: e.compress_size, reverse=True)[:largest]:
+        lines.append(f"    {format_size(e.compress_size):>10}  {e.filename}")
+    return lines
+
+def build_addon(addon_dir, addon_id, addon_version, previous, force=False, excludes=DEFAULT_EXCLUDES):
+    """Package one addon unless its sources are unchanged since the last build.
+    previous is the addon's manifest entry from the last build. Runs in a worker process,
+    so it returns (manifest entry, rebuilt, size report lines) instead of touching the manifest."""
+    # ZIP files live in the addon's directory, the layout Kodi's datadir expects
+    zip_name = os.path.join(addon_dir, f"{addon_id}-{addon_version}.zip")
+    source_hash = hash_addon_tree(addon_dir, excludes)
     
-    with open(f"{file_path}.md5", "w") as f:
-        f.write(md5_hash.hexdigest())
+    if (not force and previous.get("source_hash") == source_hash and previous.get("zip") == zip_name
+            and os.path.exists(zip_name) and all(os.path.exists(f"{zip_name}.{t}") for t in CHECKSUM_TYPES)):
+        print(f"{addon_id} {addon_version} is up to date")
+        return previous, False, []
     
-    print(f"{file_path}.md5 generated successfully")
+    print(f"Creating ZIP file for {addon_id} version {addon_version}")
+    digests, archive_size, entries = create_zipfile(addon_dir, addon_id, zip_name, excludes)
+    return {
+        "id": addon_id,
+        "version": addon_version,
+        "source_hash": source_hash,
+        "zip": zip_name,
+        "zip_md5": digests["md5"],
+        "zip_sha256": digests["sha256"],
+        "built_at": datetime.now().isoformat(timespec='seconds'),
+    }, True, size_report(addon_id, archive_size, entries)
 
-def create_zipfile(addon_dir):
-    """Create ZIP file for the addon"""
-    addon_xml_root = read_addon_xml(addon_dir)
-    if addon_xml_root is None:
-        print(f"Skipping {addon_dir}: No valid addon.xml found")
-        return
+class PollingWatcher(object):
+    """Detects changed addons by comparing file sizes and modification times"""
+    name = "polling"
     
-    addon_id = addon_xml_root.get("id")
-    addon_version = addon_xml_root.get("version")
-    zipfile_name = f"{addon_id}-{addon_version}.zip"
+    def __init__(self, addon_dirs, excludes):
+        self.addon_dirs = addon_dirs
+        self.excludes = excludes
+        self.state = dict((d, self._scan(d)) for d in addon_dirs)
     
-    print(f"Creating ZIP file for {addon_id} version {addon_version}")
+    def _scan(self, addon_dir):
+        state = {}
+        for file_path, rel_path in iter_addon_files(addon_dir, self.excludes):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            state[rel_path] = (stat.st_mtime_ns, stat.st_size)
+        return state
     
-    # Create a temporary directory to store files
-    temp_dir = f"{addon_id}_temp"
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-    os.makedirs(temp_dir)
-    
-    # Copy addon files to temp directory
-    shutil.copytree(addon_dir, os.path.join(temp_dir, addon_id))
-    
-    # Remove any .pyc files
-    cleanup_pyc_files(os.path.join(temp_dir, addon_id))
-    
-    # Create ZIP file with addon folder structure (like v72)
-    with zipfile.ZipFile(zipfile_name, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-        source_dir = os.path.join(temp_dir, addon_id)
-        # Write all files from the addon directory with addon_id prefix
-        for root, dirs, files in os.walk(source_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                # Get path relative to the source directory
-                rel_path = os.path.relpath(file_path, source_dir)
-                # Add to zip with addon_id prefix (like v72 structure)
-                zip_path = os.path.join(addon_id, rel_path)
-                # Convert to forward slashes for consistency
-                zip_path = zip_path.replace('\\', '/')
-                zip_ref.write(file_path, zip_path)
-    
-    # Clean up temporary directory
-    shutil.rmtree(temp_dir)
-    print(f"ZIP file created: {zipfile_name}")
+    def wait(self, timeout=None):
+        """Sleep up to timeout (or one poll interval) and return the set of changed addon directories"""
+        time.sleep(WATCH_POLL_INTERVAL if timeout is None else min(timeout, WATCH_POLL_INTERVAL))
+        changed = set()
+        for addon_dir in self.addon_dirs:
+            state = self._scan(addon_dir)
+            if state != self.state[addon_dir]:
+                self.state[addon_dir] = state
+                changed.add(addon_dir)
+        return changed
+    
+    def close(self):
+        pass
 
-def main():
-    """Main function"""
-    print("Starting repository update process...")
+class InotifyWatcher(object):
+    """Recursive inotify watches over the addon directories (Linux only)"""
+    name = "inotify"
     
-    # Generate addons.xml and addons.xml.md5
-    generate_addons_xml()
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
     
-    # Create ZIP files for each addon
-    addon_dirs = [d for d in os.listdir('.') if os.path.isdir(d) and not d.startswith('.')]
+    def __init__(self, addon_dirs, excludes):
+        self.addon_dirs = addon_dirs
+        self.excludes = excludes
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (addon directory, path relative to it)
+        self.watches = {}
+        try:
+            for addon_dir in addon_dirs:
+                self._add_tree(addon_dir, '')
+        except OSError:
+            self.close()
+            raise
+    
+    def _add_tree(self, addon_dir, rel_dir):
+        path = os.path.join(addon_dir, rel_dir) if rel_dir else addon_dir
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watches[wd] = (addon_dir, rel_dir)
+        for entry in sorted(os.scandir(path), key=lambda e: e.name):
+            child = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False) and not is_excluded(child, self.excludes):
+                self._add_tree(addon_dir, child)
+    
+    def wait(self, timeout=None):
+        """Block up to timeout (forever if None) and return the set of changed addon directories"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + name_length].rstrip(b"\0")
+            offset += self.EVENT.size + name_length
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost, so any addon may have changed
+                return set(self.addon_dirs)
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+            addon_dir, rel_dir = self.watches[wd]
+            name = os.fsdecode(name)
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            # Our own ZIP and checksum writes land in the addon directory too
+            if name and is_excluded(rel_path, self.excludes):
+                continue
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                try:
+                    self._add_tree(addon_dir, rel_path)
+                except OSError:
+                    pass
+            changed.add(addon_dir)
+        return changed
+    
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def create_watcher(addon_dirs, excludes):
+    """inotify where available, polling otherwise"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(addon_dirs, excludes)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(addon_dirs, excludes)
+
+def update_repository(args, only=None):
+    """Regenerate addons.xml, its checksums and the ZIP files of changed addons.
+    With only, just those addon directories are considered for repackaging."""
+    manifest = load_manifest()
+    excludes = DEFAULT_EXCLUDES + tuple(args.exclude)
+    
+    # Parse each addon.xml once; addons.xml and the packaging both use it
+    addons = []
+    for addon_dir in get_addon_dirs():
+        if args.index:
+            set_repository_index(addon_dir, args.index)
+        addon_xml_root = read_addon_xml(addon_dir)
+        if addon_xml_root is None:
+            print(f"Skipping {addon_dir}: No valid addon.xml found")
+            continue
+        addons.append((addon_dir, addon_xml_root))
+    
+    # Generate addons.xml, addons.xml.gz and their checksums
+    generate_addons_xml([root for _, root in addons])
+    
+    # Create ZIP files for changed addons, one worker process per addon
+    addon_dirs = [d for d, _ in addons]
+    targets = [(d, root) for d, root in addons if only is None or d in only]
+    target_dirs = [d for d, _ in targets]
+    build_args = (target_dirs,
+                  [root.get("id") for _, root in targets],
+                  [root.get("version") for _, root in targets],
+                  [manifest["addons"].get(d, {}) for d in target_dirs],
+                  [args.force and only is None] * len(targets),
+                  [excludes] * len(targets))
+    if args.jobs > 1 and len(targets) > 1:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(targets))) as pool:
+            results = dict(zip(target_dirs, pool.map(build_addon, *build_args)))
+    else:
+        results = dict(zip(target_dirs, map(build_addon, *build_args)))
+    
+    # Record the new builds and forget addons that no longer exist
     for addon_dir in addon_dirs:
-        if os.path.exists(os.path.join(addon_dir, "addon.xml")):
-            create_zipfile(addon_dir)
-            # Generate MD5 for the ZIP file
-            addon_xml_root = read_addon_xml(addon_dir)
-            if addon_xml_root is not None:
-                addon_id = addon_xml_root.get("id")
-                addon_version = addon_xml_root.get("version")
-                zip_name = f"{addon_id}-{addon_version}.zip"
-                if os.path.exists(zip_name):
-                    generate_md5_file(zip_name)
-    
-    print("Repository update completed successfully!")
+        if addon_dir not in results:
+            results[addon_dir] = (manifest["addons"].get(addon_dir), False, [])
+    manifest["addons"] = dict((d, results[d][0]) for d in addon_dirs if results[d][0])
+    rebuilt = [d for d in addon_dirs if results[d][1]]
+    save_manifest(manifest)
+    
+    reports = [line for d in addon_dirs for line in results[d][2]]
+    if reports:
+        print("Archive sizes:")
+        for line in reports:
+            print(f"  {line}")
+    
+    print(f"Repository update completed successfully! Rebuilt {len(rebuilt)} of {len(addon_dirs)} addons.")
+
+def watch(args):
+    """Rebuild addons as their files change until interrupted"""
+    excludes = DEFAULT_EXCLUDES + tuple(args.exclude)
+    watcher = create_watcher(get_addon_dirs(), excludes)
+    print(f"Watching {', '.join(watcher.addon_dirs)} for changes ({watcher.name}), press Ctrl+C to stop")
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed:
+                continue
+            # Collect the rest of the burst before building
+            while True:
+                more = watcher.wait(WATCH_DEBOUNCE)
+                if not more:
+                    break
+                changed |= more
+            print(f"Changes detected in {', '.join(sorted(changed))}")
+            update_repository(args, only=changed)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Update addons.xml, checksums and addon ZIP files")
+    parser.add_argument("--force", action="store_true", help="rebuild every addon, even if unchanged")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of addons packaged in parallel")
+    parser.add_argument("--index", choices=sorted(INDEX_MODES),
+                        help="switch repository addons to the plain or gzip-compressed addons.xml")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="also leave files or directories matching GLOB out of addon archives")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and rebuild an addon whenever its files change")
+    args = parser.parse_args()
+    
+    print("Starting repository update process...")
+    update_repository(args)
+    if args.watch:
+        watch(args)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()